@@ -0,0 +1,101 @@
+# Imported by main.py once stdout is set up. Kept out of main.py so that
+# compute pool worker processes, which import main.py, do not build the app
+import os
+from routers import config, agent, workspace, image_tools, canvas, ssl_test, chat_router, settings, search, database, generation, diagnostics
+import routers.websocket_router
+from fastapi.responses import FileResponse
+from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager
+from starlette.types import Scope
+from starlette.responses import Response
+import socketio
+from services.websocket_state import sio
+from services.db_service import db_service
+from services.message_buffer import message_write_buffer
+from services.canvas_compactor import canvas_compactor
+from services.db_maintenance import db_maintenance
+from services.canvas_deleter import canvas_deleter
+from services.media_gc import media_gc
+from utils.http_client import HttpClient
+from services.compute_pool import compute_pool
+from services.generation_queue import generation_queue
+from services.loop_monitor import loop_monitor
+from services.reference_cache import reference_cache
+
+root_dir = os.path.dirname(__file__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # onstartup
+    loop_monitor.start()
+    await db_service.start()
+    await agent.initialize()
+    canvas_compactor.start()
+    db_maintenance.start()
+    canvas_deleter.start()
+    await canvas_deleter.recover()
+    # Job runners are registered when the tools modules are imported
+    await generation_queue.start()
+    await reference_cache.prune()
+    yield
+    # onshutdown
+    await generation_queue.stop()
+    await media_gc.stop()
+    await canvas_deleter.stop()
+    await db_maintenance.stop()
+    await canvas_compactor.stop()
+    await message_write_buffer.close()
+    await db_service.close()
+    await HttpClient.close_all()
+    compute_pool.close()
+    await loop_monitor.stop()
+
+app = FastAPI(lifespan=lifespan)
+
+# Include routers
+app.include_router(config.router)
+app.include_router(settings.router)
+app.include_router(agent.router)
+app.include_router(canvas.router)
+app.include_router(workspace.router)
+app.include_router(image_tools.router)
+app.include_router(ssl_test.router)
+app.include_router(chat_router.router)
+app.include_router(search.router)
+app.include_router(database.router)
+app.include_router(generation.router)
+app.include_router(diagnostics.router)
+
+# Mount the React build directory
+react_build_dir = os.environ.get('UI_DIST_DIR', os.path.join(
+    os.path.dirname(root_dir), "react", "dist"))
+
+
+# 无缓存静态文件类
+class NoCacheStaticFiles(StaticFiles):
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        response = await super().get_response(path, scope)
+        if response.status_code == 200:
+            response.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0"
+            response.headers["Pragma"] = "no-cache"
+            response.headers["Expires"] = "0"
+        return response
+
+
+static_site = os.path.join(react_build_dir, "assets")
+if os.path.exists(static_site):
+    app.mount("/assets", NoCacheStaticFiles(directory=static_site), name="assets")
+
+
+@app.get("/")
+async def serve_react_app():
+    response = FileResponse(os.path.join(react_build_dir, "index.html"))
+    response.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0"
+    response.headers["Pragma"] = "no-cache"
+    response.headers["Expires"] = "0"
+    return response
+
+
+socket_app = socketio.ASGIApp(sio, other_asgi_app=app, socketio_path='/socket.io')
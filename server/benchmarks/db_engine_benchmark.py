@@ -0,0 +1,92 @@
+"""
+Micro-benchmark: pooled DatabaseEngine vs. connect-per-call aiosqlite.
+
+Runs against a throwaway database with the real migrations applied and reports
+ops/sec for message inserts (sequential and concurrent) and history reads.
+
+Usage (from the server directory):
+    python -m benchmarks.db_engine_benchmark [--ops 2000] [--concurrency 16]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aiosqlite  # noqa: E402
+from services.db_engine import DatabaseEngine  # noqa: E402
+from services.migrations.manager import MigrationManager, CURRENT_VERSION  # noqa: E402
+
+INSERT_SQL = "INSERT INTO chat_messages (session_id, role, message) VALUES (?, ?, ?)"
+HISTORY_SQL = "SELECT role, message, id FROM chat_messages WHERE session_id = ? ORDER BY id ASC LIMIT 50"
+MESSAGE = json.dumps({'role': 'assistant', 'content': 'x' * 512})
+
+
+def create_db(path: str):
+    with sqlite3.connect(path) as conn:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS db_version (version INTEGER PRIMARY KEY)")
+        conn.execute("INSERT INTO db_version (version) VALUES (0)")
+        MigrationManager().migrate(conn, 0, CURRENT_VERSION)
+
+
+async def legacy_insert(path: str, i: int):
+    async with aiosqlite.connect(path) as db:
+        await db.execute(INSERT_SQL, (f's{i % 8}', 'assistant', MESSAGE))
+        await db.commit()
+
+
+async def legacy_read(path: str, i: int):
+    async with aiosqlite.connect(path) as db:
+        cursor = await db.execute(HISTORY_SQL, (f's{i % 8}',))
+        await cursor.fetchall()
+
+
+async def timed(label: str, ops: int, concurrency: int, fn):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(i):
+        async with semaphore:
+            await fn(i)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[run(i) for i in range(ops)])
+    elapsed = time.perf_counter() - start
+    print(f'{label:<40} {ops / elapsed:>10.0f} ops/sec')
+
+
+async def main(ops: int, concurrency: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_path = os.path.join(tmp, 'legacy.db')
+        pooled_path = os.path.join(tmp, 'pooled.db')
+        create_db(legacy_path)
+        create_db(pooled_path)
+
+        engine = DatabaseEngine(pooled_path)
+        await engine.start()
+        try:
+            for c in (1, concurrency):
+                await timed(f'insert connect-per-call (c={c})', ops, c,
+                            lambda i: legacy_insert(legacy_path, i))
+                await timed(f'insert pooled engine (c={c})', ops, c,
+                            lambda i: engine.execute(INSERT_SQL, (f's{i % 8}', 'assistant', MESSAGE)))
+            for c in (1, concurrency):
+                await timed(f'read connect-per-call (c={c})', ops, c,
+                            lambda i: legacy_read(legacy_path, i))
+                await timed(f'read pooled engine (c={c})', ops, c,
+                            lambda i: engine.fetchall(HISTORY_SQL, (f's{i % 8}',)))
+        finally:
+            await engine.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ops', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    args = parser.parse_args()
+    asyncio.run(main(args.ops, args.concurrency))
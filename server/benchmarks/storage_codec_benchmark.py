@@ -0,0 +1,98 @@
+"""
+Micro-benchmark: storage codecs for canvas and message payloads.
+
+Generates synthetic excalidraw documents, single-element op payloads and
+chat messages, then reports the stored size and encode/decode latency of
+each codec (plain TEXT, zlib, zlib with the built-in dictionary, and zstd
+with and without it when zstandard is installed).
+
+Usage (from the server directory):
+    python -m benchmarks.storage_codec_benchmark [--elements 500] [--rounds 200]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.storage_codec import (  # noqa: E402
+    BUILTIN_DICTIONARY, BUILTIN_DICTIONARY_ID, CODEC_RAW, MIN_COMPRESS_SIZE, StorageCodec, zstandard)
+
+
+def make_element(i: int) -> dict:
+    kind = random.choice(['rectangle', 'ellipse', 'arrow', 'text', 'image'])
+    element = {
+        'id': f'{random.getrandbits(64):016x}', 'type': kind,
+        'x': round(random.uniform(-2000, 2000), 2), 'y': round(random.uniform(-2000, 2000), 2),
+        'width': random.randint(20, 1024), 'height': random.randint(20, 1024), 'angle': 0,
+        'strokeColor': '#1e1e1e', 'backgroundColor': 'transparent', 'fillStyle': 'solid',
+        'strokeWidth': 2, 'strokeStyle': 'solid', 'roughness': 1, 'opacity': 100, 'groupIds': [],
+        'frameId': None, 'roundness': {'type': 3}, 'seed': random.getrandbits(31),
+        'version': random.randint(1, 50), 'versionNonce': random.getrandbits(31), 'isDeleted': False,
+        'boundElements': None, 'updated': 1719830400000 + i, 'link': None, 'locked': False,
+    }
+    if kind == 'text':
+        element.update({'text': f'note {i}', 'originalText': f'note {i}', 'fontSize': 20, 'fontFamily': 1,
+                        'textAlign': 'left', 'verticalAlign': 'top', 'containerId': None, 'lineHeight': 1.25})
+    if kind == 'image':
+        element.update({'fileId': f'im_{i}.png', 'status': 'saved', 'scale': [1, 1],
+                        'customData': {'prompt': f'a watercolor painting of a fox, variation {i}'}})
+    return element
+
+
+def make_payloads(elements: int):
+    doc_elements = [make_element(i) for i in range(elements)]
+    files = {f'im_{i}.png': {'mimeType': 'image/png', 'id': f'im_{i}.png', 'dataURL': f'/api/file/im_{i}.png',
+                             'created': 1719830400000 + i}
+             for i, e in enumerate(doc_elements) if e['type'] == 'image'}
+    document = json.dumps({'elements': doc_elements, 'appState': {'viewBackgroundColor': '#ffffff'}, 'files': files})
+    ops = [json.dumps(e) for e in doc_elements]
+    messages = [json.dumps({'role': 'assistant', 'content': f'Here is the image you asked for, number {i}. ' * 8,
+                            'tool_calls': [{'id': f'call_{i}', 'type': 'function', 'function': {
+                                'name': 'generate_image',
+                                'arguments': json.dumps({'prompt': f'a fox in the snow {i}', 'aspect_ratio': '1:1'})}}]})
+                for i in range(elements)]
+    return {'canvas document': [document], 'element op': ops, 'chat message': messages}
+
+
+def codecs():
+    dictionaries = {BUILTIN_DICTIONARY_ID: (CODEC_RAW, BUILTIN_DICTIONARY)}
+    configs = [('text', None, {}), ('zlib', 'zlib', {}), ('zlib + dict', 'zlib', dictionaries)]
+    if zstandard is not None:
+        configs += [('zstd', 'zstd', {}), ('zstd + dict', 'zstd', dictionaries)]
+    for label, codec_name, dicts in configs:
+        codec = StorageCodec()
+        codec.configure(codec_name, dicts)
+        yield label, codec
+
+
+def run(payloads, rounds: int):
+    print(f'{"payload":<16} {"codec":<12} {"bytes":>12} {"ratio":>7} {"encode us":>10} {"decode us":>10}')
+    for kind, values in payloads.items():
+        raw_size = sum(len(v.encode('utf-8')) for v in values)
+        n = max(1, rounds // len(values))
+        for label, codec in codecs():
+            start = time.perf_counter()
+            for _ in range(n):
+                stored = [codec.encode(v) for v in values]
+            encode_us = (time.perf_counter() - start) / (n * len(values)) * 1e6
+            start = time.perf_counter()
+            for _ in range(n):
+                for s in stored:
+                    codec.decode(s)
+            decode_us = (time.perf_counter() - start) / (n * len(values)) * 1e6
+            size = sum(len(s) if isinstance(s, bytes) else len(s.encode('utf-8')) for s in stored)
+            print(f'{kind:<16} {label:<12} {size:>12} {raw_size / size:>6.2f}x {encode_us:>10.1f} {decode_us:>10.1f}')
+    print(f'(payloads under {MIN_COMPRESS_SIZE} bytes are always stored as text)')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--elements', type=int, default=500)
+    parser.add_argument('--rounds', type=int, default=200)
+    args = parser.parse_args()
+    random.seed(0)
+    run(make_payloads(args.elements), args.rounds)
@@ -1,77 +1,20 @@
+import multiprocessing
 import os
 import sys
 import io
-# Ensure stdout and stderr use utf-8 encoding to prevent emoji logs from crashing python server
-sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding="utf-8")
-sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding="utf-8")
-
-from routers import config, agent, workspace, image_tools, canvas, ssl_test, chat_router, settings
-import routers.websocket_router
-from fastapi.responses import FileResponse
-from fastapi.staticfiles import StaticFiles
-from fastapi import FastAPI
-import asyncio
 import argparse
-from contextlib import asynccontextmanager
-from starlette.types import Scope
-from starlette.responses import Response
-import socketio
-from services.websocket_state import sio
-
-root_dir = os.path.dirname(__file__)
-
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    # onstartup
-    await agent.initialize()
-    yield
-    # onshutdown
-
-app = FastAPI(lifespan=lifespan)
-
-# Include routers
-app.include_router(config.router)
-app.include_router(settings.router)
-app.include_router(agent.router)
-app.include_router(canvas.router)
-app.include_router(workspace.router)
-app.include_router(image_tools.router)
-app.include_router(ssl_test.router)
-app.include_router(chat_router.router)
-
-# Mount the React build directory
-react_build_dir = os.environ.get('UI_DIST_DIR', os.path.join(
-    os.path.dirname(root_dir), "react", "dist"))
-
 
-# 无缓存静态文件类
-class NoCacheStaticFiles(StaticFiles):
-    async def get_response(self, path: str, scope: Scope) -> Response:
-        response = await super().get_response(path, scope)
-        if response.status_code == 200:
-            response.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0"
-            response.headers["Pragma"] = "no-cache"
-            response.headers["Expires"] = "0"
-        return response
-
-
-static_site = os.path.join(react_build_dir, "assets")
-if os.path.exists(static_site):
-    app.mount("/assets", NoCacheStaticFiles(directory=static_site), name="assets")
-
-
-@app.get("/")
-async def serve_react_app():
-    response = FileResponse(os.path.join(react_build_dir, "index.html"))
-    response.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0"
-    response.headers["Pragma"] = "no-cache"
-    response.headers["Expires"] = "0"
-    return response
+if __name__ == "__main__":
+    # Compute pool workers of frozen builds run this executable again;
+    # multiprocessing takes those over here, before the app is imported
+    multiprocessing.freeze_support()
 
+    # Ensure stdout and stderr use utf-8 encoding to prevent emoji logs from crashing python server
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding="utf-8")
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding="utf-8")
 
-socket_app = socketio.ASGIApp(sio, other_asgi_app=app, socketio_path='/socket.io')
+    from app import socket_app
 
-if __name__ == "__main__":
     # bypas localhost request for proxy, fix ollama proxy issue
     _bypass = {"127.0.0.1", "localhost", "::1"}
     current = set(os.environ.get("no_proxy", "").split(",")) | set(
@@ -1,7 +1,11 @@
+import json
 import os
-from fastapi import APIRouter
-import requests
+from typing import Optional
+from fastapi import APIRouter, Query, Response
+from fastapi.responses import StreamingResponse
+import httpx
 from services.config_service import config_service
+from utils.http_client import HttpClient
 from services.db_service import db_service
 
 #services
@@ -10,6 +14,8 @@ from services.websocket_service import broadcast_init_done
 
 router = APIRouter(prefix="/api")
 
+MAX_CHAT_HISTORY_PAGE_SIZE = 1000
+
 # @router.get("/workspace_list")
 # async def workspace_list():
 #     return [{"name": entry.name, "is_dir": entry.is_dir(), "path": str(entry)} for entry in Path(WORKSPACE_ROOT).iterdir()]
@@ -22,15 +28,16 @@ async def initialize():
 async def workspace_download(path: str):
     return download_file(path)
 
-def get_ollama_model_list():
+async def get_ollama_model_list():
     base_url = config_service.get_config().get('ollama', {}).get(
         'url', os.getenv('OLLAMA_HOST', 'http://localhost:11434'))
     try:
-        response = requests.get(f'{base_url}/api/tags', timeout=5)
+        async with HttpClient.create(base_url) as client:
+            response = await client.get(f'{base_url}/api/tags', timeout=5)
         response.raise_for_status()
         data = response.json()
         return [model['name'] for model in data.get('models', [])]
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         print(f"Error querying Ollama: {e}")
         return []
 
@@ -39,7 +46,7 @@ def get_ollama_model_list():
 async def get_models():
     config = config_service.get_config()
     res = []
-    ollama_models = get_ollama_model_list()
+    ollama_models = await get_ollama_model_list()
     ollama_url = config_service.get_config().get('ollama', {}).get(
         'url', os.getenv('OLLAMA_HOST', 'http://localhost:11434'))
     print('👇ollama_models', ollama_models)
@@ -73,5 +80,53 @@ async def list_chat_sessions():
 
 
 @router.get("/chat_session/{session_id}")
-async def get_chat_session(session_id: str):
-    return await db_service.get_chat_history(session_id)
+async def get_chat_session(session_id: str, response: Response,
+                           before: Optional[int] = Query(None, ge=1),
+                           limit: Optional[int] = Query(None, ge=1, le=MAX_CHAT_HISTORY_PAGE_SIZE)):
+    """
+    Chat history of a session, oldest first.
+
+    Pass `limit` (and `before`, a message id) to page backwards through long
+    sessions; the cursor for the next older page is returned in the
+    X-Next-Before header when older messages exist.
+    """
+    if limit is None:
+        return await db_service.get_chat_history(session_id, before)
+    page, next_before = await db_service.get_chat_history_page(session_id, before, limit)
+    if next_before is not None:
+        response.headers['X-Next-Before'] = str(next_before)
+    return [json.loads(message) for _, message in page]
+
+
+@router.get("/chat_session/{session_id}/stream")
+async def stream_chat_session(session_id: str,
+                              before: Optional[int] = Query(None, ge=1),
+                              limit: Optional[int] = Query(None, ge=1, le=MAX_CHAT_HISTORY_PAGE_SIZE)):
+    """
+    Same body as /chat_session/{session_id}, but the stored message JSON is
+    written straight into the response without being parsed and re-dumped.
+    """
+    headers = {}
+    page = None
+    if limit is not None:
+        page, next_before = await db_service.get_chat_history_page(session_id, before, limit)
+        if next_before is not None:
+            headers['X-Next-Before'] = str(next_before)
+
+    async def messages():
+        if page is not None:
+            for _, message in page:
+                yield message
+            return
+        async for _, message in db_service.iter_chat_history_json(session_id, before):
+            yield message
+
+    async def body():
+        yield '['
+        first = True
+        async for message in messages():
+            yield message if first else ',' + message
+            first = False
+        yield ']'
+
+    return StreamingResponse(body(), media_type='application/json', headers=headers)
@@ -1,9 +1,15 @@
-from fastapi import APIRouter, Request
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import FileResponse, JSONResponse, Response
 #from routers.agent import chat
 from services.chat_service import handle_chat
+from services.compute_pool import compute_pool
 from services.db_service import db_service
+from services.canvas_deleter import canvas_deleter
+from services.thumbnail_store import get_thumbnail_path
+from services.utils_service import detect_image_type_from_bytes, if_none_match_matches
+import os
 import asyncio
-import json
+from datetime import datetime, timezone
 
 router = APIRouter(prefix="/api/canvas")
 
@@ -21,14 +27,63 @@ async def create_canvas(request: Request):
     await db_service.create_canvas(id, name)
     return {"id": id }
 
+@router.get("/thumbnail/{thumbnail_hash}")
+async def get_thumbnail(thumbnail_hash: str, request: Request):
+    path = get_thumbnail_path(thumbnail_hash)
+    if path is None or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Thumbnail not found")
+
+    # Thumbnails are content-addressed, so the hash is a strong ETag and the
+    # file never changes
+    headers = {
+        'ETag': f'"{thumbnail_hash}"',
+        'Cache-Control': 'public, max-age=31536000, immutable',
+    }
+    if if_none_match_matches(request.headers.get('if-none-match', ''), headers['ETag']):
+        return Response(status_code=304, headers=headers)
+
+    with open(path, 'rb') as f:
+        media_type = detect_image_type_from_bytes(f.read(16))
+    return FileResponse(path, media_type=media_type, headers=headers)
+
 @router.get("/{id}")
-async def get_canvas(id: str):
-    return await db_service.get_canvas_data(id)
+async def get_canvas(id: str, request: Request):
+    # Answer revalidations from the stored version hash without loading the document
+    etag = await db_service.get_canvas_etag(id)
+    if etag and if_none_match_matches(request.headers.get('if-none-match', ''), etag):
+        return Response(status_code=304, headers={'ETag': etag, 'Cache-Control': 'no-cache'})
+
+    canvas, etag = await db_service.get_canvas_data_with_etag(id)
+    if canvas is None:
+        return None
+    return JSONResponse(canvas, headers={'ETag': etag, 'Cache-Control': 'no-cache'})
+
+@router.get("/{id}/history")
+async def get_canvas_history(id: str, limit: int = Query(100, ge=1, le=1000)):
+    return await db_service.get_canvas_history(id, limit)
+
+@router.get("/{id}/history/{timestamp}")
+async def get_canvas_at(id: str, timestamp: str):
+    """Canvas data as it was at an ISO timestamp, e.g. one returned by /history"""
+    try:
+        at = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid timestamp")
+    if at.tzinfo is not None:
+        at = at.astimezone(timezone.utc)
+    # Same format as the stored created_at values, so they compare as text
+    data = await db_service.get_canvas_at(id, at.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z')
+    if data is None:
+        raise HTTPException(status_code=404, detail="Canvas not found")
+    return {'data': data, 'timestamp': timestamp}
 
 @router.post("/{id}/save")
 async def save_canvas(id: str, request: Request):
-    payload = await request.json()
-    data_str = json.dumps(payload['data'])
+    # Multi-megabyte canvases are parsed and serialized off the event loop
+    body = await request.body()
+    payload = await compute_pool.json_loads(body)
+    data_str = await compute_pool.json_dumps(payload['data'], len(body))
+    # No-op saves (same content hash) return without touching the database
     await db_service.save_canvas_data(id, data_str, payload['thumbnail'])
     return {"id": id }
 
@@ -41,5 +96,25 @@ async def rename_canvas(id: str, request: Request):
 
 @router.delete("/{id}/delete")
 async def delete_canvas(id: str):
-    await db_service.delete_canvas(id)
-    return {"id": id }
\ No newline at end of file
+    await canvas_deleter.delete([id])
+    return {"id": id }
+
+@router.post("/delete")
+async def delete_canvases(request: Request):
+    """
+    Delete several canvases. They are removed from the list right away; their
+    chat sessions, messages and files are deleted in the background.
+    """
+    data = await request.json()
+    canvas_ids = data.get('canvas_ids')
+    if not isinstance(canvas_ids, list) or not all(isinstance(i, str) for i in canvas_ids):
+        raise HTTPException(status_code=400, detail="canvas_ids must be a list of canvas ids")
+    job = await canvas_deleter.delete(canvas_ids)
+    return job.to_dict()
+
+@router.get("/delete/{job_id}")
+async def get_delete_job(job_id: str):
+    job = canvas_deleter.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Delete job not found")
+    return job.to_dict()
\ No newline at end of file
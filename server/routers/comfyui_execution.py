@@ -15,6 +15,7 @@ from rich import print as pprint
 from rich.progress import BarColumn, Column, Progress, Table, TimeElapsedColumn
 
 from services.websocket_service import send_to_websocket
+from services.generation_queue import generation_queue
 
 async def check_comfy_server_running(port, host):
     async with httpx.AsyncClient(timeout=10) as client:
@@ -215,6 +216,8 @@ class WorkflowExecution:
 
     async def on_progress(self, data):
         node = data["node"]
+        if self.ctx.get('job_id'):
+            generation_queue.set_progress(self.ctx['job_id'], data["value"] / data["max"])
         if self.ctx.get('session_id'):
             await send_to_websocket(self.ctx.get('session_id'), {
                     'type': 'tool_call_progress',
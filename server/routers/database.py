@@ -0,0 +1,42 @@
+from fastapi import APIRouter, HTTPException, Request
+from services.db_maintenance import db_maintenance
+from services.db_service import db_service
+from services.media_gc import media_gc
+
+router = APIRouter(prefix="/api/database")
+
+
+@router.get("/maintenance")
+async def get_maintenance_status():
+    """Database size, free pages and the timing and result of each maintenance task"""
+    return await db_maintenance.get_status()
+
+
+@router.get("/canvas_cache")
+async def get_canvas_cache_stats():
+    """Hit/miss counters and size of the in-memory canvas document cache"""
+    return db_service.get_canvas_cache_stats()
+
+
+@router.post("/media_gc")
+async def start_media_gc(request: Request):
+    """
+    Start collecting files in FILES_DIR that no canvas or chat message uses.
+    Body: {"dry_run": true, "grace_hours": 24}. Poll GET /media_gc for the report.
+    """
+    data = await request.json()
+    dry_run = data.get('dry_run', True)
+    grace_hours = data.get('grace_hours')
+    if not isinstance(dry_run, bool):
+        raise HTTPException(status_code=400, detail="dry_run must be a boolean")
+    if grace_hours is not None and (not isinstance(grace_hours, (int, float)) or grace_hours < 0):
+        raise HTTPException(status_code=400, detail="grace_hours must be a non-negative number")
+    if not media_gc.start(dry_run, grace_hours):
+        raise HTTPException(status_code=409, detail="A media collection is already running")
+    return media_gc.get_status()
+
+
+@router.get("/media_gc")
+async def get_media_gc_status():
+    """Whether a media collection is running and the report of the last one"""
+    return media_gc.get_status()
@@ -0,0 +1,17 @@
+from fastapi import APIRouter
+from services.compute_pool import compute_pool
+from services.loop_monitor import loop_monitor
+
+router = APIRouter(prefix="/api/diagnostics")
+
+
+@router.get("/event_loop")
+async def get_event_loop_stats():
+    """Blocking calls detected on the event loop, with the stack of recent ones"""
+    return loop_monitor.get_stats()
+
+
+@router.get("/compute_pool")
+async def get_compute_pool_stats():
+    """Pool sizes and queue/run time histograms of offloaded media work"""
+    return compute_pool.get_stats()
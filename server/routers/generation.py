@@ -0,0 +1,46 @@
+from fastapi import APIRouter, HTTPException
+from services.generation_cache import generation_cache
+from services.generation_queue import generation_queue
+from services.reference_cache import reference_cache
+
+router = APIRouter(prefix="/api/generation")
+
+
+@router.get("/stats")
+async def get_generation_stats():
+    """Queue depth, running jobs and limits per provider, and recent wait times"""
+    return generation_queue.get_stats()
+
+
+@router.get("/cache")
+async def get_generation_cache_stats():
+    """Whether the result cache is enabled, its size, and hits and misses per provider"""
+    return await generation_cache.get_stats()
+
+
+@router.delete("/cache")
+async def clear_generation_cache():
+    await generation_cache.clear()
+    return await generation_cache.get_stats()
+
+
+@router.get("/references")
+async def get_reference_cache_stats():
+    """Reference image uploads and cached data URLs per provider"""
+    return reference_cache.get_stats()
+
+
+@router.get("/jobs/{job_id}")
+async def get_generation_job(job_id: str):
+    job = generation_queue.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Generation job not found")
+    return job.to_dict()
+
+
+@router.post("/jobs/{job_id}/cancel")
+async def cancel_generation_job(job_id: str):
+    job = await generation_queue.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Generation job not found")
+    return job.to_dict()
@@ -1,21 +1,29 @@
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, Response
 from common import DEFAULT_PORT
 from tools.image_generators import generate_file_id
+from services.compute_pool import compute_pool
 from services.db_service import db_service
+from services.media_store import media_store
+from services.media_refs import get_file_path
+from services.utils_service import if_modified_since_matches, if_none_match_matches
+from services.image_variants import (
+    DEFAULT_QUALITY, FORMATS, MAX_DIMENSION, SOURCE_EXTENSIONS, can_save, image_variant_cache, negotiate_format)
 import traceback
 from services.config_service import USER_DATA_DIR, FILES_DIR
 from services.websocket_service import send_to_websocket, broadcast_session_update
 
-from PIL import Image
-from io import BytesIO
 import os
-from fastapi import APIRouter, HTTPException, Request, UploadFile, File, Form
+from stat import S_ISREG
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Query, Request, UploadFile, File, Form
 import httpx
-import aiofiles
 from mimetypes import guess_type
 from utils.http_client import HttpClient
 
 router = APIRouter(prefix="/api")
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# 缩放失败时以原图代替，不能缓存在缩放图的 URL 下
+FALLBACK_CACHE_CONTROL = 'no-store'
 os.makedirs(FILES_DIR, exist_ok=True)
 
 # 上传图片接口，支持表单提交
@@ -29,19 +37,17 @@ async def upload_image(file: UploadFile = File(...)):
     # Read the file content
     content = await file.read()
 
-    # Open the image from bytes to get its dimensions
-    with Image.open(BytesIO(content)) as img:
-        width, height = img.size
+    # Read the dimensions from the image header
+    _, width, height = await compute_pool.probe(content)
 
     # Determine the file extension
     mime_type, _ = guess_type(filename)
     # default to 'bin' if unknown
     extension = mime_type.split('/')[-1] if mime_type else ''
 
-    # 保存图片到本地
+    # 保存图片到本地（相同内容只存储一份）
     file_path = os.path.join(FILES_DIR, f'{file_id}.{extension}')
-    async with aiofiles.open(file_path, 'wb') as f:
-        await f.write(content)
+    await media_store.store_bytes(content, file_path)
 
     # 返回文件信息
     print('🦄upload_image file_path', file_path)
@@ -54,13 +60,72 @@ async def upload_image(file: UploadFile = File(...)):
 
 
 # 文件下载接口
+# 文件写入后不再修改（文件名是随机 id），可以永久缓存；视频等大文件支持 Range 请求
+# 带 w/h/fmt/q 参数时返回缩放、转码后的图片（结果缓存在磁盘）
 @router.get("/file/{file_id}")
-async def get_file(file_id: str):
-    file_path = os.path.join(FILES_DIR, f'{file_id}')
-    print('🦄get_file file_path', file_path)
-    if not os.path.exists(file_path):
+async def get_file(
+    request: Request,
+    file_id: str,
+    w: Optional[int] = Query(None, ge=1, le=MAX_DIMENSION),
+    h: Optional[int] = Query(None, ge=1, le=MAX_DIMENSION),
+    fmt: Optional[str] = Query(None),
+    q: Optional[int] = Query(None, ge=1, le=100),
+):
+    file_path = get_file_path(file_id)
+    try:
+        stat_result = os.stat(file_path) if file_path else None
+    except FileNotFoundError:
+        stat_result = None
+    if stat_result is None or not S_ISREG(stat_result.st_mode):
         raise HTTPException(status_code=404, detail="File not found")
-    return FileResponse(file_path)
+    if fmt is not None and fmt not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"fmt must be one of {', '.join(FORMATS)}")
+
+    alias = await db_service.get_media_alias(file_id)
+    content_hash = alias['sha256'] if alias else None
+    headers = {'Cache-Control': IMMUTABLE_CACHE_CONTROL}
+    extension = file_id.rsplit('.', 1)[-1].lower()
+    if (w or h or fmt or q) and extension in SOURCE_EXTENSIONS:
+        if fmt is None or not can_save(fmt):
+            # 未指定格式（或服务器不支持）时根据 Accept 选择
+            fmt = negotiate_format(request.headers.get('accept'), extension)
+            headers['Vary'] = 'Accept'
+        try:
+            variant_path, media_type = await image_variant_cache.get_variant(
+                file_path, w, h, fmt, q or DEFAULT_QUALITY, content_hash)
+            # 缓存文件名由源文件内容和参数决定
+            headers['ETag'] = f'"{os.path.splitext(os.path.basename(variant_path))[0]}-{fmt}"'
+            return file_response(request, variant_path, os.stat(variant_path), headers, media_type)
+        except Exception as e:
+            print(f'Error rendering image variant of {file_id}: {e}')
+            headers.pop('Vary', None)
+            headers['Cache-Control'] = FALLBACK_CACHE_CONTROL
+
+    # 媒体库中的文件用内容哈希，其余文件用 inode 信息
+    if content_hash:
+        headers['ETag'] = f'"{content_hash}"'
+    else:
+        headers['ETag'] = f'"{stat_result.st_ino:x}-{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"'
+    return file_response(request, file_path, stat_result, headers)
+
+
+def file_response(request: Request, path: str, stat_result: os.stat_result, headers: dict,
+                  media_type: Optional[str] = None) -> Response:
+    """FileResponse (with Range support), or 304 when the client's copy is current"""
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is not None:
+        not_modified = if_none_match_matches(if_none_match, headers['ETag'])
+    else:
+        not_modified = if_modified_since_matches(request.headers.get('if-modified-since'), stat_result.st_mtime)
+    if not_modified:
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type=media_type, headers=headers, stat_result=stat_result)
+
+
+@router.get("/file_variants/stats")
+async def get_file_variant_stats():
+    """缩放图片磁盘缓存的命中率和大小"""
+    return image_variant_cache.get_stats()
 
 
 @router.post("/comfyui/object_info")
@@ -71,7 +136,7 @@ async def get_object_info(data: dict):
 
     try:
         timeout = httpx.Timeout(10.0)
-        async with HttpClient.create(timeout=timeout) as client:
+        async with HttpClient.create(url, timeout=timeout) as client:
             response = await client.get(f"{url}/api/object_info")
             if response.status_code == 200:
                 return response.json()
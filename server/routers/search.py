@@ -0,0 +1,17 @@
+from typing import Optional
+from fastapi import APIRouter, Query
+from services.db_service import db_service
+
+router = APIRouter(prefix="/api")
+
+
+@router.get("/search")
+async def search(q: str,
+                 kind: Optional[str] = Query(None, pattern='^(message|canvas_name|canvas_text)$'),
+                 limit: int = Query(20, ge=1, le=100),
+                 offset: int = Query(0, ge=0)):
+    """
+    Ranked full-text search over chat messages, canvas names and canvas text.
+    Each result's snippet is HTML escaped text with matches wrapped in <mark>.
+    """
+    return await db_service.search(q, kind, limit, offset)
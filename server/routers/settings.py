@@ -15,6 +15,7 @@ Settings Router - 设置路由模块
 - GET /api/settings/proxy/test - 测试代理连接
 - GET /api/settings/proxy - 获取代理设置
 - POST /api/settings/proxy - 更新代理设置
+- GET /api/settings/proxy/pools - 获取共享 HTTP 连接池统计
 依赖模块：
 - services.settings_service - 设置服务
 """
@@ -27,6 +28,7 @@ from services.db_service import db_service
 from services.settings_service import settings_service
 from services.config_service import USER_DATA_DIR
 from pydantic import BaseModel
+from utils.http_client import HttpClient
 
 # 创建设置相关的路由器，所有端点都以 /api/settings 为前缀
 router = APIRouter(prefix="/api/settings")
@@ -223,6 +225,18 @@ async def update_proxy_settings(request: Request):
     return result
 
 
+@router.get("/proxy/pools")
+async def get_http_pool_stats():
+    """
+    获取共享 HTTP 连接池统计
+
+    Returns:
+        dict: 每个连接池（按目标地址、代理设置区分）的请求数和连接数。
+        修改代理设置后，旧连接池会在进行中的请求完成后关闭。
+    """
+    return HttpClient.get_pool_stats()
+
+
 class CreateWorkflowRequest(BaseModel):
     name: str
     api_json: dict  # or str if you want it as string
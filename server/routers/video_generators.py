@@ -14,11 +14,18 @@ from io import BytesIO
 # services
 from services.config_service import config_service
 from services.config_service import FILES_DIR
+from services.media_store import media_store
+from utils.single_flight import SingleFlight
 
 import asyncio
+
+# Identical video generations running at the same time share one prediction
+_video_generations: SingleFlight = SingleFlight()
+
+
 async def get_video_info_and_save(url, file_path_without_extension):
     # Fetch the video asynchronously
-    async with HttpClient.create() as client:
+    async with HttpClient.create(url) as client:
         response = await client.get(url)
         video_content = response.content
 
@@ -50,6 +57,20 @@ async def get_video_info_and_save(url, file_path_without_extension):
         raise e
 
 async def generate_video_replicate(prompt, model, aspect_ratio):
+    key = (model, ' '.join(prompt.split()), aspect_ratio)
+    (mime_type, width, height, filename), shared = await _video_generations.do(
+        key, lambda: _generate_video_replicate(prompt, model, aspect_ratio))
+    if shared:
+        # Each caller gets its own file for its own canvas element
+        video_filename = f"vi_{generate(size=8)}.{filename.rsplit('.', 1)[-1]}"
+        if not await media_store.alias_file(filename, os.path.join(FILES_DIR, video_filename)):
+            raise FileNotFoundError(f"Generated video {filename} is gone")
+        print(f'🎥 Joined an identical video generation in flight: {filename}')
+        filename = video_filename
+    return mime_type, width, height, filename
+
+
+async def _generate_video_replicate(prompt, model, aspect_ratio):
     try:
         api_key = config_service.app_config.get(
             'replicate', {}).get('api_key', '')
@@ -70,7 +91,7 @@ async def generate_video_replicate(prompt, model, aspect_ratio):
             }
         }
 
-        async with HttpClient.create() as client:
+        async with HttpClient.create(url) as client:
             # Step 1: Initial POST request
             response = await client.post(url, headers=headers, json=data)
             res = response.json()
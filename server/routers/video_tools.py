@@ -75,26 +75,14 @@ async def generate_video_tool(
             'created': int(time.time() * 1000),
         }
 
-        new_video_element = await generate_new_video_element(canvas_id, file_id, {
+        new_video_element = generate_new_video_element(file_id, {
             'width': width,
             'height': height,
+            'prompt': prompt,
         })
 
-        # update the canvas data, add the new video element
-        canvas_data = await db_service.get_canvas_data(canvas_id)
-        if 'data' not in canvas_data:
-            canvas_data['data'] = {}
-        if 'elements' not in canvas_data['data']:
-            canvas_data['data']['elements'] = []
-        if 'files' not in canvas_data['data']:
-            canvas_data['data']['files'] = {}
-
-        canvas_data['data']['elements'].append(new_video_element)
-        canvas_data['data']['files'][file_id] = file_data
-
-        print('🛠️canvas_data', canvas_data)
-
-        await db_service.save_canvas_data(canvas_id, json.dumps(canvas_data['data']))
+        # append the new video element to the canvas, placed next to the last media element
+        new_video_element = await db_service.append_canvas_element(canvas_id, new_video_element, file_data)
 
         await send_to_websocket(session_id, {
             'type': 'video_generated',
@@ -114,33 +102,13 @@ async def generate_video_tool(
         })
         raise HTTPException(status_code=500, detail=str(e))
 
-async def generate_new_video_element(canvas_id: str, fileid: str, video_data: dict):
-    canvas = await db_service.get_canvas_data(canvas_id)
-    canvas_data = canvas.get('data', {})
-    elements = canvas_data.get('elements', [])
-
-    # find the last video element
-    last_x = 0
-    last_y = 0
-    last_width = 0
-    last_height = 0
-    video_elements = [
-        element for element in elements if element.get('type') in ('image','video')]
-    last_video_element = video_elements[-1] if len(
-        video_elements) > 0 else None
-    if last_video_element is not None:
-        last_x = last_video_element.get('x', 0)
-        last_y = last_video_element.get('y', 0)
-        last_width = last_video_element.get('width', 0)
-        last_height = last_video_element.get('height', 0)
-
-    new_x = last_x + last_width + 20
-
+def generate_new_video_element(fileid: str, video_data: dict):
+    # x/y are filled in by db_service.append_canvas_element
     return {
         'type': 'video',
         'id': fileid,
-        'x': new_x,
-        'y': last_y,
+        'x': 0,
+        'y': 0,
         'width': video_data.get('width', 0),
         'height': video_data.get('height', 0),
         'angle': 0,
@@ -167,4 +135,6 @@ async def generate_new_video_element(canvas_id: str, fileid: str, video_data: di
         'status': 'saved',
         'scale': [1, 1],
         'crop': None,
+        # keeps the prompt searchable from the canvas
+        'customData': {'prompt': video_data.get('prompt', '')},
     }
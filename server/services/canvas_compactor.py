@@ -0,0 +1,70 @@
+# services/canvas_compactor.py
+import asyncio
+import traceback
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from services.db_service import db_service
+
+# How often the compactor looks for canvases with a long op log
+COMPACT_INTERVAL_SECONDS = 60
+# Pending ops after which a canvas gets a new snapshot
+COMPACT_MIN_OPS = 100
+# How far back canvas history can be reconstructed
+HISTORY_RETENTION_DAYS = 30
+
+
+class CanvasCompactor:
+    """
+    Background task folding canvas ops into snapshots.
+
+    Reads replay every op written since a canvas's last snapshot, so canvases
+    with more than `min_ops` pending ops get a new snapshot. Snapshots and ops
+    older than the retention window are pruned afterwards.
+    """
+
+    def __init__(self, interval: float = COMPACT_INTERVAL_SECONDS, min_ops: int = COMPACT_MIN_OPS,
+                 retention_days: int = HISTORY_RETENTION_DAYS):
+        self.interval = interval
+        self.min_ops = min_ops
+        self.retention_days = retention_days
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.compact_once()
+            except Exception as e:
+                print(f"Error compacting canvases: {e}")
+                traceback.print_exc()
+
+    async def compact_once(self) -> int:
+        """Compact every canvas over the threshold and prune old history. Returns ops folded"""
+        folded = 0
+        # One write job per canvas, so saves are never queued behind a whole pass
+        for canvas_id in await db_service.list_canvases_to_compact(self.min_ops):
+            folded += await db_service.compact_canvas(canvas_id)
+
+        cutoff = datetime.now(timezone.utc) - timedelta(days=self.retention_days)
+        pruned = await db_service.prune_canvas_history(cutoff.strftime('%Y-%m-%dT%H:%M:%S.000Z'))
+        if folded or pruned:
+            print(f"🗜️ Compacted {folded} canvas ops, pruned {pruned} old ops")
+        return folded
+
+
+canvas_compactor = CanvasCompactor()
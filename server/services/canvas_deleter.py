@@ -0,0 +1,181 @@
+# services/canvas_deleter.py
+import asyncio
+import os
+import time
+import traceback
+from typing import Any, Dict, List, Optional, Set
+
+from nanoid import generate
+
+from services.db_service import db_service
+from services.media_gc import DEFAULT_GRACE_HOURS
+from services.media_refs import get_file_path
+from services.message_buffer import message_write_buffer
+
+# Messages deleted per write job, so other writes are never queued behind a
+# large session
+MESSAGE_DELETE_BATCH_SIZE = 500
+# Finished jobs kept for GET /api/canvas/delete/{job_id}
+MAX_FINISHED_JOBS = 100
+
+
+class CanvasDeleteJob:
+    def __init__(self, canvas_ids: List[str], file_refs: Dict[str, Set[str]]):
+        self.id = 'del_' + generate(size=10)
+        self.canvas_ids = canvas_ids
+        self.file_refs = file_refs
+        self.status = 'queued'
+        self.messages_deleted = 0
+        self.sessions_deleted = 0
+        self.files_deleted = 0
+        self.files_kept = 0
+        self.bytes_freed = 0
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'job_id': self.id,
+            'canvas_ids': self.canvas_ids,
+            'status': self.status,
+            'messages_deleted': self.messages_deleted,
+            'sessions_deleted': self.sessions_deleted,
+            'files_deleted': self.files_deleted,
+            'files_kept': self.files_kept,
+            'bytes_freed': self.bytes_freed,
+            'error': self.error,
+        }
+
+
+class CanvasDeleter:
+    """
+    Background pipeline for deleting canvases.
+
+    delete() removes the canvas rows right away, so the canvases disappear
+    from the list before the request returns. A worker task then deletes
+    their chat messages in batches, their sessions, and the files in
+    FILES_DIR that the canvases or their messages referenced and no
+    remaining canvas or message references.
+
+    Sessions of canvases deleted before a restart (or by older versions,
+    which left them behind) are picked up by recover() at startup; the
+    files their messages referenced are cleaned up the same way, the
+    canvases' own files are left to the orphaned media collection.
+
+    Files written within the media collection's grace period are kept too,
+    as they may belong to a generation or message that is still being saved;
+    the collection removes them later if nothing uses them.
+    """
+
+    def __init__(self, batch_size: int = MESSAGE_DELETE_BATCH_SIZE):
+        self.batch_size = batch_size
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._jobs: Dict[str, CanvasDeleteJob] = {}
+
+    def start(self):
+        if self._worker is None:
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+        self._queue = None
+
+    async def delete(self, canvas_ids: List[str]) -> CanvasDeleteJob:
+        """Delete canvases now and queue the cleanup of everything they own"""
+        file_refs = await db_service.delete_canvases(canvas_ids)
+        return self._enqueue(CanvasDeleteJob(canvas_ids, file_refs))
+
+    async def recover(self) -> Optional[CanvasDeleteJob]:
+        """Queue the cleanup of sessions whose canvas no longer exists"""
+        canvas_ids = await db_service.list_deleted_canvas_ids()
+        if not canvas_ids:
+            return None
+        print(f"🗑️ Cleaning up chat sessions of {len(canvas_ids)} deleted canvases")
+        return self._enqueue(CanvasDeleteJob(canvas_ids, {}))
+
+    def get_job(self, job_id: str) -> Optional[CanvasDeleteJob]:
+        return self._jobs.get(job_id)
+
+    def _enqueue(self, job: CanvasDeleteJob) -> CanvasDeleteJob:
+        self.start()
+        self._jobs[job.id] = job
+        finished = [j for j in self._jobs.values() if j.finished_at is not None]
+        for old in sorted(finished, key=lambda j: j.finished_at)[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            self._jobs.pop(old.id, None)
+        self._queue.put_nowait(job)
+        return job
+
+    async def _run(self):
+        while True:
+            job = await self._queue.get()
+            job.status = 'running'
+            try:
+                await self._run_job(job)
+                job.status = 'done'
+            except Exception as e:
+                print(f"Error deleting canvases {job.canvas_ids}: {e}")
+                traceback.print_exc()
+                job.status = 'failed'
+                job.error = str(e)
+            job.finished_at = time.time()
+
+    async def _run_job(self, job: CanvasDeleteJob):
+        # Files only the canvases' chat messages mention (generations that
+        # were never placed, uploads) are candidates as well
+        candidates: Set[str] = set().union(*job.file_refs.values()) if job.file_refs else set()
+        for canvas_id in job.canvas_ids:
+            while True:
+                deleted, file_refs = await db_service.delete_canvas_messages(canvas_id, self.batch_size)
+                job.messages_deleted += deleted
+                candidates |= file_refs
+                if deleted < self.batch_size:
+                    break
+            job.sessions_deleted += await db_service.delete_canvas_sessions(canvas_id)
+
+        if not candidates:
+            return
+        # Only checked once the canvases' own messages are gone, and once
+        # streamed messages of other sessions are stored
+        await message_write_buffer.flush_all()
+        shared = await db_service.find_referenced_files(candidates)
+        job.files_kept = len(shared)
+        cutoff = time.time() - DEFAULT_GRACE_HOURS * 3600
+        for name in candidates - shared:
+            freed = await asyncio.to_thread(_remove_file, name, cutoff)
+            if freed is None:
+                job.files_kept += 1
+                continue
+            job.bytes_freed += freed
+            job.files_deleted += 1
+
+
+def _remove_file(name: str, cutoff: float) -> Optional[int]:
+    """
+    Remove a file from FILES_DIR unless it was modified after cutoff.
+    Returns the bytes freed, or None if it was kept or there was no such file
+    """
+    path = get_file_path(name)
+    if path is None:
+        return None
+    try:
+        stat = os.stat(path)
+        if stat.st_mtime > cutoff:
+            return None
+        os.remove(path)
+        # Media store blobs are freed by the orphaned media collection
+        return stat.st_size if stat.st_nlink <= 1 else 0
+    except FileNotFoundError:
+        return None
+
+
+canvas_deleter = CanvasDeleter()
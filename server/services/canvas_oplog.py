@@ -0,0 +1,326 @@
+# services/canvas_oplog.py
+"""
+Append-only operation log for canvas documents.
+
+A canvas is stored as a snapshot (canvases.data, covering every op up to
+canvases.snapshot_op_id) plus the canvas_ops written after it:
+
+- upsert:    an excalidraw element, keyed by its id, with its version
+- delete:    an element that disappeared from the document
+- file:      an entry of the excalidraw `files` map (files are write-once)
+- app_state: the document's appState
+- order:     the element ids in z-order, only written when elements were
+             reordered rather than edited, added or removed
+
+Snapshot data and op payloads go through services.storage_codec, so they may
+be stored compressed.
+
+Saves diff the incoming document against the in-memory CanvasHead and only
+append ops for what changed. Readers replay pending ops onto the snapshot.
+The compactor (services/canvas_compactor.py) periodically folds ops into a
+new snapshot, keeping older snapshots in canvas_snapshots so any past version
+can be reconstructed from the snapshot before it plus the ops after it.
+"""
+import hashlib
+import itertools
+import json
+import sqlite3
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from services.storage_codec import storage_codec
+
+OP_UPSERT = 'upsert'
+OP_DELETE = 'delete'
+OP_FILE = 'file'
+OP_APP_STATE = 'app_state'
+OP_ORDER = 'order'
+
+# Media element type -> element types that new media of the type is placed after
+MEDIA_PLACEMENT_TYPES = {'image': ('image',), 'video': ('image', 'video')}
+
+# (op, key, version, payload)
+CanvasOp = Tuple[str, Optional[str], Optional[int], Optional[str]]
+
+SELECT_SNAPSHOT_SQL = "SELECT data, snapshot_op_id FROM canvases WHERE id = ?"
+SELECT_PENDING_OPS_SQL = """
+    SELECT id, op, key, payload
+    FROM canvas_ops
+    WHERE canvas_id = ? AND id > ?
+    ORDER BY id ASC
+"""
+INSERT_OP_SQL = """
+    INSERT INTO canvas_ops (canvas_id, op, key, version, payload, created_at)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+
+def now_timestamp() -> str:
+    """Current time in the STRFTIME('%Y-%m-%dT%H:%M:%fZ') format used by the schema"""
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+
+
+def _hash_app_state(app_state: Any) -> str:
+    return hashlib.blake2b(json.dumps(app_state, sort_keys=True).encode('utf-8'), digest_size=16).hexdigest()
+
+
+def find_last_media_element(data: Dict[str, Any], types: Tuple[str, ...]) -> Dict[str, float]:
+    """Placement of the last element of one of `types`, used to place new media"""
+    for element in reversed(data.get('elements') or []):
+        if element.get('type') in types:
+            return {k: element.get(k) or 0 for k in ('x', 'y', 'width', 'height')}
+    return {'x': 0, 'y': 0, 'width': 0, 'height': 0}
+
+
+def find_media_placements(data: Dict[str, Any]) -> Dict[str, Dict[str, float]]:
+    return {media_type: find_last_media_element(data, types)
+            for media_type, types in MEDIA_PLACEMENT_TYPES.items()}
+
+
+class CanvasHead:
+    """What the latest version of a canvas contains, enough to diff a save against it"""
+
+    def __init__(self, data: Dict[str, Any]):
+        # element id -> version, in z-order
+        self.versions: Dict[str, Optional[int]] = {
+            el['id']: el.get('version') for el in data.get('elements') or [] if 'id' in el}
+        self.file_ids: Set[str] = set((data.get('files') or {}).keys())
+        self.app_state_hash: Optional[str] = (
+            _hash_app_state(data['appState']) if 'appState' in data else None)
+        # media type -> placement of the element new media of the type goes after
+        self.last_media: Dict[str, Dict[str, float]] = find_media_placements(data)
+
+    def diff(self, data: Dict[str, Any]) -> List[CanvasOp]:
+        """Ops turning the head into `data`; the head is advanced to `data`"""
+        ops: List[CanvasOp] = []
+        seen = set()
+        for element in data.get('elements') or []:
+            element_id = element.get('id')
+            if element_id is None:
+                continue
+            seen.add(element_id)
+            version = element.get('version')
+            if element_id not in self.versions or self.versions[element_id] != version:
+                ops.append((OP_UPSERT, element_id, version, json.dumps(element)))
+                self.versions[element_id] = version
+        for element_id in [k for k in self.versions if k not in seen]:
+            ops.append((OP_DELETE, element_id, None, None))
+            del self.versions[element_id]
+
+        # Replaying upserts keeps existing elements in place and appends new
+        # ones, so only a reorder needs the full id list
+        order = [el['id'] for el in data.get('elements') or [] if el.get('id') is not None]
+        if order != list(self.versions):
+            ops.append((OP_ORDER, None, None, json.dumps(order)))
+            self.versions = {element_id: self.versions[element_id] for element_id in order}
+
+        for file_id, file in (data.get('files') or {}).items():
+            if file_id not in self.file_ids:
+                ops.append((OP_FILE, file_id, None, json.dumps(file)))
+                self.file_ids.add(file_id)
+
+        if 'appState' in data:
+            app_state_hash = _hash_app_state(data['appState'])
+            if app_state_hash != self.app_state_hash:
+                ops.append((OP_APP_STATE, None, None, json.dumps(data['appState'])))
+                self.app_state_hash = app_state_hash
+
+        self.last_media = find_media_placements(data)
+        return ops
+
+    def append_media(self, element: Dict[str, Any], file: Dict[str, Any]) -> List[CanvasOp]:
+        """Ops appending a generated media element and its file entry"""
+        self.versions[element['id']] = element.get('version')
+        self.file_ids.add(file['id'])
+        for media_type, types in MEDIA_PLACEMENT_TYPES.items():
+            if element.get('type') in types:
+                self.last_media[media_type] = {k: element.get(k) or 0 for k in ('x', 'y', 'width', 'height')}
+        return [
+            (OP_UPSERT, element['id'], element.get('version'), json.dumps(element)),
+            (OP_FILE, file['id'], None, json.dumps(file)),
+        ]
+
+
+def apply_ops(data: Dict[str, Any], ops: Iterable[Tuple[str, Optional[str], Optional[str]]]) -> Dict[str, Any]:
+    """Replay (op, key, payload) rows onto a document, returning a new document"""
+    elements: List[Optional[Dict[str, Any]]] = list(data.get('elements') or [])
+    positions = {el['id']: i for i, el in enumerate(elements) if 'id' in el}
+    files = dict(data.get('files') or {})
+    app_state = data.get('appState')
+    changed = False
+
+    for op, key, payload in ops:
+        changed = True
+        if op == OP_UPSERT:
+            element = json.loads(payload)
+            if key in positions:
+                elements[positions[key]] = element
+            else:
+                positions[key] = len(elements)
+                elements.append(element)
+        elif op == OP_DELETE:
+            if key in positions:
+                elements[positions.pop(key)] = None
+        elif op == OP_FILE:
+            files[key] = json.loads(payload)
+        elif op == OP_APP_STATE:
+            app_state = json.loads(payload)
+        elif op == OP_ORDER:
+            current = {el['id']: el for el in elements if el is not None and 'id' in el}
+            ordered = iter([current[element_id] for element_id in json.loads(payload) if element_id in current])
+            # Elements without an id are not in the order; they keep their slots
+            rebuilt = []
+            for el in elements:
+                if el is None:
+                    continue
+                if 'id' not in el:
+                    rebuilt.append(el)
+                else:
+                    rebuilt.extend(itertools.islice(ordered, 1))
+            rebuilt.extend(ordered)
+            elements = rebuilt
+            positions = {el['id']: i for i, el in enumerate(elements) if 'id' in el}
+
+    if not changed:
+        return data
+    result = dict(data)
+    result['elements'] = [el for el in elements if el is not None]
+    result['files'] = files
+    if app_state is not None:
+        result['appState'] = app_state
+    return result
+
+
+def _load_data(value) -> Dict[str, Any]:
+    text = storage_codec.decode(value)
+    return json.loads(text) if text else {}
+
+
+def _decode_ops(rows) -> List[Tuple[str, Optional[str], Optional[str]]]:
+    """(op, key, payload) of (id, op, key, stored payload) rows"""
+    return [(r[1], r[2], storage_codec.decode(r[3])) for r in rows]
+
+
+# ========== async helpers, run on DatabaseEngine connections ==========
+
+async def load_canvas(conn, canvas_id: str) -> Optional[Tuple[Dict[str, Any], int]]:
+    """Materialize the latest version of a canvas: (document, last applied op id)"""
+    async with conn.execute(SELECT_SNAPSHOT_SQL, (canvas_id,)) as cursor:
+        row = await cursor.fetchone()
+    if row is None:
+        return None
+    data = _load_data(row[0])
+    last_op_id = row[1] or 0
+    rows = await conn.execute_fetchall(SELECT_PENDING_OPS_SQL, (canvas_id, last_op_id))
+    if rows:
+        data = apply_ops(data, _decode_ops(rows))
+        last_op_id = rows[-1][0]
+    return data, last_op_id
+
+
+async def load_canvas_at(conn, canvas_id: str, timestamp: str) -> Dict[str, Any]:
+    """Reconstruct a canvas as it was at `timestamp`"""
+    async with conn.execute("""
+        SELECT data, last_op_id
+        FROM canvas_snapshots
+        WHERE canvas_id = ? AND created_at <= ?
+        ORDER BY created_at DESC, id DESC
+        LIMIT 1
+    """, (canvas_id, timestamp)) as cursor:
+        row = await cursor.fetchone()
+    data = _load_data(row[0]) if row else {}
+    after_op_id = row[1] if row else 0
+    rows = await conn.execute_fetchall("""
+        SELECT id, op, key, payload
+        FROM canvas_ops
+        WHERE canvas_id = ? AND id > ? AND created_at <= ?
+        ORDER BY id ASC
+    """, (canvas_id, after_op_id, timestamp))
+    return apply_ops(data, _decode_ops(rows))
+
+
+async def list_versions(conn, canvas_id: str, limit: int) -> List[Dict[str, Any]]:
+    """Timestamps of the most recent saves of a canvas, newest first"""
+    rows = await conn.execute_fetchall("""
+        SELECT created_at, COUNT(*) AS ops
+        FROM canvas_ops
+        WHERE canvas_id = ?
+        GROUP BY created_at
+        ORDER BY created_at DESC
+        LIMIT ?
+    """, (canvas_id, limit))
+    return [dict(row) for row in rows]
+
+
+async def write_ops(conn, canvas_id: str, ops: List[CanvasOp], created_at: str):
+    await conn.executemany(INSERT_OP_SQL, [
+        (canvas_id, op, key, version, storage_codec.encode(payload), created_at)
+        for op, key, version, payload in ops])
+
+
+async def list_canvases_to_compact(conn, min_ops: int) -> List[str]:
+    rows = await conn.execute_fetchall("""
+        SELECT id FROM (
+            SELECT c.id,
+                (SELECT COUNT(*) FROM canvas_ops o
+                 WHERE o.canvas_id = c.id AND o.id > c.snapshot_op_id) AS pending
+            FROM canvases c
+        )
+        WHERE pending >= ?
+    """, (min_ops,))
+    return [row[0] for row in rows]
+
+
+async def compact_canvas(conn, canvas_id: str) -> int:
+    """Fold pending ops into a new snapshot. Returns the number of ops folded"""
+    async with conn.execute(SELECT_SNAPSHOT_SQL, (canvas_id,)) as cursor:
+        row = await cursor.fetchone()
+    if row is None:
+        return 0
+    rows = await conn.execute_fetchall(SELECT_PENDING_OPS_SQL, (canvas_id, row[1] or 0))
+    if not rows:
+        return 0
+    data = apply_ops(_load_data(row[0]), _decode_ops(rows))
+    last_op_id = rows[-1][0]
+    data_str = storage_codec.encode(json.dumps(data))
+    await conn.execute("""
+        INSERT INTO canvas_snapshots (canvas_id, data, last_op_id, created_at)
+        SELECT ?, ?, ?, MAX(created_at) FROM canvas_ops WHERE canvas_id = ? AND id <= ?
+    """, (canvas_id, data_str, last_op_id, canvas_id, last_op_id))
+    await conn.execute("UPDATE canvases SET data = ?, snapshot_op_id = ? WHERE id = ?",
+                       (data_str, last_op_id, canvas_id))
+    return len(rows)
+
+
+async def prune_history(conn, cutoff: str) -> int:
+    """
+    Drop history older than `cutoff`, keeping for each canvas the newest
+    snapshot taken before it so the canvas can still be reconstructed at the
+    cutoff. Returns the number of ops removed.
+    """
+    bases = await conn.execute_fetchall("""
+        SELECT canvas_id, MAX(id) AS id, MAX(last_op_id) AS last_op_id
+        FROM canvas_snapshots
+        WHERE created_at <= ?
+        GROUP BY canvas_id
+    """, (cutoff,))
+    removed = 0
+    for canvas_id, snapshot_id, last_op_id in bases:
+        await conn.execute("DELETE FROM canvas_snapshots WHERE canvas_id = ? AND id < ?",
+                           (canvas_id, snapshot_id))
+        async with conn.execute("""
+            DELETE FROM canvas_ops
+            WHERE canvas_id = ? AND id <= ? AND id <= (SELECT snapshot_op_id FROM canvases WHERE id = ?)
+        """, (canvas_id, last_op_id, canvas_id)) as cursor:
+            removed += cursor.rowcount
+    return removed
+
+
+# ========== sync helpers, used by migrations and maintenance commands ==========
+
+def load_canvas_sync(conn: sqlite3.Connection, canvas_id: str) -> Dict[str, Any]:
+    row = conn.execute(SELECT_SNAPSHOT_SQL, (canvas_id,)).fetchone()
+    if row is None:
+        return {}
+    rows = conn.execute(SELECT_PENDING_OPS_SQL, (canvas_id, row[1] or 0)).fetchall()
+    return apply_ops(_load_data(row[0]), _decode_ops(rows))
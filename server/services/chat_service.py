@@ -10,6 +10,7 @@ from services.langgraph_service import langgraph_agent, langgraph_multi_agent
 from services.config_service import config_service
 from services.websocket_service import send_to_websocket
 from services.stream_service import add_stream_task, remove_stream_task
+from services.message_buffer import message_write_buffer
 
 async def handle_chat(data):
     """
@@ -21,6 +22,7 @@ async def handle_chat(data):
     - Save chat session and messages to the database.
     - Launch langgraph_agent task to process chat.
     - Manage stream task lifecycle (add, remove).
+    - Flush buffered streamed messages on completion or cancellation.
     - Notify frontend via WebSocket when stream is done.
 
     Args:
@@ -63,6 +65,8 @@ async def handle_chat(data):
     finally:
         # Always remove the task from stream_tasks after completion/cancellation
         remove_stream_task(session_id)
+        # Persist any streamed messages still buffered for this session
+        await message_write_buffer.flush(session_id)
         # Notify frontend WebSocket that chat processing is done
         await send_to_websocket(session_id, {
             'type': 'done'
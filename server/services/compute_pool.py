@@ -0,0 +1,204 @@
+# services/compute_pool.py
+"""
+Shared pools for CPU-heavy media work that must not run on the event loop.
+
+Base64 coding, image header probing and JSON coding of large canvases run
+in a thread pool; image resizing and re-encoding run in a process pool. The
+process pool spawns its workers, which import only the function they run, so
+those functions live in services/media_workers. A pool whose worker died is
+replaced on the next task. The
+typed helpers run small payloads (under OFFLOAD_MIN_BYTES) inline, where
+handing them to a worker would cost more than the work itself.
+
+Pool sizes come from the `compute_pool` setting when the pools are first
+used (0 picks a size from the CPU count). Time spent waiting for a worker
+and running on it is recorded per task kind as histograms, served at
+GET /api/diagnostics/compute_pool.
+"""
+import asyncio
+import base64
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from typing import Any, Callable, Dict, Optional, Tuple, TypeVar
+
+from PIL import Image
+
+from services import settings_service as settings_module
+from services.media_workers import timed
+
+# Payloads smaller than this are handled on the event loop
+OFFLOAD_MIN_BYTES = 256 * 1024
+# Upper bounds of the histogram buckets, in milliseconds
+HISTOGRAM_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+T = TypeVar('T')
+
+
+def default_threads() -> int:
+    return min(8, (os.cpu_count() or 2) + 2)
+
+
+def default_processes() -> int:
+    return max(1, min(4, (os.cpu_count() or 2) - 1))
+
+
+def probe_image(head: bytes, path: Optional[str] = None) -> Tuple[Optional[str], int, int]:
+    """
+    Read (format, width, height) from the image header without decoding the
+    pixels. Falls back to the file when the header does not fit in `head`,
+    e.g. JPEGs with large embedded metadata.
+    """
+    try:
+        with Image.open(BytesIO(head)) as image:
+            return image.format, *image.size
+    except Exception:
+        if path is None:
+            raise
+    with Image.open(path) as image:
+        return image.format, *image.size
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(HISTOGRAM_BUCKETS_MS) + 1)
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms: float):
+        for i, bound in enumerate(HISTOGRAM_BUCKETS_MS):
+            if ms <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def to_dict(self) -> Dict[str, Any]:
+        count = sum(self.counts)
+        buckets = {f"le_{bound}": n for bound, n in zip(HISTOGRAM_BUCKETS_MS, self.counts)}
+        buckets['inf'] = self.counts[-1]
+        return {
+            'count': count,
+            'avg_ms': round(self.total_ms / count, 3) if count else None,
+            'max_ms': round(self.max_ms, 3),
+            'buckets': buckets,
+        }
+
+
+class ComputePool:
+    def __init__(self):
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self._processes: Optional[ProcessPoolExecutor] = None
+        # kind -> (queue time, run time)
+        self._histograms: Dict[str, Tuple[Histogram, Histogram]] = {}
+        self._inline: Dict[str, int] = {}
+
+    def _config(self) -> Dict[str, int]:
+        return settings_module.app_settings.get('compute_pool') or {}
+
+    def _thread_pool(self) -> ThreadPoolExecutor:
+        if self._threads is None:
+            workers = self._config().get('threads') or default_threads()
+            self._threads = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='compute')
+        return self._threads
+
+    def _process_pool(self) -> ProcessPoolExecutor:
+        if self._processes is None:
+            workers = self._config().get('processes') or default_processes()
+            # Spawn everywhere: forking the server would copy its threads and
+            # open sockets into the workers
+            self._processes = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        return self._processes
+
+    async def run_thread(self, kind: str, fn: Callable[..., T], *args) -> T:
+        """Run fn(*args) in the thread pool"""
+        return await self._run(self._thread_pool(), kind, fn, args)
+
+    async def run_process(self, kind: str, fn: Callable[..., T], *args) -> T:
+        """Run fn(*args) in the process pool. fn and args must be picklable"""
+        executor = self._process_pool()
+        try:
+            return await self._run(executor, kind, fn, args)
+        except BrokenProcessPool:
+            # A worker died (killed, out of memory) and took the pool with it
+            print("⚠️ Compute pool worker process died, restarting the process pool")
+            if self._processes is executor:
+                executor.shutdown(wait=False, cancel_futures=True)
+                self._processes = None
+            return await self._run(self._process_pool(), kind, fn, args)
+
+    async def _run(self, executor: Executor, kind: str, fn: Callable[..., T], args: Tuple) -> T:
+        submitted = time.time()
+        loop = asyncio.get_running_loop()
+        started, finished, result = await loop.run_in_executor(executor, timed, fn, args)
+        queue_time, run_time = self._histograms.setdefault(kind, (Histogram(), Histogram()))
+        queue_time.observe(max(0.0, started - submitted) * 1000)
+        run_time.observe((finished - started) * 1000)
+        return result
+
+    def _run_inline(self, kind: str, size: int) -> bool:
+        if size >= OFFLOAD_MIN_BYTES:
+            return False
+        self._inline[kind] = self._inline.get(kind, 0) + 1
+        return True
+
+    async def b64decode(self, data: str) -> bytes:
+        if self._run_inline('decode', len(data)):
+            return base64.b64decode(data)
+        return await self.run_thread('decode', base64.b64decode, data)
+
+    async def b64encode(self, data: bytes) -> str:
+        if self._run_inline('encode', len(data)):
+            return base64.b64encode(data).decode('utf-8')
+        return (await self.run_thread('encode', base64.b64encode, data)).decode('utf-8')
+
+    async def probe(self, head: bytes, path: Optional[str] = None) -> Tuple[Optional[str], int, int]:
+        """(format, width, height) of an image, see probe_image"""
+        if path is None and self._run_inline('probe', len(head)):
+            return probe_image(head)
+        return await self.run_thread('probe', probe_image, head, path)
+
+    async def resize(self, fn: Callable[..., T], *args) -> T:
+        """Run an image resize/re-encode function in the process pool"""
+        return await self.run_process('resize', fn, *args)
+
+    async def json_dumps(self, value: Any, size_hint: Optional[int] = None) -> str:
+        """json.dumps, offloaded unless size_hint says the result is small"""
+        if size_hint is not None and self._run_inline('serialize', size_hint):
+            return json.dumps(value)
+        return await self.run_thread('serialize', json.dumps, value)
+
+    async def json_loads(self, text: Any) -> Any:
+        if self._run_inline('deserialize', len(text)):
+            return json.loads(text)
+        return await self.run_thread('deserialize', json.loads, text)
+
+    def close(self):
+        if self._processes is not None:
+            self._processes.shutdown(wait=False, cancel_futures=True)
+            self._processes = None
+        if self._threads is not None:
+            self._threads.shutdown(wait=False, cancel_futures=True)
+            self._threads = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'threads': self._threads._max_workers if self._threads else None,
+            'processes': self._processes._max_workers if self._processes else None,
+            'offload_min_bytes': OFFLOAD_MIN_BYTES,
+            'inline': self._inline,
+            'tasks': {
+                kind: {'queue_time': queue_time.to_dict(), 'run_time': run_time.to_dict()}
+                for kind, (queue_time, run_time) in self._histograms.items()
+            },
+        }
+
+
+compute_pool = ComputePool()
@@ -0,0 +1,248 @@
+"""
+db_engine.py
+
+Long-lived SQLite connection layer used by DatabaseService.
+
+- One dedicated writer connection fed by an async write queue. Queued jobs are
+  committed together (group commit); each job runs inside its own SAVEPOINT so
+  a failing job never rolls back its neighbours.
+- A small pool of read-only connections for concurrent readers.
+- WAL journaling, tuned synchronous/mmap_size/cache_size pragmas and a large
+  prepared statement cache on every connection.
+- Maintenance jobs (checkpoints, vacuuming) run on the writer connection
+  between batches, outside any transaction.
+
+The engine starts lazily on first use, but the FastAPI lifespan in main.py
+opens it explicitly at startup and closes it (draining pending writes) on
+shutdown.
+"""
+import asyncio
+import os
+import sqlite3
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, Awaitable, Callable, List, Optional, Sequence
+import aiosqlite
+
+WriteJob = Callable[[aiosqlite.Connection], Awaitable[Any]]
+
+# Pragmas applied to every pooled connection. journal_mode=WAL is persistent
+# and is set once on the database file by DatabaseService._init_db.
+CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA mmap_size = 268435456",  # 256MB
+    "PRAGMA cache_size = -32000",  # ~32MB page cache per connection
+    "PRAGMA busy_timeout = 5000",
+)
+
+DEFAULT_READ_POOL_SIZE = 4
+DEFAULT_MAX_BATCH_SIZE = 64
+DEFAULT_STATEMENT_CACHE_SIZE = 256
+
+_STOP = object()
+
+
+class DatabaseEngine:
+    """Pooled SQLite engine with a single serialized writer"""
+
+    def __init__(
+        self,
+        db_path: str,
+        read_pool_size: int = DEFAULT_READ_POOL_SIZE,
+        max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+        statement_cache_size: int = DEFAULT_STATEMENT_CACHE_SIZE,
+    ):
+        self.db_path = db_path
+        self.read_pool_size = read_pool_size
+        self.max_batch_size = max_batch_size
+        self.statement_cache_size = statement_cache_size
+
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._readers: List[aiosqlite.Connection] = []
+        self._read_pool: Optional[asyncio.Queue] = None
+        self._write_queue: Optional[asyncio.Queue] = None
+        self._writer_task: Optional[asyncio.Task] = None
+        self._start_lock: Optional[asyncio.Lock] = None
+
+    @property
+    def started(self) -> bool:
+        return self._writer_task is not None
+
+    async def _connect(self, read_only: bool) -> aiosqlite.Connection:
+        if read_only:
+            uri = Path(os.path.abspath(self.db_path)).as_uri() + "?mode=ro"
+            conn = await aiosqlite.connect(
+                uri, uri=True, isolation_level=None,
+                cached_statements=self.statement_cache_size)
+        else:
+            conn = await aiosqlite.connect(
+                self.db_path, isolation_level=None,
+                cached_statements=self.statement_cache_size)
+        conn.row_factory = sqlite3.Row
+        for pragma in CONNECTION_PRAGMAS:
+            await conn.execute(pragma)
+        return conn
+
+    async def start(self):
+        """Open the writer and the read pool, and start the writer task"""
+        if self._start_lock is None:
+            self._start_lock = asyncio.Lock()
+        async with self._start_lock:
+            if self.started:
+                return
+            self._writer = await self._connect(read_only=False)
+            self._readers = [await self._connect(read_only=True)
+                             for _ in range(self.read_pool_size)]
+            self._read_pool = asyncio.Queue()
+            for reader in self._readers:
+                self._read_pool.put_nowait(reader)
+            self._write_queue = asyncio.Queue()
+            self._writer_task = asyncio.create_task(self._writer_loop())
+
+    async def close(self):
+        """Flush pending writes and close every connection"""
+        if not self.started:
+            return
+        await self._write_queue.put(_STOP)
+        await self._writer_task
+        self._writer_task = None
+        for conn in [self._writer, *self._readers]:
+            await conn.close()
+        self._writer = None
+        self._readers = []
+        self._read_pool = None
+        self._write_queue = None
+
+    # ========== writes ==========
+
+    async def write(self, job: WriteJob) -> Any:
+        """
+        Run `job(conn)` on the writer connection and return its result once
+        the surrounding transaction has been committed.
+        """
+        if not self.started:
+            await self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._write_queue.put((job, future, True))
+        return await future
+
+    async def maintenance(self, job: WriteJob) -> Any:
+        """
+        Run `job(conn)` on the writer connection in autocommit mode, between
+        write batches. For statements that cannot run inside a transaction,
+        such as wal_checkpoint.
+        """
+        if not self.started:
+            await self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._write_queue.put((job, future, False))
+        return await future
+
+    async def execute(self, sql: str, params: Sequence[Any] = ()) -> int:
+        """Execute a single write statement, returning the cursor lastrowid"""
+        async def job(conn: aiosqlite.Connection):
+            async with conn.execute(sql, params) as cursor:
+                return cursor.lastrowid
+        return await self.write(job)
+
+    async def executemany(self, sql: str, seq_of_params: Sequence[Sequence[Any]]):
+        """Execute a write statement for every parameter tuple in one job"""
+        async def job(conn: aiosqlite.Connection):
+            await conn.executemany(sql, seq_of_params)
+        return await self.write(job)
+
+    async def _writer_loop(self):
+        # Item taken off the queue that cannot join the current batch
+        carry = None
+        while True:
+            if carry is not None:
+                item, carry = carry, None
+            else:
+                item = await self._write_queue.get()
+            if item is _STOP:
+                break
+            if not item[2]:
+                await self._run_maintenance(item)
+                continue
+            batch = [item]
+            while len(batch) < self.max_batch_size:
+                try:
+                    item = self._write_queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+                if item is _STOP or not item[2]:
+                    carry = item
+                    break
+                batch.append(item)
+            await self._run_batch(batch)
+
+    async def _run_maintenance(self, item):
+        job, future, _ = item
+        if future.cancelled():
+            return
+        try:
+            result = await job(self._writer)
+        except Exception as e:
+            if self._writer.in_transaction:
+                await self._writer.execute("ROLLBACK")
+            if not future.done():
+                future.set_exception(e)
+            return
+        if not future.done():
+            future.set_result(result)
+
+    async def _run_batch(self, batch):
+        conn = self._writer
+        outcomes = []
+        try:
+            await conn.execute("BEGIN IMMEDIATE")
+            for job, future, _ in batch:
+                if future.cancelled():
+                    continue
+                await conn.execute("SAVEPOINT write_job")
+                try:
+                    result = await job(conn)
+                except Exception as e:
+                    await conn.execute("ROLLBACK TO write_job")
+                    await conn.execute("RELEASE write_job")
+                    outcomes.append((future, None, e))
+                    continue
+                await conn.execute("RELEASE write_job")
+                outcomes.append((future, result, None))
+            await conn.execute("COMMIT")
+        except Exception as e:
+            print('🗄️ Database write batch failed', e)
+            if conn.in_transaction:
+                await conn.execute("ROLLBACK")
+            outcomes = [(future, None, e) for _, future, _ in batch]
+
+        for future, result, error in outcomes:
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    # ========== reads ==========
+
+    @asynccontextmanager
+    async def reader(self):
+        """Borrow a read-only connection from the pool"""
+        if not self.started:
+            await self.start()
+        conn = await self._read_pool.get()
+        try:
+            yield conn
+        finally:
+            self._read_pool.put_nowait(conn)
+
+    async def fetchall(self, sql: str, params: Sequence[Any] = ()) -> List[sqlite3.Row]:
+        async with self.reader() as conn:
+            return list(await conn.execute_fetchall(sql, params))
+
+    async def fetchone(self, sql: str, params: Sequence[Any] = ()) -> Optional[sqlite3.Row]:
+        async with self.reader() as conn:
+            async with conn.execute(sql, params) as cursor:
+                return await cursor.fetchone()
@@ -0,0 +1,150 @@
+# services/db_maintenance.py
+import asyncio
+import time
+import traceback
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from services.db_service import db_service
+from services.stream_service import stream_tasks
+
+# How often the scheduler wakes up to look for due tasks
+TICK_SECONDS = 30
+# Tasks wait until nothing has been streamed for this long
+IDLE_SECONDS = 60
+# Free pages released per incremental vacuum run, so one run stays short
+VACUUM_MAX_PAGES = 2000
+# Free pages below which vacuuming is not worth it
+VACUUM_MIN_FREE_PAGES = 256
+
+
+class MaintenanceTask:
+    def __init__(self, name: str, interval: float, run: Callable[[], Awaitable[Any]]):
+        self.name = name
+        self.interval = interval
+        self.run = run
+        self.next_run = time.monotonic() + interval
+        self.runs = 0
+        self.last_run_at: Optional[str] = None
+        self.last_duration_ms: Optional[float] = None
+        self.last_result: Any = None
+        self.last_error: Optional[str] = None
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            'interval_seconds': self.interval,
+            'runs': self.runs,
+            'last_run_at': self.last_run_at,
+            'last_duration_ms': self.last_duration_ms,
+            'last_result': self.last_result,
+            'last_error': self.last_error,
+            'due_in_seconds': max(0, round(self.next_run - time.monotonic())),
+        }
+
+
+class DatabaseMaintenance:
+    """
+    Background scheduler for localmanus.db housekeeping.
+
+    - wal_checkpoint keeps the WAL file from growing between automatic checkpoints
+    - incremental_vacuum returns free pages left by deletes to the file system
+      (auto_vacuum=INCREMENTAL is enabled by migration v9)
+    - PRAGMA optimize and a periodic full ANALYZE keep query plans current
+
+    Tasks only run once no chat has been streaming for IDLE_SECONDS, and one
+    task at a time, so maintenance never competes with an agent turn for the
+    writer connection.
+    """
+
+    def __init__(self, tick: float = TICK_SECONDS, idle_seconds: float = IDLE_SECONDS):
+        self.tick = tick
+        self.idle_seconds = idle_seconds
+        self.tasks = [
+            MaintenanceTask('checkpoint', 5 * 60, self._checkpoint),
+            MaintenanceTask('incremental_vacuum', 15 * 60, self._incremental_vacuum),
+            MaintenanceTask('optimize', 60 * 60, self._optimize),
+            MaintenanceTask('analyze', 24 * 60 * 60, self._analyze),
+        ]
+        self.deferred_ticks = 0
+        self.pages_freed = 0
+        self._last_busy = time.monotonic()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def _is_idle(self) -> bool:
+        now = time.monotonic()
+        if stream_tasks:
+            self._last_busy = now
+        return now - self._last_busy >= self.idle_seconds
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.tick)
+            due = [t for t in self.tasks if t.next_run <= time.monotonic()]
+            if not due:
+                continue
+            if not self._is_idle():
+                self.deferred_ticks += 1
+                continue
+            # One task per tick, so a burst of due tasks is spread out
+            await self.run_task(due[0])
+
+    async def run_task(self, task: MaintenanceTask):
+        start = time.perf_counter()
+        task.last_run_at = datetime.now(timezone.utc).isoformat()
+        try:
+            task.last_result = await task.run()
+            task.last_error = None
+        except Exception as e:
+            print(f"Error running database maintenance task {task.name}: {e}")
+            traceback.print_exc()
+            task.last_error = str(e)
+        task.runs += 1
+        task.last_duration_ms = round((time.perf_counter() - start) * 1000, 2)
+        task.next_run = time.monotonic() + task.interval
+
+    async def _checkpoint(self):
+        return await db_service.checkpoint('PASSIVE')
+
+    async def _incremental_vacuum(self):
+        stats = await db_service.get_storage_stats()
+        if stats['freelist_count'] < VACUUM_MIN_FREE_PAGES:
+            return {'pages_freed': 0, 'freelist_count': stats['freelist_count']}
+        freed = await db_service.incremental_vacuum(VACUUM_MAX_PAGES)
+        self.pages_freed += freed
+        if freed:
+            print(f"🧹 Freed {freed} database pages ({freed * stats['page_size'] // 1024} KB)")
+        return {'pages_freed': freed, 'freelist_count': stats['freelist_count'] - freed}
+
+    async def _optimize(self):
+        await db_service.optimize()
+
+    async def _analyze(self):
+        await db_service.optimize(analyze=True)
+
+    async def get_status(self) -> Dict[str, Any]:
+        return {
+            'running': self._task is not None,
+            'idle': self._is_idle(),
+            'active_streams': len(stream_tasks),
+            'deferred_ticks': self.deferred_ticks,
+            'pages_freed': self.pages_freed,
+            'storage': await db_service.get_storage_stats(),
+            'tasks': {t.name: t.status() for t in self.tasks},
+        }
+
+
+db_maintenance = DatabaseMaintenance()
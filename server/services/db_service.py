@@ -1,13 +1,127 @@
+import asyncio
+import hashlib
+import itertools
+import traceback
+from collections import OrderedDict
 import sqlite3
 import json
+import math
 import os
+import sys
 from pathlib import Path
-from typing import List, Dict, Any, Optional
-import aiosqlite
+from typing import List, Dict, Any, Optional, AsyncIterator, Set, Tuple
+from .compute_pool import compute_pool
 from .config_service import USER_DATA_DIR
+from .db_engine import DatabaseEngine
+from .media_refs import extract_file_refs
+from .thumbnail_store import is_data_url, store_thumbnail, thumbnail_url
+from .settings_service import settings_service
+from .storage_codec import load_dictionaries, storage_codec
+from . import search_service
+from . import canvas_oplog
+from .canvas_oplog import CanvasHead
+from .search_service import KIND_MESSAGE, KIND_CANVAS_NAME, KIND_CANVAS_TEXT, extract_message_text, extract_canvas_text
 from .migrations.manager import MigrationManager, CURRENT_VERSION
 
 DB_PATH = os.path.join(USER_DATA_DIR, "localmanus.db")
+CHAT_HISTORY_CHUNK_SIZE = 200
+# Parsed canvas documents kept in memory, by JSON size
+CANVAS_CACHE_MAX_BYTES = 64 * 1024 * 1024
+# Recently updated canvases loaded into the cache at startup
+CANVAS_CACHE_PREWARM_COUNT = 8
+# Saves of the same canvas within this window are written once
+CANVAS_SAVE_COALESCE_SECONDS = 0.5
+# Canvas heads kept in memory; others are loaded again from the op log
+CANVAS_HEADS_MAX_ENTRIES = 64
+# Space between appended media elements
+MEDIA_GAP = 20
+# Rows read per query when scanning canvases and messages for file references
+FILE_REF_SCAN_CHUNK_SIZE = 500
+CANVAS_DATA_CHUNK_SQL = "SELECT rowid, data FROM canvases WHERE rowid > ? ORDER BY rowid LIMIT ?"
+CANVAS_SNAPSHOTS_CHUNK_SQL = "SELECT id, data FROM canvas_snapshots WHERE id > ? ORDER BY id LIMIT ?"
+CANVAS_FILE_OPS_CHUNK_SQL = "SELECT id, payload FROM canvas_ops WHERE id > ? AND op = 'file' ORDER BY id LIMIT ?"
+CANVAS_MEDIA_OPS_CHUNK_SQL = """
+    SELECT id, op, key, payload FROM canvas_ops
+    WHERE id > ? AND op IN ('upsert', 'file')
+    ORDER BY id LIMIT ?
+"""
+MESSAGES_CHUNK_SQL = "SELECT id, message FROM chat_messages WHERE id > ? ORDER BY id LIMIT ?"
+
+
+def hash_canvas_data(data: Optional[str]) -> str:
+    """Content hash identifying a version of a canvas document"""
+    return hashlib.blake2b((data or '').encode('utf-8'), digest_size=16).hexdigest()
+
+
+def canvas_etag(data_hash: str, name: str, sessions: List[Dict[str, Any]]) -> str:
+    """Strong ETag for GET /api/canvas/{id}, which also returns name and sessions"""
+    version = f"{data_hash}\0{name}\0{json.dumps(sessions, sort_keys=True)}"
+    return '"' + hashlib.blake2b(version.encode('utf-8'), digest_size=16).hexdigest() + '"'
+
+
+class CanvasDocument:
+    """A parsed canvas document with its name, content hash and JSON size"""
+    __slots__ = ('data', 'name', 'data_hash', 'size')
+
+    def __init__(self, data: Dict[str, Any], name: str, data_hash: Optional[str], size: int):
+        self.data = data
+        self.name = name
+        self.data_hash = data_hash
+        self.size = size
+
+
+class CanvasDocumentCache:
+    """LRU cache of parsed canvas documents bounded by their total JSON size"""
+
+    def __init__(self, max_bytes: int = CANVAS_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, CanvasDocument]" = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, id: str) -> Optional[CanvasDocument]:
+        entry = self._entries.get(id)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(id)
+        return entry
+
+    def peek(self, id: str) -> Optional[CanvasDocument]:
+        """Entry without counting a hit or refreshing its recency"""
+        return self._entries.get(id)
+
+    def put(self, id: str, entry: CanvasDocument):
+        self.pop(id)
+        if entry.size > self.max_bytes:
+            return
+        self._entries[id] = entry
+        self.bytes += entry.size
+        while self.bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.bytes -= evicted.size
+            self.evictions += 1
+
+    def pop(self, id: str):
+        entry = self._entries.pop(id, None)
+        if entry is not None:
+            self.bytes -= entry.size
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'bytes': self.bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+            'evictions': self.evictions,
+        }
+
 
 class DatabaseService:
     def __init__(self):
@@ -15,6 +129,28 @@ class DatabaseService:
         self._ensure_db_directory()
         self._migration_manager = MigrationManager()
         self._init_db()
+        self._engine = DatabaseEngine(self.db_path)
+        # canvas_id -> element versions, files and last media placement of the
+        # latest canvas version, least recently used first; only touched
+        # inside write jobs
+        self._canvas_heads: "OrderedDict[str, CanvasHead]" = OrderedDict()
+        # canvas_id -> content hash of the latest canvas data (None if unknown)
+        self._canvas_data_hashes: Dict[str, Optional[str]] = {}
+        # Parsed latest version of recently used canvases, including saves
+        # that are still waiting in _pending_canvas_saves
+        self._canvas_cache = CanvasDocumentCache()
+        # canvas_id -> counter bumped on every change, so a read that raced
+        # with a write never caches the older document
+        self._canvas_generations: Dict[str, int] = {}
+        # canvas_id -> latest save not written yet, see save_canvas_data
+        self._pending_canvas_saves: Dict[str, Tuple[int, Dict[str, Any], str, Optional[str], Optional[str], str]] = {}
+        # canvas_id -> sequence number of the latest save or append that
+        # started; a save that finishes parsing after a newer one is stale
+        self._canvas_save_seqs: Dict[str, int] = {}
+        self._canvas_save_seq = itertools.count(1)
+        self._canvas_save_timers: Dict[str, asyncio.TimerHandle] = {}
+        self._canvas_save_tasks: Dict[str, asyncio.Task] = {}
+        self._coalesced_canvas_saves = 0
 
     def _ensure_db_directory(self):
         """Ensure the database directory exists"""
@@ -23,6 +159,9 @@ class DatabaseService:
     def _init_db(self):
         """Initialize the database with the current schema"""
         with sqlite3.connect(self.db_path) as conn:
+            # WAL lets the pooled readers run alongside the single writer
+            conn.execute("PRAGMA journal_mode=WAL")
+
             # Create version table if it doesn't exist
             conn.execute("""
                 CREATE TABLE IF NOT EXISTS db_version (
@@ -44,154 +183,856 @@ class DatabaseService:
                 # Need to migrate
                 self._migration_manager.migrate(conn, current_version[0], CURRENT_VERSION)
 
+            storage_codec.configure(settings_service.get_raw_settings().get('storage_compression'),
+                                    load_dictionaries(conn))
+
+    async def start(self):
+        """Open the pooled database engine and pre-warm the canvas cache"""
+        await self._engine.start()
+        try:
+            await self._prewarm_canvas_cache()
+        except Exception as e:
+            print(f"Error pre-warming canvas cache: {e}")
+            traceback.print_exc()
+
+    async def close(self):
+        """Flush pending writes and close the pooled database engine"""
+        await self.flush_canvas_saves()
+        await self._engine.close()
+
     async def create_canvas(self, id: str, name: str):
         """Create a new canvas"""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("""
+        async def job(conn):
+            await conn.execute("""
                 INSERT INTO canvases (id, name)
                 VALUES (?, ?)
             """, (id, name))
-            await db.commit()
+            await search_service.index_document(conn, KIND_CANVAS_NAME, id, name, canvas_id=id)
+        await self._engine.write(job)
 
     async def list_canvases(self) -> List[Dict[str, Any]]:
         """Get all canvases"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = sqlite3.Row
-            cursor = await db.execute("""
-                SELECT id, name, description, thumbnail, created_at, updated_at
-                FROM canvases
-                ORDER BY updated_at DESC
-            """)
-            rows = await cursor.fetchall()
-            return [dict(row) for row in rows]
+        rows = await self._engine.fetchall("""
+            SELECT id, name, description, thumbnail, thumbnail_hash, created_at, updated_at
+            FROM canvases
+            ORDER BY updated_at DESC
+        """)
+        canvases = []
+        for row in rows:
+            canvas = dict(row)
+            thumbnail_hash = canvas.pop('thumbnail_hash')
+            if thumbnail_hash:
+                canvas['thumbnail'] = thumbnail_url(thumbnail_hash)
+            canvases.append(canvas)
+        return canvases
 
     async def create_chat_session(self, id: str, model: str, provider: str, canvas_id: str, title: Optional[str] = None):
         """Save a new chat session"""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("""
-                INSERT INTO chat_sessions (id, model, provider, canvas_id, title)
-                VALUES (?, ?, ?, ?, ?)
-            """, (id, model, provider, canvas_id, title))
-            await db.commit()
+        await self._engine.execute("""
+            INSERT INTO chat_sessions (id, model, provider, canvas_id, title)
+            VALUES (?, ?, ?, ?, ?)
+        """, (id, model, provider, canvas_id, title))
 
     async def create_message(self, session_id: str, role: str, message: str):
         """Save a chat message"""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("""
-                INSERT INTO chat_messages (session_id, role, message)
-                VALUES (?, ?, ?)
-            """, (session_id, role, message))
-            await db.commit()
-
-    async def get_chat_history(self, session_id: str) -> List[Dict[str, Any]]:
-        """Get chat history for a session"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = sqlite3.Row
-            cursor = await db.execute("""
-                SELECT role, message, id
+        await self.create_messages(session_id, [(role, message)])
+
+    async def create_messages(self, session_id: str, messages: List[Tuple[str, str]]):
+        """Save several (role, message) chat messages in one transaction"""
+        texts = [extract_message_text(message) for _, message in messages]
+
+        async def job(conn):
+            for (role, message), text in zip(messages, texts):
+                async with conn.execute("""
+                    INSERT INTO chat_messages (session_id, role, message)
+                    VALUES (?, ?, ?)
+                """, (session_id, role, storage_codec.encode(message))) as cursor:
+                    message_id = cursor.lastrowid
+                await search_service.index_document(conn, KIND_MESSAGE, message_id, text, session_id=session_id)
+        await self._engine.write(job)
+
+    async def get_chat_history(self, session_id: str, before: Optional[int] = None, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Get chat history for a session, oldest first.
+
+        With `limit`, only the `limit` newest messages older than message id
+        `before` (or the newest overall) are returned.
+        """
+        if limit is not None:
+            page, _ = await self.get_chat_history_page(session_id, before, limit)
+            return [json.loads(message) for _, message in page]
+        messages = []
+        async for _, message in self.iter_chat_history_json(session_id, before):
+            messages.append(json.loads(message))
+        return messages
+
+    async def get_chat_history_page(self, session_id: str, before: Optional[int],
+                                    limit: int) -> Tuple[List[Tuple[int, str]], Optional[int]]:
+        """
+        Return the keyset page of the `limit` newest messages older than
+        message id `before` (or the newest overall), oldest first, as
+        (id, message JSON text), with the `before` cursor of the next older
+        page, or None if the page reaches the beginning of the session.
+
+        One extra row is read to tell whether an older page exists.
+        """
+        rows = await self._engine.fetchall("""
+            SELECT id, message
+            FROM chat_messages
+            WHERE session_id = ? AND id < ? AND (typeof(message) = 'blob' OR json_valid(message))
+            ORDER BY id DESC
+            LIMIT ?
+        """, (session_id, before if before is not None else sys.maxsize, limit + 1))
+        next_before = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_before = rows[-1]['id']
+        return [(row['id'], storage_codec.decode(row['message'])) for row in reversed(rows)], next_before
+
+    async def iter_chat_history_json(self, session_id: str, before: Optional[int] = None,
+                                     chunk_size: int = CHAT_HISTORY_CHUNK_SIZE) -> AsyncIterator[Tuple[int, str]]:
+        """
+        Yield (id, message JSON text) for a session's messages older than
+        message id `before` (or all of them), oldest first, without parsing
+        them. See get_chat_history_page for a page of the newest ones.
+
+        Rows are read in keyset chunks over idx_chat_messages_session_id_id so
+        no pooled connection is held while the caller consumes the stream.
+        Rows whose stored text is not valid JSON are skipped; compressed
+        rows are decoded (only JSON messages are ever stored).
+        """
+        upper = before if before is not None else sys.maxsize
+        after = 0
+        while True:
+            rows = await self._engine.fetchall("""
+                SELECT id, message
                 FROM chat_messages
-                WHERE session_id = ?
+                WHERE session_id = ? AND id > ? AND id < ? AND (typeof(message) = 'blob' OR json_valid(message))
                 ORDER BY id ASC
-            """, (session_id,))
-            rows = await cursor.fetchall()
-            
-            messages = []
+                LIMIT ?
+            """, (session_id, after, upper, chunk_size))
             for row in rows:
-                row_dict = dict(row)
-                if row_dict['message']:
-                    try:
-                        msg = json.loads(row_dict['message'])
-                        messages.append(msg)
-                    except:
-                        pass
-                
-            return messages
+                yield row['id'], storage_codec.decode(row['message'])
+            if len(rows) < chunk_size:
+                return
+            after = rows[-1]['id']
 
     async def list_sessions(self, canvas_id: str) -> List[Dict[str, Any]]:
         """List all chat sessions"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = sqlite3.Row
-            if canvas_id:
-                cursor = await db.execute("""
-                    SELECT id, title, model, provider, created_at, updated_at
-                    FROM chat_sessions
-                    WHERE canvas_id = ?
-                    ORDER BY updated_at DESC
-                """, (canvas_id,))
-            else:
-                cursor = await db.execute("""
-                    SELECT id, title, model, provider, created_at, updated_at
-                    FROM chat_sessions
-                    ORDER BY updated_at DESC
-                """)
-            rows = await cursor.fetchall()
-            return [dict(row) for row in rows]
+        if canvas_id:
+            rows = await self._engine.fetchall("""
+                SELECT id, title, model, provider, created_at, updated_at
+                FROM chat_sessions
+                WHERE canvas_id = ?
+                ORDER BY updated_at DESC
+            """, (canvas_id,))
+        else:
+            rows = await self._engine.fetchall("""
+                SELECT id, title, model, provider, created_at, updated_at
+                FROM chat_sessions
+                ORDER BY updated_at DESC
+            """)
+        return [dict(row) for row in rows]
 
     async def save_canvas_data(self, id: str, data: str, thumbnail: str = None):
-        """Save canvas data"""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("""
+        """
+        Save canvas data. Only the element-level changes against the latest
+        version are appended to the canvas operation log. Inline data URL
+        thumbnails are moved to the thumbnail store and only their hash is
+        kept in the row. A malformed data URL keeps the previous thumbnail.
+
+        The document is cached right away and written after
+        CANVAS_SAVE_COALESCE_SECONDS, so a burst of saves of the same canvas
+        costs one write. Returns False without touching the row when the
+        content hash matches the latest version, the canvas does not exist or
+        a newer save of the canvas overtook this one.
+        """
+        # Taken before the first await: saves are ordered by arrival, not by
+        # how long their data took to parse
+        seq = next(self._canvas_save_seq)
+        self._canvas_save_seqs[id] = seq
+        data_hash = hash_canvas_data(data)
+        if data_hash == await self._get_canvas_data_hash(id):
+            return False
+
+        cached = self._canvas_cache.peek(id)
+        if cached is not None:
+            name = cached.name
+        else:
+            row = await self._engine.fetchone("SELECT name FROM canvases WHERE id = ?", (id,))
+            if row is None:
+                return False
+            name = row['name']
+
+        thumbnail_hash = None
+        if is_data_url(thumbnail):
+            try:
+                thumbnail_hash = await asyncio.to_thread(store_thumbnail, thumbnail)
+                thumbnail = ''
+            except ValueError as e:
+                print(f"⚠️ Keeping the previous thumbnail of canvas {id}: {e}")
+                thumbnail, thumbnail_hash = await self._get_canvas_thumbnail(id)
+        canvas_data = await compute_pool.json_loads(data) if data else {}
+        if self._canvas_save_seqs.get(id) != seq:
+            return False
+
+        self._touch_canvas(id)
+        self._canvas_data_hashes[id] = data_hash
+        self._canvas_cache.put(id, CanvasDocument(canvas_data, name, data_hash, len(data or '')))
+        if id in self._pending_canvas_saves:
+            self._coalesced_canvas_saves += 1
+        self._pending_canvas_saves[id] = (seq, canvas_data, data_hash, thumbnail, thumbnail_hash,
+                                          canvas_oplog.now_timestamp())
+        if id not in self._canvas_save_timers:
+            self._canvas_save_timers[id] = asyncio.get_running_loop().call_later(
+                CANVAS_SAVE_COALESCE_SECONDS, self._start_canvas_save_flush, id)
+        return True
+
+    async def _get_canvas_thumbnail(self, id: str) -> Tuple[Optional[str], Optional[str]]:
+        """(thumbnail, thumbnail_hash) of the latest save of a canvas"""
+        pending = self._pending_canvas_saves.get(id)
+        if pending is not None:
+            return pending[3], pending[4]
+        row = await self._engine.fetchone("SELECT thumbnail, thumbnail_hash FROM canvases WHERE id = ?", (id,))
+        return (row['thumbnail'], row['thumbnail_hash']) if row else (None, None)
+
+    def _start_canvas_save_flush(self, id: str):
+        self._canvas_save_timers.pop(id, None)
+        task = asyncio.create_task(self._flush_canvas_save_logged(id))
+        self._canvas_save_tasks[id] = task
+
+        def _done(t: asyncio.Task):
+            if self._canvas_save_tasks.get(id) is t:
+                self._canvas_save_tasks.pop(id, None)
+        task.add_done_callback(_done)
+
+    async def _flush_canvas_save_logged(self, id: str):
+        try:
+            await self._flush_canvas_save(id)
+        except Exception as e:
+            print(f"Error saving canvas {id}: {e}")
+            traceback.print_exc()
+
+    async def _flush_canvas_save(self, id: str):
+        """Write the pending save of a canvas, if any"""
+        timer = self._canvas_save_timers.pop(id, None)
+        if timer is not None:
+            timer.cancel()
+        # Pop and enqueue without yielding in between, so flushes of one
+        # canvas reach the database writer in order
+        pending = self._pending_canvas_saves.pop(id, None)
+        if pending is None:
+            return
+        _, canvas_data, data_hash, thumbnail, thumbnail_hash, created_at = pending
+        text = extract_canvas_text(canvas_data)
+
+        async def job(conn):
+            head = await self._get_canvas_head(conn, id)
+            if head is None:
+                return
+            await canvas_oplog.write_ops(conn, id, head.diff(canvas_data), created_at)
+            await conn.execute("""
                 UPDATE canvases 
-                SET data = ?, thumbnail = ?, updated_at = STRFTIME('%Y-%m-%dT%H:%M:%fZ', 'now')
+                SET data_hash = ?, thumbnail = ?, thumbnail_hash = ?, updated_at = ?
                 WHERE id = ?
-            """, (data, thumbnail, id))
-            await db.commit()
+            """, (data_hash, thumbnail, thumbnail_hash, created_at, id))
+            await search_service.index_document(conn, KIND_CANVAS_TEXT, id, text, canvas_id=id)
+
+        try:
+            await self._engine.write(job)
+        except Exception:
+            self._invalidate_canvas(id)
+            raise
+
+    async def flush_canvas_saves(self):
+        """Write every pending canvas save"""
+        for id in list(self._pending_canvas_saves):
+            await self._flush_canvas_save_logged(id)
+        if self._canvas_save_tasks:
+            await asyncio.gather(*self._canvas_save_tasks.values(), return_exceptions=True)
+
+    def _touch_canvas(self, id: str):
+        self._canvas_generations[id] = self._canvas_generations.get(id, 0) + 1
+
+    def _invalidate_canvas(self, id: str):
+        """Forget everything held in memory about a canvas"""
+        self._touch_canvas(id)
+        self._canvas_heads.pop(id, None)
+        self._canvas_data_hashes.pop(id, None)
+        self._canvas_cache.pop(id)
+
+    async def _get_canvas_data_hash(self, id: str) -> Optional[str]:
+        if id not in self._canvas_data_hashes:
+            row = await self._engine.fetchone("SELECT data_hash FROM canvases WHERE id = ?", (id,))
+            self._canvas_data_hashes[id] = row['data_hash'] if row else None
+        return self._canvas_data_hashes[id]
+
+    async def _get_canvas_head(self, conn, id: str) -> Optional[CanvasHead]:
+        """Head of a canvas, materialized on first use. Call inside write jobs only"""
+        head = self._canvas_heads.get(id)
+        if head is not None:
+            self._canvas_heads.move_to_end(id)
+            return head
+        loaded = await canvas_oplog.load_canvas(conn, id)
+        if loaded is None:
+            return None
+        head = self._canvas_heads[id] = CanvasHead(loaded[0])
+        while len(self._canvas_heads) > CANVAS_HEADS_MAX_ENTRIES:
+            self._canvas_heads.popitem(last=False)
+        return head
+
+    async def append_canvas_element(self, canvas_id: str, element: Dict[str, Any], file: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Append a media element and its file entry to a canvas, placed as in
+        append_canvas_elements. Returns the element with its placement filled
+        in.
+        """
+        return (await self.append_canvas_elements(canvas_id, [(element, file)]))[0]
+
+    async def append_canvas_elements(self, canvas_id: str, items: List[Tuple[Dict[str, Any], Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """
+        Append (element, file entry) pairs of media to a canvas in one write.
+
+        The elements are laid out as a grid, row by row, to the right of the
+        last image on the canvas (for videos, the last image or video). Raises
+        ValueError if the canvas does not exist. The append runs as a single
+        job on the serialized writer, so concurrent appends to the same canvas
+        never lose updates.
+
+        Returns the elements with their placement filled in.
+        """
+        elements = [element for element, _ in items]
+        # Saves that started before the append must not be replayed over the
+        # appended elements: the pending one is written now, later ones are stale
+        await self._flush_canvas_save(canvas_id)
+        self._canvas_save_seqs[canvas_id] = next(self._canvas_save_seq)
+        created_at = canvas_oplog.now_timestamp()
+
+        async def job(conn):
+            head = await self._get_canvas_head(conn, canvas_id)
+            if head is None:
+                raise ValueError(f"Canvas {canvas_id} not found")
+
+            last = head.last_media.get(elements[0].get('type'), head.last_media['video'])
+            columns = math.ceil(math.sqrt(len(items)))
+            widths = [max(e.get('width') or 0 for e in elements[c::columns]) for c in range(columns)]
+            heights = [max(e.get('height') or 0 for e in elements[r * columns:(r + 1) * columns])
+                       for r in range(math.ceil(len(items) / columns))]
+            ops = []
+            for i, (element, file) in enumerate(items):
+                row, column = divmod(i, columns)
+                element['x'] = last['x'] + last['width'] + MEDIA_GAP + sum(widths[:column]) + MEDIA_GAP * column
+                element['y'] = last['y'] + sum(heights[:row]) + MEDIA_GAP * row
+                ops += head.append_media(element, file)
+            await canvas_oplog.write_ops(conn, canvas_id, ops, created_at)
+            await conn.execute("""
+                UPDATE canvases
+                SET data_hash = NULL, updated_at = ?
+                WHERE id = ?
+            """, (created_at, canvas_id))
+            # The new content is hashed lazily by readers and the next save
+            self._canvas_data_hashes[canvas_id] = None
+            self._touch_canvas(canvas_id)
+            cached = self._canvas_cache.peek(canvas_id)
+            if cached is not None:
+                self._canvas_cache.put(canvas_id, CanvasDocument(
+                    canvas_oplog.apply_ops(cached.data, [(op, key, payload) for op, key, _, payload in ops]),
+                    cached.name, None, cached.size + sum(len(op[3]) for op in ops)))
+
+            prompts = {(e.get('customData') or {}).get('prompt') for e in elements}
+            for prompt in sorted(p for p in prompts if p):
+                await search_service.append_to_document(conn, KIND_CANVAS_TEXT, canvas_id, prompt, canvas_id=canvas_id)
+            return elements
+
+        try:
+            return await self._engine.write(job)
+        except Exception:
+            self._invalidate_canvas(canvas_id)
+            raise
 
     async def get_canvas_data(self, id: str) -> Optional[Dict[str, Any]]:
         """Get canvas data"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = sqlite3.Row
-            cursor = await db.execute("""
-                SELECT data, name
+        canvas, _ = await self.get_canvas_data_with_etag(id)
+        return canvas
+
+    async def get_canvas_data_with_etag(self, id: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """
+        Get canvas data and the ETag of that exact version. The data is the
+        cached document and must not be modified.
+        """
+        document = await self._get_canvas_document(id)
+        if document is None:
+            return None, None
+
+        if document.data_hash is None:
+            document.data_hash = hash_canvas_data(await compute_pool.json_dumps(document.data, document.size))
+        sessions = await self.list_sessions(id)
+        return {
+            'data': document.data,
+            'name': document.name,
+            'sessions': sessions
+        }, canvas_etag(document.data_hash, document.name, sessions)
+
+    async def _get_canvas_document(self, id: str) -> Optional[CanvasDocument]:
+        """Latest version of a canvas from the cache, or materialized from its snapshot and op log"""
+        document = self._canvas_cache.get(id)
+        if document is not None:
+            return document
+        return await self._load_canvas_document(id)
+
+    async def _load_canvas_document(self, id: str) -> Optional[CanvasDocument]:
+        # An evicted document may still have a save waiting
+        await self._flush_canvas_save(id)
+        generation = self._canvas_generations.get(id, 0)
+        async with self._engine.reader() as conn:
+            # One read transaction, so the hash matches the materialized ops
+            await conn.execute("BEGIN")
+            try:
+                async with conn.execute("SELECT data_hash, name FROM canvases WHERE id = ?", (id,)) as cursor:
+                    row = await cursor.fetchone()
+                loaded = await canvas_oplog.load_canvas(conn, id) if row else None
+            finally:
+                await conn.execute("COMMIT")
+        if not row or not loaded:
+            return None
+
+        data_json = await compute_pool.json_dumps(loaded[0])
+        document = CanvasDocument(loaded[0], row['name'], row['data_hash'] or hash_canvas_data(data_json), len(data_json))
+        if self._canvas_generations.get(id, 0) == generation:
+            self._canvas_cache.put(id, document)
+        return document
+
+    async def _prewarm_canvas_cache(self):
+        rows = await self._engine.fetchall("""
+            SELECT id FROM canvases ORDER BY updated_at DESC LIMIT ?
+        """, (CANVAS_CACHE_PREWARM_COUNT,))
+        for row in rows:
+            await self._load_canvas_document(row['id'])
+
+    def get_canvas_cache_stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and size of the canvas document cache"""
+        return {
+            **self._canvas_cache.stats(),
+            'pending_saves': len(self._pending_canvas_saves),
+            'coalesced_saves': self._coalesced_canvas_saves,
+        }
+
+    async def get_canvas_etag(self, id: str) -> Optional[str]:
+        """
+        ETag of the current canvas version computed from the known content
+        hash, without reading the document. None if the hash is not known yet.
+        """
+        document = self._canvas_cache.peek(id)
+        if document is not None:
+            data_hash, name = document.data_hash, document.name
+        else:
+            await self._flush_canvas_save(id)
+            row = await self._engine.fetchone("""
+                SELECT data_hash, name
                 FROM canvases
                 WHERE id = ?
             """, (id,))
-            row = await cursor.fetchone()
-
-            sessions = await self.list_sessions(id)
-            
-            if row:
-                return {
-                    'data': json.loads(row['data']) if row['data'] else {},
-                    'name': row['name'],
-                    'sessions': sessions
-                }
+            if not row:
+                return None
+            data_hash, name = row['data_hash'], row['name']
+        if not data_hash:
             return None
+        sessions = await self.list_sessions(id)
+        return canvas_etag(data_hash, name, sessions)
 
     async def delete_canvas(self, id: str):
         """Delete canvas and related data"""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("DELETE FROM canvases WHERE id = ?", (id,))
-            await db.commit()
+        await self.delete_canvases([id])
+
+    async def delete_canvases(self, ids: List[str]) -> Dict[str, Set[str]]:
+        """
+        Delete canvases with their op log, snapshots and search documents in
+        one transaction. Chat sessions are left for
+        services/canvas_deleter.py to remove in batches.
+
+        Returns the names of the files each deleted canvas referenced.
+        """
+        for id in ids:
+            timer = self._canvas_save_timers.pop(id, None)
+            if timer is not None:
+                timer.cancel()
+            self._pending_canvas_saves.pop(id, None)
+            self._canvas_save_seqs.pop(id, None)
+
+        async def job(conn):
+            file_refs = {}
+            for id in ids:
+                refs = set()
+                async with conn.execute("SELECT data FROM canvases WHERE id = ?", (id,)) as cursor:
+                    row = await cursor.fetchone()
+                if row is None:
+                    continue
+                refs |= extract_file_refs(storage_codec.decode(row[0]))
+                for (payload,) in await conn.execute_fetchall(
+                        "SELECT payload FROM canvas_ops WHERE canvas_id = ? AND op = ?", (id, canvas_oplog.OP_FILE)):
+                    refs |= extract_file_refs(storage_codec.decode(payload))
+                file_refs[id] = refs
+
+                await conn.execute("DELETE FROM canvases WHERE id = ?", (id,))
+                await conn.execute("DELETE FROM canvas_ops WHERE canvas_id = ?", (id,))
+                await conn.execute("DELETE FROM canvas_snapshots WHERE canvas_id = ?", (id,))
+                await search_service.remove_document(conn, KIND_CANVAS_NAME, id)
+                await search_service.remove_document(conn, KIND_CANVAS_TEXT, id)
+                self._invalidate_canvas(id)
+            return file_refs
+        return await self._engine.write(job)
+
+    async def delete_canvas_messages(self, canvas_id: str, limit: int) -> Tuple[int, Set[str]]:
+        """
+        Delete up to `limit` messages of a canvas's chat sessions. Returns the
+        number deleted and the names of the files those messages referenced.
+        """
+        async def job(conn):
+            rows = await conn.execute_fetchall("""
+                SELECT m.id, m.message
+                FROM chat_messages m
+                JOIN chat_sessions s ON s.id = m.session_id
+                WHERE s.canvas_id = ?
+                LIMIT ?
+            """, (canvas_id, limit))
+            message_ids = [row[0] for row in rows]
+            file_refs: Set[str] = set()
+            for row in rows:
+                file_refs |= extract_file_refs(storage_codec.decode(row[1]))
+            for message_id in message_ids:
+                await search_service.remove_document(conn, KIND_MESSAGE, message_id)
+            await conn.executemany("DELETE FROM chat_messages WHERE id = ?", [(i,) for i in message_ids])
+            return len(message_ids), file_refs
+        return await self._engine.write(job)
+
+    async def delete_canvas_sessions(self, canvas_id: str) -> int:
+        """Delete the chat sessions of a canvas. Returns the number deleted"""
+        async def job(conn):
+            async with conn.execute("DELETE FROM chat_sessions WHERE canvas_id = ?", (canvas_id,)) as cursor:
+                return cursor.rowcount
+        return await self._engine.write(job)
+
+    async def list_deleted_canvas_ids(self) -> List[str]:
+        """Canvas ids that chat sessions still point to although the canvas is gone"""
+        rows = await self._engine.fetchall("""
+            SELECT DISTINCT canvas_id
+            FROM chat_sessions
+            WHERE canvas_id IS NOT NULL AND canvas_id != ''
+                AND canvas_id NOT IN (SELECT id FROM canvases)
+        """)
+        return [row['canvas_id'] for row in rows]
+
+    async def find_referenced_files(self, names: Set[str]) -> Set[str]:
+        """
+        Which of `names` any canvas (including its retained snapshots) or
+        stored chat message still references
+        """
+        referenced: Set[str] = set()
+        for _, canvas_data, *_ in self._pending_canvas_saves.values():
+            referenced |= names & extract_file_refs(json.dumps(canvas_data))
+        for sql in (CANVAS_DATA_CHUNK_SQL, CANVAS_SNAPSHOTS_CHUNK_SQL, CANVAS_FILE_OPS_CHUNK_SQL,
+                    MESSAGES_CHUNK_SQL):
+            async for rows in self._iter_chunks(sql):
+                for row in rows:
+                    referenced |= names & extract_file_refs(storage_codec.decode(row[-1]))
+                if not names - referenced:
+                    return referenced
+        return referenced
+
+    async def iter_canvas_media_chunks(self) -> AsyncIterator[List[Tuple[str, Optional[str], str]]]:
+        """
+        Yield chunks of (kind, key, JSON text) for everything that can place
+        media on a canvas: 'document' for current and past snapshots and
+        unsaved documents, 'upsert' and 'file' for op log entries.
+        """
+        pending = [('document', None, json.dumps(canvas_data))
+                   for _, canvas_data, *_ in list(self._pending_canvas_saves.values())]
+        if pending:
+            yield pending
+        for sql in (CANVAS_DATA_CHUNK_SQL, CANVAS_SNAPSHOTS_CHUNK_SQL):
+            async for rows in self._iter_chunks(sql):
+                yield [('document', None, storage_codec.decode(row[1])) for row in rows if row[1]]
+        async for rows in self._iter_chunks(CANVAS_MEDIA_OPS_CHUNK_SQL):
+            yield [(row[1], row[2], storage_codec.decode(row[3])) for row in rows]
+
+    async def list_thumbnail_hashes(self) -> Set[str]:
+        """Hashes of the stored thumbnails canvases use, saved or not"""
+        hashes = {pending[4] for pending in list(self._pending_canvas_saves.values()) if pending[4]}
+        rows = await self._engine.fetchall("SELECT thumbnail_hash FROM canvases WHERE thumbnail_hash IS NOT NULL")
+        hashes.update(row[0] for row in rows)
+        return hashes
+
+    async def iter_message_chunks(self) -> AsyncIterator[List[str]]:
+        """Yield chunks of stored chat message JSON texts"""
+        async for rows in self._iter_chunks(MESSAGES_CHUNK_SQL):
+            yield [storage_codec.decode(row[1]) for row in rows]
+
+    async def _iter_chunks(self, sql: str, chunk_size: int = FILE_REF_SCAN_CHUNK_SIZE) -> AsyncIterator[List[sqlite3.Row]]:
+        """
+        Run a keyset query `... WHERE key > ? ORDER BY key LIMIT ?`, whose
+        first column is the key, chunk by chunk, so no pooled connection is
+        held for a whole table scan.
+        """
+        after = 0
+        while True:
+            rows = await self._engine.fetchall(sql, (after, chunk_size))
+            if rows:
+                yield rows
+            if len(rows) < chunk_size:
+                return
+            after = rows[-1][0]
 
     async def rename_canvas(self, id: str, name: str):
         """Rename canvas"""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("UPDATE canvases SET name = ? WHERE id = ?", (name, id))
-            await db.commit()
+        async def job(conn):
+            await conn.execute("UPDATE canvases SET name = ? WHERE id = ?", (name, id))
+            await search_service.index_document(conn, KIND_CANVAS_NAME, id, name, canvas_id=id)
+            self._touch_canvas(id)
+            self._canvas_cache.pop(id)
+        await self._engine.write(job)
+
+    async def get_canvas_history(self, id: str, limit: int = 100) -> List[Dict[str, Any]]:
+        """Timestamps of the most recent saves of a canvas, newest first"""
+        await self._flush_canvas_save(id)
+        async with self._engine.reader() as conn:
+            return await canvas_oplog.list_versions(conn, id, limit)
+
+    async def get_canvas_at(self, id: str, timestamp: str) -> Optional[Dict[str, Any]]:
+        """Reconstruct canvas data as it was at an ISO timestamp"""
+        await self._flush_canvas_save(id)
+        async with self._engine.reader() as conn:
+            await conn.execute("BEGIN")
+            try:
+                async with conn.execute("SELECT 1 FROM canvases WHERE id = ?", (id,)) as cursor:
+                    if await cursor.fetchone() is None:
+                        return None
+                return await canvas_oplog.load_canvas_at(conn, id, timestamp)
+            finally:
+                await conn.execute("COMMIT")
+
+    async def list_canvases_to_compact(self, min_ops: int) -> List[str]:
+        """Ids of canvases with at least `min_ops` ops since their last snapshot"""
+        async with self._engine.reader() as conn:
+            return await canvas_oplog.list_canvases_to_compact(conn, min_ops)
+
+    async def compact_canvas(self, id: str) -> int:
+        """Fold the pending ops of a canvas into a new snapshot"""
+        async def job(conn):
+            return await canvas_oplog.compact_canvas(conn, id)
+        return await self._engine.write(job)
+
+    async def prune_canvas_history(self, cutoff: str) -> int:
+        """Drop canvas history older than an ISO timestamp"""
+        async def job(conn):
+            return await canvas_oplog.prune_history(conn, cutoff)
+        return await self._engine.write(job)
+
+    async def add_media_alias(self, name: str, sha256: str, size: int):
+        """Record that FILES_DIR/name holds the media blob sha256"""
+        await self._engine.execute("""
+            INSERT OR REPLACE INTO media_aliases (name, sha256, size)
+            VALUES (?, ?, ?)
+        """, (name, sha256, size))
+
+    async def get_media_alias(self, name: str) -> Optional[Dict[str, Any]]:
+        """The blob hash and size of a media file, if it is stored as an alias"""
+        row = await self._engine.fetchone("SELECT sha256, size FROM media_aliases WHERE name = ?", (name,))
+        return dict(row) if row else None
+
+    async def get_media_source(self, url: str, since: str) -> Optional[Dict[str, Any]]:
+        """The blob and image info of a provider URL downloaded after an ISO timestamp"""
+        row = await self._engine.fetchone("""
+            SELECT sha256, mime_type, width, height, extension
+            FROM media_sources WHERE url = ? AND created_at >= ?
+        """, (url, since))
+        return dict(row) if row else None
+
+    async def add_media_source(self, url: str, sha256: str, mime_type: str, width: int, height: int, extension: str):
+        """Remember the blob a provider URL was downloaded to"""
+        await self._engine.execute("""
+            INSERT OR REPLACE INTO media_sources (url, sha256, mime_type, width, height, extension)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (url, sha256, mime_type, width, height, extension))
+
+    async def delete_media_blobs(self, hashes: List[str]):
+        """
+        Forget the aliases, sources and provider uploads of media blobs that
+        are about to be removed. Called before the blob files are unlinked,
+        so no row outlives its blob.
+        """
+        async def job(conn):
+            params = [(sha256,) for sha256 in hashes]
+            await conn.executemany("DELETE FROM media_aliases WHERE sha256 = ?", params)
+            await conn.executemany("DELETE FROM media_sources WHERE sha256 = ?", params)
+            await conn.executemany("DELETE FROM provider_uploads WHERE sha256 = ?", params)
+        await self._engine.write(job)
+
+    async def delete_media_aliases(self, names: List[str]):
+        """Forget the aliases of removed file names"""
+        async def job(conn):
+            await conn.executemany("DELETE FROM media_aliases WHERE name = ?", [(name,) for name in names])
+        await self._engine.write(job)
+
+    async def create_generation_job(self, id: str, kind: str, provider: str, model: str, params: str,
+                                    canvas_id: Optional[str], session_id: Optional[str], priority: int):
+        """Save a queued generation job"""
+        await self._engine.execute("""
+            INSERT INTO generation_jobs (id, kind, provider, model, params, canvas_id, session_id, priority)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (id, kind, provider, model, params, canvas_id, session_id, priority))
+
+    async def update_generation_job(self, id: str, **fields):
+        """Update the status, result or timestamps of a generation job"""
+        columns = ', '.join(f"{name} = ?" for name in fields)
+        await self._engine.execute(f"UPDATE generation_jobs SET {columns} WHERE id = ?", (*fields.values(), id))
+
+    async def get_generation_job(self, id: str) -> Optional[Dict[str, Any]]:
+        """Get a generation job"""
+        row = await self._engine.fetchone("SELECT * FROM generation_jobs WHERE id = ?", (id,))
+        return dict(row) if row else None
+
+    async def list_generation_jobs(self, statuses: List[str]) -> List[Dict[str, Any]]:
+        """Generation jobs in any of the given statuses, oldest first"""
+        placeholders = ', '.join('?' for _ in statuses)
+        rows = await self._engine.fetchall(f"""
+            SELECT * FROM generation_jobs
+            WHERE status IN ({placeholders})
+            ORDER BY created_at
+        """, statuses)
+        return [dict(row) for row in rows]
+
+    async def prune_generation_jobs(self, before: str) -> int:
+        """Delete finished generation jobs created before an ISO timestamp"""
+        async def job(conn):
+            async with conn.execute("""
+                DELETE FROM generation_jobs
+                WHERE status IN ('done', 'failed', 'cancelled') AND created_at < ?
+            """, (before,)) as cursor:
+                return cursor.rowcount
+        return await self._engine.write(job)
+
+    async def get_generation_cache(self, key: str, since: str) -> Optional[Dict[str, Any]]:
+        """A cached generation result created after an ISO timestamp, marked as used"""
+        row = await self._engine.fetchone("""
+            SELECT key, provider, model, images, created_at FROM generation_cache
+            WHERE key = ? AND created_at >= ?
+        """, (key, since))
+        if row is None:
+            return None
+        await self._engine.execute("""
+            UPDATE generation_cache SET last_used_at = STRFTIME('%Y-%m-%dT%H:%M:%fZ', 'now') WHERE key = ?
+        """, (key,))
+        return dict(row)
+
+    async def put_generation_cache(self, key: str, provider: str, model: str, images: str):
+        """Cache the result of a generation"""
+        await self._engine.execute("""
+            INSERT OR REPLACE INTO generation_cache (key, provider, model, images) VALUES (?, ?, ?, ?)
+        """, (key, provider, model, images))
+
+    async def delete_generation_cache(self, key: Optional[str] = None):
+        """Delete a cached generation result, or all of them"""
+        if key is None:
+            await self._engine.execute("DELETE FROM generation_cache")
+        else:
+            await self._engine.execute("DELETE FROM generation_cache WHERE key = ?", (key,))
+
+    async def prune_generation_cache(self, before: str, max_entries: int) -> int:
+        """Delete cached results created before an ISO timestamp, then the least recently used beyond max_entries"""
+        async def job(conn):
+            async with conn.execute("DELETE FROM generation_cache WHERE created_at < ?", (before,)) as cursor:
+                deleted = cursor.rowcount
+            async with conn.execute("""
+                DELETE FROM generation_cache WHERE key IN (
+                    SELECT key FROM generation_cache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?
+                )
+            """, (max_entries,)) as cursor:
+                return deleted + cursor.rowcount
+        return await self._engine.write(job)
+
+    async def count_generation_cache(self) -> int:
+        """Number of cached generation results"""
+        row = await self._engine.fetchone("SELECT COUNT(*) FROM generation_cache")
+        return row[0]
+
+    async def get_provider_upload(self, provider: str, sha256: str) -> Optional[Dict[str, Any]]:
+        """The handle a provider gave for an uploaded blob, and when it expires"""
+        row = await self._engine.fetchone("""
+            SELECT handle, expires_at FROM provider_uploads WHERE provider = ? AND sha256 = ?
+        """, (provider, sha256))
+        return dict(row) if row else None
+
+    async def put_provider_upload(self, provider: str, sha256: str, handle: str, expires_at: str):
+        """Remember the handle of a blob uploaded to a provider"""
+        await self._engine.execute("""
+            INSERT OR REPLACE INTO provider_uploads (provider, sha256, handle, expires_at) VALUES (?, ?, ?, ?)
+        """, (provider, sha256, handle, expires_at))
+
+    async def prune_provider_uploads(self, before: str) -> int:
+        """Delete provider uploads that expired before an ISO timestamp"""
+        async def job(conn):
+            async with conn.execute("DELETE FROM provider_uploads WHERE expires_at < ?", (before,)) as cursor:
+                return cursor.rowcount
+        return await self._engine.write(job)
+
+    async def get_storage_stats(self) -> Dict[str, int]:
+        """Page counts of the database file and the size of its WAL"""
+        async with self._engine.reader() as conn:
+            stats = {}
+            for pragma in ('page_size', 'page_count', 'freelist_count'):
+                async with conn.execute(f"PRAGMA {pragma}") as cursor:
+                    stats[pragma] = (await cursor.fetchone())[0]
+        wal_path = f"{self.db_path}-wal"
+        stats['wal_bytes'] = os.path.getsize(wal_path) if os.path.exists(wal_path) else 0
+        return stats
+
+    async def checkpoint(self, mode: str = 'PASSIVE') -> Dict[str, int]:
+        """Checkpoint the WAL into the database file"""
+        async def job(conn):
+            async with conn.execute(f"PRAGMA wal_checkpoint({mode})") as cursor:
+                busy, log, checkpointed = await cursor.fetchone()
+            return {'busy': busy, 'log_pages': log, 'checkpointed_pages': checkpointed}
+        return await self._engine.maintenance(job)
+
+    async def incremental_vacuum(self, max_pages: int) -> int:
+        """Release up to `max_pages` free pages to the file system. Returns pages freed"""
+        async def job(conn):
+            async with conn.execute("PRAGMA freelist_count") as cursor:
+                before = (await cursor.fetchone())[0]
+            # Each step of the pragma frees one page and execute() only steps
+            # statements without result columns once; executescript runs it to the end
+            await conn.executescript(f"PRAGMA incremental_vacuum({int(max_pages)});")
+            async with conn.execute("PRAGMA freelist_count") as cursor:
+                after = (await cursor.fetchone())[0]
+            return before - after
+        return await self._engine.maintenance(job)
+
+    async def optimize(self, analyze: bool = False):
+        """Refresh query planner statistics, all of them with `analyze`"""
+        async def job(conn):
+            await conn.execute("ANALYZE" if analyze else "PRAGMA optimize")
+        await self._engine.maintenance(job)
+
+    async def search(self, query: str, kind: Optional[str] = None, limit: int = 20, offset: int = 0) -> List[Dict[str, Any]]:
+        """Ranked full-text search over messages, canvas names and canvas text"""
+        async with self._engine.reader() as conn:
+            return await search_service.search(conn, query, kind, limit, offset)
 
     async def create_comfy_workflow(self, name: str, api_json: str, description: str, inputs: str, outputs: str = None):
         """Create a new comfy workflow"""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("""
-                INSERT INTO comfy_workflows (name, api_json, description, inputs, outputs)
-                VALUES (?, ?, ?, ?, ?)
-            """, (name, api_json, description, inputs, outputs))
-            await db.commit()
+        await self._engine.execute("""
+            INSERT INTO comfy_workflows (name, api_json, description, inputs, outputs)
+            VALUES (?, ?, ?, ?, ?)
+        """, (name, api_json, description, inputs, outputs))
 
     async def list_comfy_workflows(self) -> List[Dict[str, Any]]:
         """List all comfy workflows"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = sqlite3.Row
-            cursor = await db.execute("SELECT id, name, description, api_json, inputs, outputs FROM comfy_workflows ORDER BY id DESC")
-            rows = await cursor.fetchall()
-            return [dict(row) for row in rows]
+        rows = await self._engine.fetchall("SELECT id, name, description, api_json, inputs, outputs FROM comfy_workflows ORDER BY id DESC")
+        return [dict(row) for row in rows]
     
     async def delete_comfy_workflow(self, id: int):
         """Delete a comfy workflow"""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("DELETE FROM comfy_workflows WHERE id = ?", (id,))
-            await db.commit()
+        await self._engine.execute("DELETE FROM comfy_workflows WHERE id = ?", (id,))
 
 # Create a singleton instance
 db_service = DatabaseService() 
\ No newline at end of file
@@ -0,0 +1,124 @@
+# services/generation_cache.py
+"""
+Opt-in cache of image generation results.
+
+A retried turn, or an agent repeating a generate_image call after a handoff,
+would otherwise pay for the same provider call again. When the
+`generation_cache` setting is enabled, the result of a generation is stored
+under a key made of the provider, model, normalized prompt, aspect ratio,
+count, the other generator options that change the output and the content
+hash of the reference image. An identical request
+within ttl_hours gets new aliases of the same media store blobs instead of a
+new provider call. Entries beyond max_entries are dropped least recently
+used first.
+
+Callers that want a different result for the same request (another try)
+pass fresh=True, which skips the lookup but still caches the new result.
+"""
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from nanoid import generate
+
+from services import settings_service as settings_module
+from services.config_service import FILES_DIR
+from services.db_service import db_service
+from services.media_store import media_store
+
+DEFAULT_TTL_HOURS = 24
+DEFAULT_MAX_ENTRIES = 1000
+
+# (mime_type, width, height, filename) as returned by the image generators
+Image = Tuple[str, int, int, str]
+
+
+def normalize_prompt(prompt: str) -> str:
+    return ' '.join(prompt.split())
+
+
+class GenerationCache:
+    def __init__(self):
+        # provider -> {'hits': n, 'misses': n, 'bypassed': n}
+        self._counters: Dict[str, Dict[str, int]] = {}
+
+    def _config(self) -> Dict[str, Any]:
+        return settings_module.app_settings.get('generation_cache') or {}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._config().get('enabled'))
+
+    async def make_key(self, provider: str, model: str, prompt: str, aspect_ratio: str,
+                       input_image: Optional[str] = None, count: int = 1,
+                       options: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Cache key of a request. input_image is a file name in FILES_DIR;
+        options are the generator keyword arguments that change the output
+        """
+        input_hash = await media_store.content_hash(input_image) if input_image else None
+        raw = json.dumps([provider, model.strip(), normalize_prompt(prompt), aspect_ratio.strip(),
+                          input_hash, count, options or {}], sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    async def get(self, key: str, provider: str) -> Optional[List[Image]]:
+        """Cached images of a request, as new files, or None on a miss"""
+        since = (datetime.now(timezone.utc) - timedelta(hours=self._ttl_hours())).strftime('%Y-%m-%dT%H:%M:%S')
+        row = await db_service.get_generation_cache(key, since)
+        images = await self._link(json.loads(row['images'])) if row else None
+        if row and images is None:
+            # A blob was collected since the result was cached
+            await db_service.delete_generation_cache(key)
+        self._count(provider, 'hits' if images else 'misses')
+        return images
+
+    def bypass(self, provider: str):
+        """Count a request that asked for a fresh result"""
+        self._count(provider, 'bypassed')
+
+    async def put(self, key: str, provider: str, model: str, images: List[Image]):
+        entries = []
+        for mime_type, width, height, filename in images:
+            alias = await db_service.get_media_alias(filename)
+            if alias is None:
+                # Not in the media store, so it cannot be handed out again safely
+                return
+            entries.append({'mime_type': mime_type, 'width': width, 'height': height,
+                            'extension': filename.rsplit('.', 1)[-1], 'sha256': alias['sha256']})
+        await db_service.put_generation_cache(key, provider, model, json.dumps(entries))
+        cutoff = (datetime.now(timezone.utc) - timedelta(hours=self._ttl_hours())).strftime('%Y-%m-%dT%H:%M:%S')
+        await db_service.prune_generation_cache(cutoff, self._config().get('max_entries', DEFAULT_MAX_ENTRIES))
+
+    async def clear(self):
+        await db_service.delete_generation_cache()
+
+    async def get_stats(self) -> Dict[str, Any]:
+        config = self._config()
+        return {
+            'enabled': self.enabled,
+            'ttl_hours': self._ttl_hours(),
+            'max_entries': config.get('max_entries', DEFAULT_MAX_ENTRIES),
+            'entries': await db_service.count_generation_cache(),
+            'providers': self._counters,
+        }
+
+    def _ttl_hours(self) -> float:
+        return self._config().get('ttl_hours', DEFAULT_TTL_HOURS)
+
+    def _count(self, provider: str, counter: str):
+        counters = self._counters.setdefault(provider, {'hits': 0, 'misses': 0, 'bypassed': 0})
+        counters[counter] += 1
+
+    async def _link(self, entries: List[Dict[str, Any]]) -> Optional[List[Image]]:
+        images = []
+        for entry in entries:
+            filename = f"im_{generate(size=8)}.{entry['extension']}"
+            if not await media_store.link_blob(entry['sha256'], os.path.join(FILES_DIR, filename)):
+                return None
+            images.append((entry['mime_type'], entry['width'], entry['height'], filename))
+        return images
+
+
+generation_cache = GenerationCache()
@@ -0,0 +1,377 @@
+# services/generation_queue.py
+"""
+Persistent queue for image (and other media) generation jobs.
+
+Tools submit a job and await its result instead of calling the provider
+inline. Jobs are stored in generation_jobs before they run, and started
+highest priority first, then oldest first, while both the global cap and
+the job's provider limit have room. A job takes one slot of the limits per
+provider call it makes at a time (see register), capped at its provider's
+and the global limit. When the next job does not fit, no job behind it
+starts, so smaller jobs cannot overtake it. Limits are read from the
+`generation_concurrency` setting on every dispatch, so changing them takes
+effect for the next job.
+
+Status changes are broadcast as `generation_job` session updates over
+socket.io. On startup, queued jobs are resumed; jobs that were running when
+the server stopped are retried up to MAX_ATTEMPTS times and fail after
+that. A resumed job still places its result on the canvas, but the tool
+call that submitted it is gone, so the chat does not get its result.
+
+A job whose every waiter is cancelled (the chat was stopped) is cancelled
+too, so its result does not land on the canvas afterwards.
+"""
+import asyncio
+import itertools
+import json
+import time
+import traceback
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from nanoid import generate
+
+from services import settings_service as settings_module
+from services.canvas_oplog import now_timestamp
+from services.db_service import db_service
+from services.websocket_service import broadcast_session_update
+
+GLOBAL_CONCURRENCY = 8
+PROVIDER_CONCURRENCY = 2
+# Jobs that were running during a restart are retried this many times in total
+MAX_ATTEMPTS = 2
+# Finished jobs older than this are deleted at startup
+JOB_RETENTION_DAYS = 7
+# Finished jobs kept in memory for GET /api/generation/jobs/{id}
+MAX_FINISHED_JOBS = 200
+
+
+class GenerationJobError(Exception):
+    pass
+
+
+class GenerationJob:
+    def __init__(self, id: str, kind: str, provider: str, model: str, params: Dict[str, Any],
+                 canvas_id: Optional[str] = None, session_id: Optional[str] = None, priority: int = 0,
+                 status: str = 'queued', attempts: int = 0, created_at: Optional[str] = None):
+        self.id = id
+        self.kind = kind
+        self.provider = provider
+        self.model = model
+        self.params = params
+        self.canvas_id = canvas_id
+        self.session_id = session_id
+        self.priority = priority
+        self.status = status
+        self.attempts = attempts
+        self.created_at = created_at or now_timestamp()
+        self.progress: Optional[float] = None
+        self.result: Optional[str] = None
+        self.error: Optional[str] = None
+        self.queued_at = time.monotonic()
+        self.finished_at: Optional[float] = None
+        self.cancel_requested = False
+
+    @classmethod
+    def from_row(cls, row: Dict[str, Any]) -> 'GenerationJob':
+        return cls(row['id'], row['kind'], row['provider'], row['model'], json.loads(row['params']),
+                   row['canvas_id'], row['session_id'], row['priority'], row['status'], row['attempts'],
+                   row['created_at'])
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'job_id': self.id,
+            'kind': self.kind,
+            'provider': self.provider,
+            'model': self.model,
+            'canvas_id': self.canvas_id,
+            'session_id': self.session_id,
+            'priority': self.priority,
+            'status': self.status,
+            'progress': self.progress,
+            'attempts': self.attempts,
+            'result': self.result,
+            'error': self.error,
+            'created_at': self.created_at,
+        }
+
+
+Runner = Callable[[GenerationJob], Awaitable[str]]
+# Provider calls a job makes at a time
+Slots = Callable[[GenerationJob], int]
+
+
+class GenerationQueue:
+    def __init__(self):
+        self._runners: Dict[str, Runner] = {}
+        self._slots: Dict[str, Slots] = {}
+        self._jobs: Dict[str, GenerationJob] = {}
+        self._queued: List[GenerationJob] = []
+        self._running: Dict[str, asyncio.Task] = {}
+        self._waiters: Dict[str, asyncio.Future] = {}
+        # job id -> number of wait() calls waiting for it
+        self._waiter_counts: Dict[str, int] = {}
+        self._order: Dict[str, int] = {}
+        self._seq = itertools.count()
+        # Seconds from submission to start, of recently started jobs
+        self._wait_times = deque(maxlen=100)
+        self.started = False
+
+    def register(self, kind: str, runner: Runner, slots: Optional[Slots] = None):
+        """
+        Set the coroutine that runs jobs of a kind. slots tells how many
+        provider calls a job runs at a time, when that is more than one
+        """
+        self._runners[kind] = runner
+        if slots is not None:
+            self._slots[kind] = slots
+
+    async def start(self):
+        """Resume the jobs left by the previous run"""
+        if self.started:
+            return
+        self.started = True
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=JOB_RETENTION_DAYS)).strftime('%Y-%m-%dT%H:%M:%S')
+        await db_service.prune_generation_jobs(cutoff)
+        resumed = 0
+        for row in await db_service.list_generation_jobs(['queued', 'running']):
+            job = GenerationJob.from_row(row)
+            if job.status == 'running' and job.attempts >= MAX_ATTEMPTS:
+                job.error = 'Interrupted by a server restart'
+                await self._finish(job, 'failed')
+                continue
+            if job.status == 'running':
+                job.status = 'queued'
+                await db_service.update_generation_job(job.id, status='queued')
+            self._add(job)
+            resumed += 1
+        if resumed:
+            print(f"🎨 Resuming {resumed} generation jobs")
+        self._dispatch()
+
+    async def stop(self):
+        """Stop running jobs; they are retried on the next start"""
+        self.started = False
+        tasks = list(self._running.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._running.clear()
+        for future in self._waiters.values():
+            if not future.done():
+                future.set_exception(GenerationJobError('Server stopped, the job resumes on the next start'))
+        self._waiters.clear()
+        self._waiter_counts.clear()
+
+    async def submit(self, kind: str, provider: str, model: str, params: Dict[str, Any],
+                     canvas_id: Optional[str] = None, session_id: Optional[str] = None,
+                     priority: int = 0) -> GenerationJob:
+        """Queue a job. params must be JSON serializable"""
+        job = GenerationJob('gen_' + generate(size=10), kind, provider, model, params,
+                            canvas_id, session_id, priority)
+        await db_service.create_generation_job(job.id, kind, provider, model, json.dumps(params),
+                                               canvas_id, session_id, priority)
+        self._add(job)
+        await self._emit(job)
+        self._dispatch()
+        return job
+
+    async def wait(self, job_id: str) -> str:
+        """Result of a job, raising GenerationJobError if it failed or was cancelled"""
+        job = self._jobs.get(job_id)
+        if job is None:
+            raise GenerationJobError(f'Unknown generation job {job_id}')
+        if job.status not in ('done', 'failed', 'cancelled'):
+            future = self._waiters.setdefault(job_id, asyncio.get_running_loop().create_future())
+            self._waiter_counts[job_id] = self._waiter_counts.get(job_id, 0) + 1
+            try:
+                # Shielded so that one cancelled waiter does not resolve the others
+                await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if self._release_waiter(job_id) == 0 and self.started and not future.done():
+                    print(f"🎨 Cancelling generation job {job_id}, nothing waits for it anymore")
+                    asyncio.ensure_future(self.cancel(job_id))
+                raise
+            self._release_waiter(job_id)
+        if job.status != 'done':
+            raise GenerationJobError(job.error or f'Generation job {job.status}')
+        return job.result
+
+    def _release_waiter(self, job_id: str) -> int:
+        """Count a wait() call that stopped waiting, returning how many are left"""
+        remaining = self._waiter_counts.get(job_id, 0) - 1
+        if remaining > 0:
+            self._waiter_counts[job_id] = remaining
+            return remaining
+        self._waiter_counts.pop(job_id, None)
+        future = self._waiters.get(job_id)
+        if future is not None and not future.done():
+            self._waiters.pop(job_id)
+        return 0
+
+    async def run(self, kind: str, provider: str, model: str, params: Dict[str, Any], **kwargs) -> str:
+        """Submit a job and wait for its result"""
+        job = await self.submit(kind, provider, model, params, **kwargs)
+        return await self.wait(job.id)
+
+    async def cancel(self, job_id: str) -> Optional[GenerationJob]:
+        job = self._jobs.get(job_id)
+        if job is None or job.status in ('done', 'failed', 'cancelled'):
+            return job
+        job.cancel_requested = True
+        job.error = 'Cancelled'
+        if job.status == 'queued':
+            self._queued.remove(job)
+            await self._finish(job, 'cancelled')
+        elif job_id in self._running:
+            self._running[job_id].cancel()
+        return job
+
+    def set_progress(self, job_id: str, progress: float):
+        """Report the progress (0 to 1) of a running job"""
+        job = self._jobs.get(job_id)
+        if job is None or job.status != 'running':
+            return
+        job.progress = round(max(0.0, min(1.0, progress)), 4)
+        asyncio.ensure_future(self._emit(job))
+
+    def get_job(self, job_id: str) -> Optional[GenerationJob]:
+        return self._jobs.get(job_id)
+
+    def _limits(self) -> Dict[str, int]:
+        return settings_module.app_settings.get('generation_concurrency') or {}
+
+    def provider_limit(self, provider: str) -> int:
+        limits = self._limits()
+        return limits.get(provider, limits.get('default', PROVIDER_CONCURRENCY))
+
+    def job_slots(self, job: GenerationJob) -> int:
+        """Slots of the limits a job takes while running, at most its provider's and the global limit"""
+        slots = self._slots[job.kind](job) if job.kind in self._slots else 1
+        global_limit = self._limits().get('global', GLOBAL_CONCURRENCY)
+        return max(1, min(slots, self.provider_limit(job.provider), global_limit))
+
+    def _add(self, job: GenerationJob):
+        self._jobs[job.id] = job
+        self._order[job.id] = next(self._seq)
+        self._queued.append(job)
+        finished = [j for j in self._jobs.values() if j.finished_at is not None]
+        for old in sorted(finished, key=lambda j: j.finished_at)[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            self._jobs.pop(old.id, None)
+            self._order.pop(old.id, None)
+
+    def _dispatch(self):
+        if not self.started:
+            return
+        global_limit = self._limits().get('global', GLOBAL_CONCURRENCY)
+        running = 0
+        running_by_provider: Dict[str, int] = {}
+        for job_id in self._running:
+            job = self._jobs[job_id]
+            slots = self.job_slots(job)
+            running += slots
+            running_by_provider[job.provider] = running_by_provider.get(job.provider, 0) + slots
+        # Providers whose next job does not fit; later jobs must not overtake it
+        waiting = set()
+        self._queued.sort(key=lambda j: (-j.priority, self._order[j.id]))
+        for job in list(self._queued):
+            slots = self.job_slots(job)
+            # The next job in priority order waits for room, smaller ones behind it too
+            if running + slots > global_limit:
+                break
+            provider_running = running_by_provider.get(job.provider, 0)
+            if job.provider in waiting or provider_running + slots > self.provider_limit(job.provider):
+                waiting.add(job.provider)
+                continue
+            self._queued.remove(job)
+            running += slots
+            running_by_provider[job.provider] = provider_running + slots
+            self._running[job.id] = asyncio.create_task(self._run_job(job))
+
+    async def _run_job(self, job: GenerationJob):
+        self._wait_times.append(time.monotonic() - job.queued_at)
+        job.status = 'running'
+        job.attempts += 1
+        job.progress = 0.0
+        try:
+            await db_service.update_generation_job(job.id, status='running', attempts=job.attempts,
+                                                   started_at=now_timestamp())
+            await self._emit(job)
+            runner = self._runners.get(job.kind)
+            if runner is None:
+                raise GenerationJobError(f'No runner for {job.kind} generation jobs')
+            job.result = await runner(job)
+            job.progress = 1.0
+            status = 'done'
+        except asyncio.CancelledError:
+            if not job.cancel_requested:
+                # Shutting down: left as running in the database, retried on the next start
+                self._running.pop(job.id, None)
+                raise
+            status = 'cancelled'
+        except Exception as e:
+            print(f"Error running generation job {job.id}: {e}")
+            traceback.print_exc()
+            job.error = str(e)
+            status = 'failed'
+        self._running.pop(job.id, None)
+        try:
+            await self._finish(job, status)
+        except Exception as e:
+            print(f"Error finishing generation job {job.id}: {e}")
+        finally:
+            # Start the next job even if recording this one failed
+            self._dispatch()
+
+    async def _finish(self, job: GenerationJob, status: str):
+        job.status = status
+        job.finished_at = time.monotonic()
+        self._jobs[job.id] = job
+        try:
+            await db_service.update_generation_job(job.id, status=status, result=job.result, error=job.error,
+                                                   finished_at=now_timestamp())
+        finally:
+            future = self._waiters.pop(job.id, None)
+            self._waiter_counts.pop(job.id, None)
+            if future is not None and not future.done():
+                future.set_result(None)
+        await self._emit(job)
+
+    async def _emit(self, job: GenerationJob):
+        if not job.session_id:
+            return
+        event = {'type': 'generation_job', **job.to_dict()}
+        if job.status == 'queued' and job in self._queued:
+            event['queue_position'] = self._queued.index(job) + 1
+        try:
+            await broadcast_session_update(job.session_id, job.canvas_id, event)
+        except Exception as e:
+            print(f"Error sending generation job update: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        limits = self._limits()
+        providers: Dict[str, Dict[str, int]] = {}
+        for job in self._queued:
+            providers.setdefault(job.provider, {'queued': 0, 'running': 0, 'slots': 0})['queued'] += 1
+        for job_id in self._running:
+            job = self._jobs[job_id]
+            counts = providers.setdefault(job.provider, {'queued': 0, 'running': 0, 'slots': 0})
+            counts['running'] += 1
+            counts['slots'] += self.job_slots(job)
+        for provider, counts in providers.items():
+            counts['limit'] = self.provider_limit(provider)
+        now = time.monotonic()
+        waits = list(self._wait_times)
+        return {
+            'queued': len(self._queued),
+            'running': len(self._running),
+            'global_limit': limits.get('global', GLOBAL_CONCURRENCY),
+            'providers': providers,
+            'oldest_queued_seconds': round(max((now - j.queued_at for j in self._queued), default=0), 2),
+            'avg_wait_seconds': round(sum(waits) / len(waits), 2) if waits else None,
+            'max_wait_seconds': round(max(waits), 2) if waits else None,
+        }
+
+
+generation_queue = GenerationQueue()
@@ -0,0 +1,128 @@
+# services/image_variants.py
+"""
+Resized and re-encoded variants of the images in FILES_DIR.
+
+GET /api/file/<name>?w=&h=&fmt=&q= renders a variant that fits in w x h
+(never upscaled) in the requested format, or in the best format the client
+accepts (AVIF, then WebP) when fmt is not given. Rendering runs in the shared
+compute pool's worker processes so Pillow never blocks the event loop, and
+concurrent requests for the same variant render it once.
+
+Variants are cached in VARIANTS_DIR under a name derived from the source
+content (its media store hash when it has one, so every alias of a blob
+shares its variants) and the parameters. The cache is trimmed least
+recently used first to CACHE_MAX_BYTES; a changed source gets a new name,
+so stale variants just age out.
+"""
+import asyncio
+import hashlib
+import os
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from PIL import Image
+
+from services.compute_pool import compute_pool
+from services.config_service import USER_DATA_DIR
+from services.media_workers import FORMATS, MAX_DIMENSION, render_variant
+
+VARIANTS_DIR = os.path.join(USER_DATA_DIR, "variants")
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+DEFAULT_QUALITY = 80
+# Formats of source files that can be resized
+SOURCE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'webp', 'gif', 'bmp', 'avif'}
+
+
+def can_save(fmt: str) -> bool:
+    Image.init()
+    return FORMATS[fmt][0] in Image.SAVE
+
+
+def negotiate_format(accept: Optional[str], source_extension: str) -> str:
+    """Best format for an Accept header, keeping the source format for clients that accept neither AVIF nor WebP"""
+    accept = accept or ''
+    for fmt in ('avif', 'webp'):
+        if f'image/{fmt}' in accept and can_save(fmt):
+            return fmt
+    return 'jpeg' if source_extension in ('jpg', 'jpeg') else 'png'
+
+
+class ImageVariantCache:
+    def __init__(self, max_bytes: int = CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: Optional["OrderedDict[str, int]"] = None
+        self._bytes = 0
+        self._rendering: Dict[str, asyncio.Future] = {}
+
+    def _load(self):
+        """Index the variants left by earlier runs, oldest access first"""
+        os.makedirs(VARIANTS_DIR, exist_ok=True)
+        entries = []
+        with os.scandir(VARIANTS_DIR) as it:
+            for entry in it:
+                if entry.is_file() and not entry.name.endswith('.tmp'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, entry.name, stat.st_size))
+        self._entries = OrderedDict((name, size) for _, name, size in sorted(entries))
+        self._bytes = sum(self._entries.values())
+
+    async def get_variant(self, src_path: str, width: Optional[int], height: Optional[int],
+                          fmt: str, quality: int, content_hash: Optional[str] = None) -> Tuple[str, str]:
+        """Path and media type of a variant, rendering it on a cache miss"""
+        if self._entries is None:
+            await asyncio.to_thread(self._load)
+        if content_hash is None:
+            stat = os.stat(src_path)
+            content_hash = f"{os.path.basename(src_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+        key = hashlib.sha256(f"{content_hash}:{width}:{height}:{quality}".encode()).hexdigest()[:32]
+        name = f"{key}.{fmt}"
+        path = os.path.join(VARIANTS_DIR, name)
+        media_type = FORMATS[fmt][1]
+
+        if name in self._entries:
+            self.hits += 1
+            self._entries.move_to_end(name)
+            # Recency survives a restart through the modification time
+            os.utime(path)
+            return path, media_type
+
+        future = self._rendering.get(name)
+        if future is None:
+            self.misses += 1
+            future = asyncio.ensure_future(
+                compute_pool.resize(render_variant, src_path, path, width, height, fmt, quality))
+            self._rendering[name] = future
+            future.add_done_callback(lambda _: self._rendering.pop(name, None))
+        size = await asyncio.shield(future)
+        if name not in self._entries:
+            self._entries[name] = size
+            self._bytes += size
+            self._evict()
+        return path, media_type
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            name, size = self._entries.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(os.path.join(VARIANTS_DIR, name))
+            except FileNotFoundError:
+                pass
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            'entries': len(self._entries or {}),
+            'bytes': self._bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'rendering': len(self._rendering),
+        }
+
+
+image_variant_cache = ImageVariantCache()
@@ -11,7 +11,7 @@ langgraph_service.py
 
 依赖模块：
 - langgraph, langchain_core, langchain_openai, langchain_ollama
-- services.db_service
+- services.message_buffer
 - services.config_service
 - routers.websocket
 - routers.image_tools
@@ -25,8 +25,8 @@ import json
 import traceback
 from langchain_core.messages import AIMessageChunk, ToolCall, convert_to_openai_messages, ToolMessage
 from langgraph.prebuilt import create_react_agent
-from services.db_service import db_service
 from services.config_service import config_service
+from services.message_buffer import message_write_buffer
 from services.websocket_service import send_to_websocket
 from tools.image_generators import generate_image
 from langchain_ollama import ChatOllama
@@ -62,9 +62,9 @@ async def langgraph_agent(messages, canvas_id, session_id, text_model, image_mod
                 base_url=url,
             )
         else:
-            # Create httpx client with SSL configuration for ChatOpenAI
-            http_client = HttpClient.create_sync_client(timeout=15)
-            http_async_client = HttpClient.create_async_client(timeout=15)
+            # Shared pooled httpx clients with SSL configuration for ChatOpenAI
+            http_client = HttpClient.get_sync_client(url, timeout=15)
+            http_async_client = HttpClient.get_async_client(url, timeout=15)
             model = ChatOpenAI(
                 model=model,
                 api_key=api_key,
@@ -106,8 +106,10 @@ async def langgraph_agent(messages, canvas_id, session_id, text_model, image_mod
                     'type': 'all_messages',
                     'messages': messages
                 })
-                for new_message in oai_messages:
-                    await db_service.create_message(session_id, new_message.get('role', 'user'), json.dumps(new_message)) if len(messages) > 0 else None
+                if len(messages) > 0:
+                    for new_message in oai_messages:
+                        message_write_buffer.add(session_id, new_message.get('role', 'user'), json.dumps(new_message))
+                    message_write_buffer.schedule_flush(session_id)
             else:
                 # Access the AIMessageChunk
                 ai_message_chunk: AIMessageChunk = chunk[1][0]
@@ -226,9 +228,9 @@ async def langgraph_multi_agent(messages, canvas_id, session_id, text_model, ima
                 base_url=url,
             )
         else:
-            # Create httpx client with SSL configuration for ChatOpenAI
-            http_client = HttpClient.create_sync_client(timeout=15)
-            http_async_client = HttpClient.create_async_client(timeout=15)
+            # Shared pooled httpx clients with SSL configuration for ChatOpenAI
+            http_client = HttpClient.get_sync_client(url, timeout=15)
+            http_async_client = HttpClient.get_async_client(url, timeout=15)
             model = ChatOpenAI(
                 model=model,
                 api_key=api_key,
@@ -361,10 +363,13 @@ async def langgraph_multi_agent(messages, canvas_id, session_id, text_model, ima
                         'type': 'all_messages',
                         'messages': oai_messages
                     })
-                for i in range(last_saved_message_index + 1, len(oai_messages)):
-                    new_message = oai_messages[i]
-                    await db_service.create_message(session_id, new_message.get('role', 'user'), json.dumps(new_message)) if len(messages) > 0 else None
-                    last_saved_message_index = i
+                if len(messages) > 0:
+                    for i in range(last_saved_message_index + 1, len(oai_messages)):
+                        new_message = oai_messages[i]
+                        message_write_buffer.add(session_id, new_message.get('role', 'user'), json.dumps(new_message))
+                        last_saved_message_index = i
+                    # persist this graph step off the streaming path
+                    message_write_buffer.schedule_flush(session_id)
             else:
                 # Access the AIMessageChunk
                 ai_message_chunk: AIMessageChunk = chunk[1][0]
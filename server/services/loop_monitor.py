@@ -0,0 +1,131 @@
+# services/loop_monitor.py
+"""
+Detects blocking calls on the event loop.
+
+A heartbeat task stamps the time every HEARTBEAT_SECONDS. A watchdog thread
+checks the stamp; when the loop has not come back to the heartbeat for
+BLOCK_THRESHOLD_SECONDS, something is running on the loop without awaiting
+(a synchronous SDK call, file read, CPU-bound work). The watchdog then
+captures the loop thread's stack, which ends at the blocking call, and
+prints the innermost frame of the server's own code once per block. Recent
+blocks, with their duration and stack, are kept for
+GET /api/diagnostics/event_loop.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+HEARTBEAT_SECONDS = 0.1
+BLOCK_THRESHOLD_SECONDS = 0.25
+# Innermost stack frames kept for a block
+STACK_DEPTH = 12
+MAX_RECORDED_BLOCKS = 20
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class LoopMonitor:
+    def __init__(self, threshold: float = BLOCK_THRESHOLD_SECONDS, interval: float = HEARTBEAT_SECONDS):
+        self.threshold = threshold
+        self.interval = interval
+        self.blocks = 0
+        self.blocked_seconds = 0.0
+        self.max_block_seconds = 0.0
+        self._recent = deque(maxlen=MAX_RECORDED_BLOCKS)
+        self._beat = 0.0
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stopping.clear()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name='loop-monitor', daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._stopping.set()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        await asyncio.to_thread(self._thread.join)
+        self._task = None
+        self._thread = None
+
+    async def _heartbeat(self):
+        while True:
+            self._beat = time.monotonic()
+            await asyncio.sleep(self.interval)
+
+    def _watch(self):
+        block: Optional[Dict[str, Any]] = None
+        beat = self._beat
+        while not self._stopping.wait(self.interval / 2):
+            if self._beat != beat:
+                # The loop is running again
+                if block is not None:
+                    self._end_block(block)
+                    block = None
+                beat = self._beat
+                continue
+            stalled = time.monotonic() - beat - self.interval
+            if stalled < self.threshold:
+                continue
+            if block is None:
+                stack = self._capture_stack()
+                block = {
+                    'started_at': datetime.now(timezone.utc).isoformat(),
+                    'origin': _origin(stack),
+                    'stack': traceback.format_list(stack[-STACK_DEPTH:]),
+                }
+                print(f"⚠️ Event loop blocked for over {self.threshold}s at {block['origin']}")
+            block['seconds'] = round(stalled, 3)
+
+    def _capture_stack(self) -> traceback.StackSummary:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return traceback.StackSummary()
+        return traceback.extract_stack(frame)
+
+    def _end_block(self, block: Dict[str, Any]):
+        self.blocks += 1
+        self.blocked_seconds += block['seconds']
+        self.max_block_seconds = max(self.max_block_seconds, block['seconds'])
+        self._recent.append(block)
+        print(f"⚠️ Event loop was blocked for {block['seconds']}s at {block['origin']}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'running': self._task is not None,
+            'threshold_seconds': self.threshold,
+            'blocks': self.blocks,
+            'blocked_seconds': round(self.blocked_seconds, 3),
+            'max_block_seconds': self.max_block_seconds,
+            'recent': list(self._recent),
+        }
+
+
+def _origin(stack: traceback.StackSummary) -> Optional[str]:
+    """The innermost frame in the server's own code, which made the blocking call"""
+    for frame in reversed(stack):
+        if frame.filename.startswith(SERVER_DIR) and 'site-packages' not in frame.filename:
+            return f"{os.path.relpath(frame.filename, SERVER_DIR)}:{frame.lineno} in {frame.name}"
+    return f"{stack[-1].filename}:{stack[-1].lineno} in {stack[-1].name}" if stack else None
+
+
+loop_monitor = LoopMonitor()
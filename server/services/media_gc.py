@@ -0,0 +1,343 @@
+# services/media_gc.py
+"""
+Mark-and-sweep garbage collection of FILES_DIR.
+
+Mark: stream every canvas document, past snapshot and op log entry, and
+every chat message, to build the set of live file names:
+- files of image/video elements that are not deleted, in the current
+  document or anywhere in the retained history (so time travel still works)
+- anything a chat message mentions
+
+Sweep: remove the files in FILES_DIR that are not live and are older than
+the grace period, which protects generations still being written. Database
+reads pause between chunks and deletions are rate limited so a collection
+can run on a live server. Media store blobs that no file name links to any
+more are removed in the same pass, in batches: the media_aliases,
+media_sources and provider_uploads rows of a batch are deleted first, then
+the blob files, outside the database writer. A blob left behind between
+the two steps is collected by the next pass. Stored canvas thumbnails no
+canvas row or pending save uses, left behind by newer saves and deleted
+canvases, are swept with the same grace period. With dry_run nothing is
+deleted, the report lists what would be.
+
+Run from the server directory with `python -m services.media_gc [--delete]`
+or through POST /api/database/media_gc.
+"""
+import asyncio
+import json
+import os
+import time
+import traceback
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from services.config_service import FILES_DIR
+from services.db_service import db_service
+from services.media_refs import FILE_URL_RE, extract_file_refs, get_file_path
+from services.media_store import BLOBS_DIR, get_blob_path
+from services.thumbnail_store import THUMBNAILS_DIR, get_thumbnail_path
+
+DEFAULT_GRACE_HOURS = 24
+# Pause after each chunk of rows read while marking
+READ_PAUSE_SECONDS = 0.01
+MAX_DELETES_PER_SECOND = 50
+# Blobs whose rows are deleted per database transaction
+BLOB_SWEEP_BATCH_SIZE = 50
+# Unreferenced file names listed in the report
+REPORT_SAMPLE_SIZE = 50
+
+
+class MediaMarker:
+    """Accumulates the file ids used by canvas elements and where each file id points"""
+
+    def __init__(self):
+        self.used_file_ids: Set[str] = set()
+        self.file_names: Dict[str, Set[str]] = {}
+        self.message_refs: Set[str] = set()
+
+    def mark_document(self, doc: Any):
+        if not isinstance(doc, dict):
+            return
+        for element in doc.get('elements') or []:
+            self.mark_element(element)
+        for file_id, file in (doc.get('files') or {}).items():
+            self.mark_file(file_id, file)
+
+    def mark_element(self, element: Any):
+        if isinstance(element, dict) and element.get('fileId') and not element.get('isDeleted'):
+            self.used_file_ids.add(element['fileId'])
+
+    def mark_file(self, file_id: str, file: Any):
+        if not isinstance(file, dict) or not isinstance(file.get('dataURL'), str):
+            return
+        names = FILE_URL_RE.findall(file['dataURL'])
+        if names:
+            self.file_names.setdefault(file_id, set()).update(names)
+
+    def mark_message(self, text: Optional[str]):
+        self.message_refs |= extract_file_refs(text)
+
+    def live_names(self) -> Set[str]:
+        live = set(self.message_refs)
+        for file_id in self.used_file_ids:
+            live |= self.file_names.get(file_id, set())
+        return live
+
+
+class MediaGarbageCollector:
+    def __init__(self, grace_hours: float = DEFAULT_GRACE_HOURS, read_pause: float = READ_PAUSE_SECONDS,
+                 max_deletes_per_second: float = MAX_DELETES_PER_SECOND):
+        self.grace_hours = grace_hours
+        self.read_pause = read_pause
+        self.max_deletes_per_second = max_deletes_per_second
+        self.last_report: Optional[Dict[str, Any]] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, dry_run: bool = True, grace_hours: Optional[float] = None) -> bool:
+        """Run a collection in the background. False if one is already running"""
+        if self.running:
+            return False
+        self._task = asyncio.create_task(self._run_logged(dry_run, grace_hours))
+        return True
+
+    async def stop(self):
+        if self.running:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    async def _run_logged(self, dry_run: bool, grace_hours: Optional[float]):
+        try:
+            await self.collect(dry_run, grace_hours)
+        except Exception as e:
+            print(f"Error collecting orphaned media: {e}")
+            traceback.print_exc()
+            self.last_report = {'status': 'failed', 'error': str(e), 'dry_run': dry_run}
+
+    async def collect(self, dry_run: bool = True, grace_hours: Optional[float] = None) -> Dict[str, Any]:
+        grace_hours = self.grace_hours if grace_hours is None else grace_hours
+        started = time.perf_counter()
+        report: Dict[str, Any] = {
+            'status': 'running',
+            'dry_run': dry_run,
+            'grace_hours': grace_hours,
+            'started_at': datetime.now(timezone.utc).isoformat(),
+        }
+        self.last_report = report
+
+        # List files first: anything written after this point is not a
+        # candidate, so it cannot be swept while its reference is being saved
+        cutoff = time.time() - grace_hours * 3600
+        files = await asyncio.to_thread(_list_files, cutoff)
+        report['scanned_files'] = files['scanned']
+        report['recent_files'] = files['recent']
+
+        live = await self.mark()
+        report['live_files'] = len(live)
+
+        garbage = [(name, size) for name, size in files['candidates'] if name not in live]
+        report['unreferenced_files'] = len(garbage)
+        report['unreferenced_bytes'] = sum(size for _, size in garbage)
+        report['sample'] = [name for name, _ in garbage[:REPORT_SAMPLE_SIZE]]
+
+        deleted, reclaimed = [], 0
+        interval = 1 / self.max_deletes_per_second if self.max_deletes_per_second else 0
+        if not dry_run:
+            for name, _ in garbage:
+                freed = await asyncio.to_thread(_remove_if_unchanged, name, cutoff)
+                if freed is not None:
+                    deleted.append(name)
+                    reclaimed += freed
+                if interval:
+                    await asyncio.sleep(interval)
+            if deleted:
+                await db_service.delete_media_aliases(deleted)
+        report['deleted_files'] = len(deleted)
+
+        # Blobs are listed after the sweep, so files removed above free theirs
+        blobs = await asyncio.to_thread(_list_unlinked_blobs, cutoff)
+        report['unlinked_blobs'] = len(blobs)
+        report['unlinked_blob_bytes'] = sum(size for _, size in blobs)
+        deleted_blobs = []
+        if not dry_run:
+            for i in range(0, len(blobs), BLOB_SWEEP_BATCH_SIZE):
+                batch = [sha256 for sha256, _ in blobs[i:i + BLOB_SWEEP_BATCH_SIZE]]
+                await db_service.delete_media_blobs(batch)
+                for sha256 in batch:
+                    # Still checked: a blob linked again since it was listed is kept
+                    freed = await asyncio.to_thread(_remove_blob_if_unlinked, sha256, cutoff)
+                    if freed is not None:
+                        deleted_blobs.append(sha256)
+                        reclaimed += freed
+                    if interval:
+                        await asyncio.sleep(interval)
+        report['deleted_blobs'] = len(deleted_blobs)
+
+        # Listed before the live hashes are read, like the files above
+        thumbnails = await asyncio.to_thread(_list_thumbnails, cutoff)
+        live_thumbnails = await db_service.list_thumbnail_hashes()
+        thumbnails = [(h, size) for h, size in thumbnails if h not in live_thumbnails]
+        report['unreferenced_thumbnails'] = len(thumbnails)
+        deleted_thumbnails = []
+        if not dry_run:
+            for thumbnail_hash, _ in thumbnails:
+                freed = await asyncio.to_thread(_remove_thumbnail_if_unchanged, thumbnail_hash, cutoff)
+                if freed is not None:
+                    deleted_thumbnails.append(thumbnail_hash)
+                    reclaimed += freed
+                if interval:
+                    await asyncio.sleep(interval)
+        report['deleted_thumbnails'] = len(deleted_thumbnails)
+        report['bytes_reclaimed'] = reclaimed
+        report['duration_ms'] = round((time.perf_counter() - started) * 1000, 2)
+        report['status'] = 'done'
+        if deleted or deleted_blobs or deleted_thumbnails:
+            print(f"🧹 Removed {len(deleted)} orphaned media files, {len(deleted_blobs)} blobs and "
+                  f"{len(deleted_thumbnails)} thumbnails ({reclaimed // 1024} KB)")
+        return report
+
+    async def mark(self) -> Set[str]:
+        """Names of every file a canvas element or chat message uses"""
+        marker = MediaMarker()
+        async for chunk in db_service.iter_canvas_media_chunks():
+            for kind, key, text in chunk:
+                try:
+                    value = json.loads(text) if text else None
+                except Exception:
+                    continue
+                if kind == 'document':
+                    marker.mark_document(value)
+                elif kind == 'upsert':
+                    marker.mark_element(value)
+                elif kind == 'file':
+                    marker.mark_file(key, value)
+            await asyncio.sleep(self.read_pause)
+        async for chunk in db_service.iter_message_chunks():
+            for text in chunk:
+                marker.mark_message(text)
+            await asyncio.sleep(self.read_pause)
+        return marker.live_names()
+
+    def get_status(self) -> Dict[str, Any]:
+        return {'running': self.running, 'last_report': self.last_report}
+
+
+def _list_files(cutoff: float) -> Dict[str, Any]:
+    scanned, recent, candidates = 0, 0, []
+    if not os.path.isdir(FILES_DIR):
+        return {'scanned': 0, 'recent': 0, 'candidates': []}
+    with os.scandir(FILES_DIR) as entries:
+        for entry in entries:
+            if not entry.is_file(follow_symlinks=False):
+                continue
+            scanned += 1
+            stat = entry.stat(follow_symlinks=False)
+            if stat.st_mtime > cutoff:
+                recent += 1
+                continue
+            candidates.append((entry.name, stat.st_size))
+    return {'scanned': scanned, 'recent': recent, 'candidates': candidates}
+
+
+def _remove_if_unchanged(name: str, cutoff: float) -> Optional[int]:
+    """Remove a candidate unless it was rewritten since it was listed. Returns bytes freed"""
+    path = get_file_path(name)
+    if path is None:
+        return None
+    try:
+        stat = os.stat(path)
+        if stat.st_mtime > cutoff:
+            return None
+        os.remove(path)
+        # Removing one of several links to a media store blob frees nothing yet
+        return stat.st_size if stat.st_nlink <= 1 else 0
+    except FileNotFoundError:
+        return None
+
+
+def _list_unlinked_blobs(cutoff: float) -> List[Tuple[str, int]]:
+    """(sha256, size) of media blobs no file name links to any more"""
+    blobs = []
+    if not os.path.isdir(BLOBS_DIR):
+        return blobs
+    for prefix in os.scandir(BLOBS_DIR):
+        if not prefix.is_dir(follow_symlinks=False):
+            continue
+        with os.scandir(prefix.path) as entries:
+            for entry in entries:
+                if get_blob_path(entry.name) is None:
+                    continue
+                stat = os.stat(entry.path)
+                if stat.st_nlink <= 1 and stat.st_mtime <= cutoff:
+                    blobs.append((entry.name, stat.st_size))
+    return blobs
+
+
+def _remove_blob_if_unlinked(sha256: str, cutoff: float) -> Optional[int]:
+    path = get_blob_path(sha256)
+    try:
+        stat = os.stat(path)
+        if stat.st_nlink > 1 or stat.st_mtime > cutoff:
+            return None
+        os.remove(path)
+        return stat.st_size
+    except FileNotFoundError:
+        return None
+
+
+def _list_thumbnails(cutoff: float) -> List[Tuple[str, int]]:
+    """(hash, size) of stored thumbnails older than the cutoff"""
+    thumbnails = []
+    if not os.path.isdir(THUMBNAILS_DIR):
+        return thumbnails
+    with os.scandir(THUMBNAILS_DIR) as entries:
+        for entry in entries:
+            if get_thumbnail_path(entry.name) is None or not entry.is_file(follow_symlinks=False):
+                continue
+            stat = entry.stat(follow_symlinks=False)
+            if stat.st_mtime <= cutoff:
+                thumbnails.append((entry.name, stat.st_size))
+    return thumbnails
+
+
+def _remove_thumbnail_if_unchanged(thumbnail_hash: str, cutoff: float) -> Optional[int]:
+    """Remove a thumbnail unless a save stored it again since it was listed"""
+    path = get_thumbnail_path(thumbnail_hash)
+    try:
+        stat = os.stat(path)
+        if stat.st_mtime > cutoff:
+            return None
+        os.remove(path)
+        return stat.st_size
+    except FileNotFoundError:
+        return None
+
+
+media_gc = MediaGarbageCollector()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Remove files in FILES_DIR that no canvas or message uses')
+    parser.add_argument('--delete', action='store_true', help='Delete the files (default is a dry run)')
+    parser.add_argument('--grace-hours', type=float, default=DEFAULT_GRACE_HOURS,
+                        help='Only consider files older than this')
+    args = parser.parse_args()
+
+    async def main():
+        await db_service.start()
+        try:
+            report = await media_gc.collect(dry_run=not args.delete, grace_hours=args.grace_hours)
+        finally:
+            await db_service.close()
+        print(json.dumps(report, indent=2))
+
+    asyncio.run(main())
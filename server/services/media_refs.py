@@ -0,0 +1,30 @@
+# services/media_refs.py
+"""
+Find the FILES_DIR files a canvas document or chat message refers to.
+
+Canvases reference files through the `dataURL` of their excalidraw files map
+(/api/file/<name>); messages mention them as image/video ids
+(`![image_id: im_xxx.png](...)`, `input_image` tool arguments) or URLs.
+"""
+import os
+import re
+from typing import Optional, Set
+
+from services.config_service import FILES_DIR
+
+FILE_URL_RE = re.compile(r'/api/file/([\w.\-]+)')
+FILE_NAME_RE = re.compile(r'(?<![\w\-])((?:im|vi)_[\w\-]+\.[A-Za-z0-9]+)')
+
+
+def extract_file_refs(text: Optional[str]) -> Set[str]:
+    """Names of the files referenced in a stored canvas or message JSON text"""
+    if not text:
+        return set()
+    return set(FILE_URL_RE.findall(text)) | set(FILE_NAME_RE.findall(text))
+
+
+def get_file_path(name: str) -> Optional[str]:
+    """Path of a file in FILES_DIR, or None if the name would escape it"""
+    if not name or name != os.path.basename(name) or name.startswith('.'):
+        return None
+    return os.path.join(FILES_DIR, name)
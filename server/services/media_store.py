@@ -0,0 +1,212 @@
+# services/media_store.py
+"""
+Content-addressed store for generated and uploaded media.
+
+Each distinct file content is written once, to FILES_DIR/blobs/<sha256[:2]>/<sha256>.
+The im_xxx.png / vi_xxx.mp4 names handed out to canvases are hard links to
+that blob, recorded in the media_aliases table, so /api/file/<name> and
+everything that opens FILES_DIR/<name> keep working unchanged while a
+repeated asset costs no extra disk. Provider URLs that were already
+downloaded are remembered in media_sources and are linked instead of
+fetched again.
+
+A blob whose only link is its own blobs/ entry is no longer used by any
+name and is removed by the orphaned media collection. On file systems
+without hard links the alias is a copy of the blob.
+
+Files stored before the media store existed can be moved into it with
+`python -m services.media_store --dedupe` (from the server directory).
+"""
+import asyncio
+import hashlib
+import os
+import re
+import shutil
+from typing import Dict, List, Optional, Tuple
+
+from nanoid import generate
+
+from services.config_service import FILES_DIR
+from services.db_service import db_service
+from services.media_refs import get_file_path
+
+BLOBS_DIR = os.path.join(FILES_DIR, "blobs")
+
+_HASH_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+def get_blob_path(sha256: str) -> Optional[str]:
+    """Path of a media blob, or None for a malformed hash"""
+    if not _HASH_RE.match(sha256):
+        return None
+    return os.path.join(BLOBS_DIR, sha256[:2], sha256)
+
+
+class MediaStore:
+    async def store_file(self, temp_path: str, sha256: str, file_path: str):
+        """
+        Move a fully written file into the store, or drop it when a blob with
+        the same content exists, and make file_path an alias of the blob.
+        """
+        size = await asyncio.to_thread(_adopt, temp_path, sha256, file_path)
+        await db_service.add_media_alias(os.path.basename(file_path), sha256, size)
+
+    async def store_bytes(self, content: bytes, file_path: str) -> str:
+        """Store content under file_path, returning its hash"""
+        sha256 = hashlib.sha256(content).hexdigest()
+        if not await self.link_blob(sha256, file_path):
+            temp_path = f"{file_path}.{generate(size=6)}.part"
+            await asyncio.to_thread(_write_file, temp_path, content)
+            await self.store_file(temp_path, sha256, file_path)
+        return sha256
+
+    async def link_blob(self, sha256: str, file_path: str) -> bool:
+        """Make file_path an alias of an existing blob. False if there is no such blob"""
+        size = await asyncio.to_thread(_link_existing, sha256, file_path)
+        if size is None:
+            return False
+        await db_service.add_media_alias(os.path.basename(file_path), sha256, size)
+        return True
+
+    async def alias_file(self, name: str, file_path: str) -> bool:
+        """Make file_path another name for the file `name` in FILES_DIR. False if it is gone"""
+        alias = await db_service.get_media_alias(name)
+        if alias is not None:
+            return await self.link_blob(alias['sha256'], file_path)
+        try:
+            await asyncio.to_thread(_link, os.path.join(FILES_DIR, name), file_path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    async def content_hash(self, name: str) -> Optional[str]:
+        """sha256 of the file `name` in FILES_DIR, from its alias when it has one. None if it is missing"""
+        alias = await db_service.get_media_alias(name)
+        if alias is not None:
+            return alias['sha256']
+        path = get_file_path(name)
+        if path is None:
+            return None
+        try:
+            return await asyncio.to_thread(_hash_file, path)
+        except FileNotFoundError:
+            return None
+
+    async def dedupe_existing(self) -> Dict[str, int]:
+        """Move files stored before the media store existed into it"""
+        names = await asyncio.to_thread(_list_plain_files)
+        moved, bytes_saved = 0, 0
+        for name in names:
+            result = await asyncio.to_thread(_adopt_in_place, os.path.join(FILES_DIR, name))
+            if result is None:
+                continue
+            sha256, size, duplicate = result
+            await db_service.add_media_alias(name, sha256, size)
+            moved += 1
+            if duplicate:
+                bytes_saved += size
+        return {'files': moved, 'bytes_saved': bytes_saved}
+
+
+def _write_file(path: str, content: bytes):
+    with open(path, 'wb') as f:
+        f.write(content)
+
+
+def _adopt(temp_path: str, sha256: str, file_path: str) -> int:
+    blob_path = get_blob_path(sha256)
+    os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+    if os.path.exists(blob_path):
+        os.remove(temp_path)
+    else:
+        os.replace(temp_path, blob_path)
+    _link(blob_path, file_path)
+    return os.path.getsize(blob_path)
+
+
+def _link_existing(sha256: str, file_path: str) -> Optional[int]:
+    blob_path = get_blob_path(sha256)
+    if blob_path is None or not os.path.exists(blob_path):
+        return None
+    try:
+        _link(blob_path, file_path)
+    except FileNotFoundError:
+        # Collected in the meantime
+        return None
+    return os.path.getsize(blob_path)
+
+
+def _link(blob_path: str, file_path: str):
+    temp_path = f"{file_path}.{generate(size=6)}.link"
+    try:
+        os.link(blob_path, temp_path)
+    except OSError:
+        shutil.copyfile(blob_path, temp_path)
+    os.replace(temp_path, file_path)
+    # The inode is shared with older aliases; a fresh mtime keeps the new
+    # name inside the orphaned media collection's grace period
+    os.utime(file_path)
+
+
+def _hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _list_plain_files() -> List[str]:
+    """Media files in FILES_DIR that are not linked to a blob yet"""
+    if not os.path.isdir(FILES_DIR):
+        return []
+    with os.scandir(FILES_DIR) as entries:
+        return [e.name for e in entries
+                if e.is_file(follow_symlinks=False) and not e.name.startswith('.')
+                and os.stat(e.path).st_nlink <= 1]
+
+
+def _adopt_in_place(path: str) -> Optional[Tuple[str, int, bool]]:
+    """Turn an existing file into an alias, returning (sha256, size, whether the blob already existed)"""
+    try:
+        stat = os.stat(path)
+        sha256 = _hash_file(path)
+    except FileNotFoundError:
+        return None
+    blob_path = get_blob_path(sha256)
+    os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+    duplicate = os.path.exists(blob_path)
+    if duplicate:
+        _link(blob_path, path)
+    else:
+        # Linking keeps the file's modification time; a copied blob gets a
+        # fresh one, which only delays its collection
+        try:
+            os.link(path, blob_path)
+        except OSError:
+            shutil.copyfile(path, blob_path)
+    # A duplicate now shares the inode of newer aliases, whose mtime is left
+    # alone so they stay within the orphaned media collection's grace period
+    return sha256, stat.st_size, duplicate
+
+
+media_store = MediaStore()
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description='Content-addressed media store')
+    parser.add_argument('--dedupe', action='store_true', help='Move existing files in FILES_DIR into the store')
+    args = parser.parse_args()
+
+    async def main():
+        await db_service.start()
+        try:
+            if args.dedupe:
+                print(json.dumps(await media_store.dedupe_existing(), indent=2))
+        finally:
+            await db_service.close()
+
+    asyncio.run(main())
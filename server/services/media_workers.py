@@ -0,0 +1,49 @@
+# services/media_workers.py
+"""
+Functions that run in the compute pool's worker processes.
+
+Workers are started with the spawn method and import only this module (and
+what the pickled function needs), so it must stay light: no app services,
+database or settings imports.
+"""
+import os
+import time
+from typing import Callable, Optional, Tuple, TypeVar
+
+from PIL import Image, ImageOps
+
+MAX_DIMENSION = 4096
+
+FORMATS = {
+    'avif': ('AVIF', 'image/avif'),
+    'webp': ('WEBP', 'image/webp'),
+    'jpeg': ('JPEG', 'image/jpeg'),
+    'png': ('PNG', 'image/png'),
+}
+
+T = TypeVar('T')
+
+
+def timed(fn: Callable[..., T], args: Tuple) -> Tuple[float, float, T]:
+    """Run fn in a worker, returning when it started and finished"""
+    started = time.time()
+    result = fn(*args)
+    return started, time.time(), result
+
+
+def render_variant(src_path: str, out_path: str, width: Optional[int], height: Optional[int],
+                   fmt: str, quality: int) -> int:
+    """Render a variant to out_path, returning its size. Runs in a worker process"""
+    with Image.open(src_path) as image:
+        image = ImageOps.exif_transpose(image)
+        if width or height:
+            image.thumbnail((width or MAX_DIMENSION, height or MAX_DIMENSION), Image.LANCZOS)
+        if fmt == 'jpeg' and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        elif image.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+            image = image.convert('RGBA')
+        options = {'quality': quality} if fmt != 'png' else {'optimize': True}
+        temp_path = f"{out_path}.{os.getpid()}.tmp"
+        image.save(temp_path, FORMATS[fmt][0], **options)
+    os.replace(temp_path, out_path)
+    return os.path.getsize(out_path)
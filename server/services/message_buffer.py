@@ -0,0 +1,82 @@
+# services/message_buffer.py
+import asyncio
+import traceback
+from typing import Dict, List, Tuple
+
+from services.db_service import db_service
+
+# How long streamed messages may sit in memory before being written
+FLUSH_DELAY_SECONDS = 0.25
+
+
+class MessageWriteBuffer:
+    """
+    Write-behind buffer for messages produced while an agent is streaming.
+
+    Messages are collected per session and written in a single transaction
+    from a background task, so the streaming coroutine never waits on disk.
+    Callers must flush the session when the stream completes or is cancelled;
+    close() flushes everything on server shutdown.
+    """
+
+    def __init__(self, flush_delay: float = FLUSH_DELAY_SECONDS):
+        self.flush_delay = flush_delay
+        self._pending: Dict[str, List[Tuple[str, str]]] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        # Latest background flush per session
+        self._flush_tasks: Dict[str, asyncio.Task] = {}
+
+    def add(self, session_id: str, role: str, message: str):
+        """Queue a message for the session without touching the database"""
+        self._pending.setdefault(session_id, []).append((role, message))
+
+    def schedule_flush(self, session_id: str):
+        """Flush the session's queued messages after the flush delay"""
+        if session_id in self._timers or session_id not in self._pending:
+            return
+        self._timers[session_id] = asyncio.get_running_loop().call_later(
+            self.flush_delay, self._start_background_flush, session_id)
+
+    def _start_background_flush(self, session_id: str):
+        self._timers.pop(session_id, None)
+        task = asyncio.create_task(self._write(session_id))
+        self._flush_tasks[session_id] = task
+
+        def _done(t: asyncio.Task):
+            if self._flush_tasks.get(session_id) is t:
+                self._flush_tasks.pop(session_id, None)
+        task.add_done_callback(_done)
+
+    async def _write(self, session_id: str):
+        # Pop and enqueue without yielding in between, so flushes of one
+        # session reach the database writer in order
+        messages = self._pending.pop(session_id, None)
+        if not messages:
+            return
+        try:
+            await db_service.create_messages(session_id, messages)
+        except Exception as e:
+            print(f"Error saving {len(messages)} messages for session {session_id}: {e}")
+            traceback.print_exc()
+
+    async def flush(self, session_id: str):
+        """Write every queued message of the session and wait until committed"""
+        timer = self._timers.pop(session_id, None)
+        if timer is not None:
+            timer.cancel()
+        in_flight = self._flush_tasks.get(session_id)
+        await self._write(session_id)
+        if in_flight is not None and not in_flight.done():
+            await in_flight
+
+    async def flush_all(self):
+        """Write the queued messages of every session and wait until committed"""
+        for session_id in list({*self._pending, *self._timers, *self._flush_tasks}):
+            await self.flush(session_id)
+
+    async def close(self):
+        """Flush all sessions, used on server shutdown"""
+        await self.flush_all()
+
+
+message_write_buffer = MessageWriteBuffer()
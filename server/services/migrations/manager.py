@@ -3,10 +3,21 @@ import sqlite3
 from services.migrations.v1_initial_schema import V1InitialSchema
 from services.migrations.v2_add_canvases import V2AddCanvases
 from services.migrations.v3_add_comfy_workflow import V3AddComfyWorkflow
+from services.migrations.v4_add_thumbnail_hash import V4AddThumbnailHash
+from services.migrations.v5_add_search_index import V5AddSearchIndex
+from services.migrations.v6_add_canvas_data_hash import V6AddCanvasDataHash
+from services.migrations.v7_add_canvas_ops import V7AddCanvasOps
+from services.migrations.v8_add_storage_dictionaries import V8AddStorageDictionaries
+from services.migrations.v9_enable_incremental_vacuum import V9EnableIncrementalVacuum
+from services.migrations.v10_add_chat_sessions_canvas_id_index import V10AddChatSessionsCanvasIdIndex
+from services.migrations.v11_add_media_store import V11AddMediaStore
+from services.migrations.v12_add_generation_jobs import V12AddGenerationJobs
+from services.migrations.v13_add_generation_cache import V13AddGenerationCache
+from services.migrations.v14_add_provider_uploads import V14AddProviderUploads
 from . import Migration
 
 # Database version
-CURRENT_VERSION = 3
+CURRENT_VERSION = 14
 
 ALL_MIGRATIONS = [
     {
@@ -21,6 +32,50 @@ ALL_MIGRATIONS = [
         'version': 3,
         'migration': V3AddComfyWorkflow,
     },
+    {
+        'version': 4,
+        'migration': V4AddThumbnailHash,
+    },
+    {
+        'version': 5,
+        'migration': V5AddSearchIndex,
+    },
+    {
+        'version': 6,
+        'migration': V6AddCanvasDataHash,
+    },
+    {
+        'version': 7,
+        'migration': V7AddCanvasOps,
+    },
+    {
+        'version': 8,
+        'migration': V8AddStorageDictionaries,
+    },
+    {
+        'version': 9,
+        'migration': V9EnableIncrementalVacuum,
+    },
+    {
+        'version': 10,
+        'migration': V10AddChatSessionsCanvasIdIndex,
+    },
+    {
+        'version': 11,
+        'migration': V11AddMediaStore,
+    },
+    {
+        'version': 12,
+        'migration': V12AddGenerationJobs,
+    },
+    {
+        'version': 13,
+        'migration': V13AddGenerationCache,
+    },
+    {
+        'version': 14,
+        'migration': V14AddProviderUploads,
+    },
 ]
 class MigrationManager:
     def get_migrations_to_apply(self, current_version: int, target_version: int) -> List[Type[Migration]]:
@@ -0,0 +1,16 @@
+from . import Migration
+import sqlite3
+
+
+class V10AddChatSessionsCanvasIdIndex(Migration):
+    version = 10
+    description = "Add index of chat sessions by canvas"
+
+    def up(self, conn: sqlite3.Connection) -> None:
+        # Used by list_sessions(canvas_id) and the cascading canvas delete
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_chat_sessions_canvas_id ON chat_sessions(canvas_id)
+        """)
+
+    def down(self, conn: sqlite3.Connection) -> None:
+        pass
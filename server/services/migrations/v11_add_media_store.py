@@ -0,0 +1,40 @@
+from . import Migration
+import sqlite3
+
+
+class V11AddMediaStore(Migration):
+    version = 11
+    description = "Add content-addressed media store tables"
+
+    def up(self, conn: sqlite3.Connection) -> None:
+        # FILES_DIR/<name> is a hard link to FILES_DIR/blobs/<sha256[:2]>/<sha256>;
+        # files stored before this migration have no alias and are left as they are
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS media_aliases (
+                name TEXT PRIMARY KEY,
+                sha256 TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at TEXT DEFAULT (STRFTIME('%Y-%m-%dT%H:%M:%fZ', 'now'))
+            )
+        """)
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_media_aliases_sha256 ON media_aliases(sha256)
+        """)
+        # Provider output URLs already downloaded, so the same URL is never fetched twice
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS media_sources (
+                url TEXT PRIMARY KEY,
+                sha256 TEXT NOT NULL,
+                mime_type TEXT NOT NULL,
+                width INTEGER NOT NULL,
+                height INTEGER NOT NULL,
+                extension TEXT NOT NULL,
+                created_at TEXT DEFAULT (STRFTIME('%Y-%m-%dT%H:%M:%fZ', 'now'))
+            )
+        """)
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_media_sources_sha256 ON media_sources(sha256)
+        """)
+
+    def down(self, conn: sqlite3.Connection) -> None:
+        pass
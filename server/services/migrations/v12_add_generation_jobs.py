@@ -0,0 +1,35 @@
+from . import Migration
+import sqlite3
+
+
+class V12AddGenerationJobs(Migration):
+    version = 12
+    description = "Add generation jobs queue"
+
+    def up(self, conn: sqlite3.Connection) -> None:
+        # params is the JSON needed to run the job again after a restart
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS generation_jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                provider TEXT NOT NULL,
+                model TEXT NOT NULL,
+                params TEXT NOT NULL,
+                canvas_id TEXT,
+                session_id TEXT,
+                priority INTEGER NOT NULL DEFAULT 0,
+                status TEXT NOT NULL DEFAULT 'queued',
+                result TEXT,
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                created_at TEXT DEFAULT (STRFTIME('%Y-%m-%dT%H:%M:%fZ', 'now')),
+                started_at TEXT,
+                finished_at TEXT
+            )
+        """)
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_generation_jobs_status ON generation_jobs(status, created_at)
+        """)
+
+    def down(self, conn: sqlite3.Connection) -> None:
+        pass
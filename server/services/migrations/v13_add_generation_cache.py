@@ -0,0 +1,26 @@
+from . import Migration
+import sqlite3
+
+
+class V13AddGenerationCache(Migration):
+    version = 13
+    description = "Add generation result cache"
+
+    def up(self, conn: sqlite3.Connection) -> None:
+        # images is a JSON list of the generated files and their media store hashes
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS generation_cache (
+                key TEXT PRIMARY KEY,
+                provider TEXT NOT NULL,
+                model TEXT NOT NULL,
+                images TEXT NOT NULL,
+                created_at TEXT DEFAULT (STRFTIME('%Y-%m-%dT%H:%M:%fZ', 'now')),
+                last_used_at TEXT DEFAULT (STRFTIME('%Y-%m-%dT%H:%M:%fZ', 'now'))
+            )
+        """)
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_generation_cache_last_used_at ON generation_cache(last_used_at)
+        """)
+
+    def down(self, conn: sqlite3.Connection) -> None:
+        pass
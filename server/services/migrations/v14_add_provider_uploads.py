@@ -0,0 +1,23 @@
+from . import Migration
+import sqlite3
+
+
+class V14AddProviderUploads(Migration):
+    version = 14
+    description = "Add provider uploads of reference images"
+
+    def up(self, conn: sqlite3.Connection) -> None:
+        # handle is what the provider accepts in place of the image (e.g. a file URL)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS provider_uploads (
+                provider TEXT NOT NULL,
+                sha256 TEXT NOT NULL,
+                handle TEXT NOT NULL,
+                expires_at TEXT NOT NULL,
+                created_at TEXT DEFAULT (STRFTIME('%Y-%m-%dT%H:%M:%fZ', 'now')),
+                PRIMARY KEY (provider, sha256)
+            )
+        """)
+
+    def down(self, conn: sqlite3.Connection) -> None:
+        pass
@@ -0,0 +1,34 @@
+from . import Migration
+import sqlite3
+from services.thumbnail_store import is_data_url, store_thumbnail
+
+
+class V4AddThumbnailHash(Migration):
+    version = 4
+    description = "Move inline canvas thumbnails to the thumbnail store"
+
+    def up(self, conn: sqlite3.Connection) -> None:
+        cursor = conn.execute("PRAGMA table_info(canvases)")
+        columns = [column[1] for column in cursor.fetchall()]
+
+        if 'thumbnail_hash' not in columns:
+            conn.execute("ALTER TABLE canvases ADD COLUMN thumbnail_hash TEXT")
+
+        # Move existing data URL thumbnails out of the row
+        rows = conn.execute("""
+            SELECT id, thumbnail FROM canvases WHERE thumbnail LIKE 'data:%'
+        """).fetchall()
+        for canvas_id, thumbnail in rows:
+            if not is_data_url(thumbnail):
+                continue
+            try:
+                thumbnail_hash = store_thumbnail(thumbnail)
+            except Exception as e:
+                print(f"Failed to migrate thumbnail of canvas {canvas_id}: {e}")
+                thumbnail_hash = None
+            conn.execute("""
+                UPDATE canvases SET thumbnail = '', thumbnail_hash = ? WHERE id = ?
+            """, (thumbnail_hash, canvas_id))
+
+    def down(self, conn: sqlite3.Connection) -> None:
+        pass
@@ -0,0 +1,37 @@
+from . import Migration
+import sqlite3
+from services.search_service import rebuild_search_index
+
+
+class V5AddSearchIndex(Migration):
+    version = 5
+    description = "Add full-text search index"
+
+    def up(self, conn: sqlite3.Connection) -> None:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS search_docs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                ref_id TEXT NOT NULL,
+                canvas_id TEXT,
+                session_id TEXT
+            )
+        """)
+
+        conn.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_search_docs_kind_ref_id ON search_docs(kind, ref_id)
+        """)
+
+        conn.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+                content,
+                tokenize = 'unicode61 remove_diacritics 2'
+            )
+        """)
+
+        # Index existing messages and canvases
+        rebuild_search_index(conn)
+
+    def down(self, conn: sqlite3.Connection) -> None:
+        conn.execute("DROP TABLE IF EXISTS search_index")
+        conn.execute("DROP TABLE IF EXISTS search_docs")
@@ -0,0 +1,18 @@
+from . import Migration
+import sqlite3
+
+
+class V6AddCanvasDataHash(Migration):
+    version = 6
+    description = "Add canvas content hash"
+
+    def up(self, conn: sqlite3.Connection) -> None:
+        cursor = conn.execute("PRAGMA table_info(canvases)")
+        columns = [column[1] for column in cursor.fetchall()]
+
+        # NULL until the next save; readers hash the stored data on demand
+        if 'data_hash' not in columns:
+            conn.execute("ALTER TABLE canvases ADD COLUMN data_hash TEXT")
+
+    def down(self, conn: sqlite3.Connection) -> None:
+        pass
@@ -0,0 +1,54 @@
+from . import Migration
+import sqlite3
+
+
+class V7AddCanvasOps(Migration):
+    version = 7
+    description = "Add canvas operation log and snapshots"
+
+    def up(self, conn: sqlite3.Connection) -> None:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS canvas_ops (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                canvas_id TEXT NOT NULL,
+                op TEXT NOT NULL,
+                key TEXT,
+                version INTEGER,
+                payload TEXT,
+                created_at TEXT DEFAULT (STRFTIME('%Y-%m-%dT%H:%M:%fZ', 'now'))
+            )
+        """)
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_canvas_ops_canvas_id_id
+            ON canvas_ops(canvas_id, id)
+        """)
+
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS canvas_snapshots (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                canvas_id TEXT NOT NULL,
+                data TEXT,
+                last_op_id INTEGER NOT NULL,
+                created_at TEXT DEFAULT (STRFTIME('%Y-%m-%dT%H:%M:%fZ', 'now'))
+            )
+        """)
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_canvas_snapshots_canvas_id_created_at
+            ON canvas_snapshots(canvas_id, created_at)
+        """)
+
+        cursor = conn.execute("PRAGMA table_info(canvases)")
+        columns = [column[1] for column in cursor.fetchall()]
+
+        # canvases.data becomes the latest snapshot, covering ops up to snapshot_op_id
+        if 'snapshot_op_id' not in columns:
+            conn.execute("ALTER TABLE canvases ADD COLUMN snapshot_op_id INTEGER DEFAULT 0")
+
+        # The current content of existing canvases is the first point of their history
+        conn.execute("""
+            INSERT INTO canvas_snapshots (canvas_id, data, last_op_id, created_at)
+            SELECT id, data, 0, updated_at FROM canvases WHERE data IS NOT NULL
+        """)
+
+    def down(self, conn: sqlite3.Connection) -> None:
+        pass
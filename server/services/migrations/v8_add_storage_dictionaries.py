@@ -0,0 +1,27 @@
+from . import Migration
+import sqlite3
+from services.storage_codec import BUILTIN_DICTIONARY, BUILTIN_DICTIONARY_ID, CODEC_RAW
+
+
+class V8AddStorageDictionaries(Migration):
+    version = 8
+    description = "Add storage compression dictionaries"
+
+    def up(self, conn: sqlite3.Connection) -> None:
+        # Existing TEXT rows stay as they are; compressed BLOBs reference a
+        # dictionary id, so dictionaries are never updated or deleted
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS storage_dictionaries (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                codec INTEGER NOT NULL,
+                data BLOB NOT NULL,
+                created_at TEXT DEFAULT (STRFTIME('%Y-%m-%dT%H:%M:%fZ', 'now'))
+            )
+        """)
+        conn.execute("""
+            INSERT OR IGNORE INTO storage_dictionaries (id, codec, data)
+            VALUES (?, ?, ?)
+        """, (BUILTIN_DICTIONARY_ID, CODEC_RAW, BUILTIN_DICTIONARY))
+
+    def down(self, conn: sqlite3.Connection) -> None:
+        pass
@@ -0,0 +1,23 @@
+from . import Migration
+import sqlite3
+
+
+class V9EnableIncrementalVacuum(Migration):
+    version = 9
+    description = "Enable incremental auto-vacuum"
+
+    def up(self, conn: sqlite3.Connection) -> None:
+        # 2 = INCREMENTAL: free pages are kept until services/db_maintenance.py
+        # releases them with PRAGMA incremental_vacuum
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            return
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        # Switching an existing database needs a full VACUUM, which cannot run
+        # inside the transaction earlier migrations may have opened
+        if conn.in_transaction:
+            conn.commit()
+        print('🧹 Rebuilding database to enable incremental auto-vacuum, this may take a while')
+        conn.execute("VACUUM")
+
+    def down(self, conn: sqlite3.Connection) -> None:
+        pass
@@ -0,0 +1,126 @@
+# services/reference_cache.py
+"""
+Per-provider cache of reference images sent with generations.
+
+Iterative editing sends the same reference image turn after turn. Instead of
+reading and base64-encoding it into every request:
+- providers with an upload API (ImageGenerator.upload_reference) get the
+  file once; the handle they return is stored in provider_uploads by the
+  image's content hash and reused until shortly before it expires
+- other providers get a data URL that is encoded once and kept in memory,
+  least recently used first up to DATA_URL_CACHE_MAX_BYTES
+
+A failed upload falls back to the data URL. Concurrent requests for the same
+upload share it.
+"""
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from mimetypes import guess_type
+from typing import Any, Dict, Optional
+
+import aiofiles
+
+from services.compute_pool import compute_pool
+from services.db_service import db_service
+from services.media_refs import get_file_path
+from services.media_store import media_store
+from utils.single_flight import SingleFlight
+
+DATA_URL_CACHE_MAX_BYTES = 128 * 1024 * 1024
+# Uploads whose expiry the provider does not say are reused for this long
+DEFAULT_UPLOAD_TTL_HOURS = 24
+# Handles this close to expiring are uploaded again
+EXPIRY_MARGIN_MINUTES = 10
+
+
+def format_timestamp(value: datetime) -> str:
+    return value.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+
+
+class ReferenceImageCache:
+    def __init__(self, max_bytes: int = DATA_URL_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._data_urls: "OrderedDict[str, str]" = OrderedDict()
+        self._bytes = 0
+        self._uploads: SingleFlight = SingleFlight()
+        # provider -> counters
+        self._counters: Dict[str, Dict[str, int]] = {}
+
+    async def get(self, provider: str, generator: Any, name: str) -> str:
+        """What to send a provider for the reference image `name` in FILES_DIR"""
+        path = get_file_path(name)
+        sha256 = await media_store.content_hash(name)
+        if path is None or sha256 is None:
+            raise FileNotFoundError(f"Reference image {name} not found")
+        mime_type = guess_type(path)[0] or 'image/png'
+
+        handle = await self._get_upload(provider, generator, sha256, path, mime_type)
+        if handle is not None:
+            return handle
+        return await self._get_data_url(provider, sha256, path, mime_type)
+
+    async def _get_upload(self, provider: str, generator: Any, sha256: str, path: str,
+                          mime_type: str) -> Optional[str]:
+        margin = datetime.now(timezone.utc) + timedelta(minutes=EXPIRY_MARGIN_MINUTES)
+        row = await db_service.get_provider_upload(provider, sha256)
+        if row and row['expires_at'] > format_timestamp(margin):
+            self._count(provider, 'upload_hits')
+            return row['handle']
+
+        async def upload():
+            uploaded = await generator.upload_reference(path, mime_type)
+            if uploaded is None:
+                return None
+            handle, expires_at = uploaded
+            expires_at = expires_at or datetime.now(timezone.utc) + timedelta(hours=DEFAULT_UPLOAD_TTL_HOURS)
+            await db_service.put_provider_upload(provider, sha256, handle, format_timestamp(expires_at))
+            self._count(provider, 'uploads')
+            print(f"📤 Uploaded reference image {sha256[:12]} to {provider}")
+            return handle
+
+        try:
+            handle, _ = await self._uploads.do((provider, sha256), upload)
+        except Exception as e:
+            print(f"Error uploading reference image to {provider}, sending it inline: {e}")
+            self._count(provider, 'upload_errors')
+            return None
+        return handle
+
+    async def _get_data_url(self, provider: str, sha256: str, path: str, mime_type: str) -> str:
+        key = f"{sha256}:{mime_type}"
+        data_url = self._data_urls.get(key)
+        if data_url is not None:
+            self._data_urls.move_to_end(key)
+            self._count(provider, 'data_url_hits')
+            return data_url
+
+        self._count(provider, 'data_url_misses')
+        async with aiofiles.open(path, 'rb') as f:
+            image_data = await f.read()
+        data_url = f"data:{mime_type};base64,{await compute_pool.b64encode(image_data)}"
+        if len(data_url) <= self.max_bytes:
+            self._data_urls[key] = data_url
+            self._bytes += len(data_url)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._data_urls.popitem(last=False)
+                self._bytes -= len(evicted)
+        return data_url
+
+    def _count(self, provider: str, counter: str):
+        counters = self._counters.setdefault(provider, {})
+        counters[counter] = counters.get(counter, 0) + 1
+
+    async def prune(self) -> int:
+        """Forget provider uploads that have expired"""
+        return await db_service.prune_provider_uploads(format_timestamp(datetime.now(timezone.utc)))
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'data_urls': len(self._data_urls),
+            'data_url_bytes': self._bytes,
+            'max_bytes': self.max_bytes,
+            'providers': self._counters,
+        }
+
+
+reference_cache = ReferenceImageCache()
@@ -0,0 +1,232 @@
+# services/search_service.py
+"""
+Full-text search over chat messages, canvas names and canvas text.
+
+Searchable documents live in two tables created by migration v5:
+- search_docs: one row per document, keyed by (kind, ref_id)
+- search_index: an FTS5 table whose rowid is search_docs.id
+
+DatabaseService keeps the index in sync inside the same write job as the row
+it indexes. Run `python -m services.search_service --rebuild` from the server
+directory to rebuild the index of an existing database from scratch.
+"""
+import html
+import json
+import sqlite3
+from typing import Any, Dict, List, Optional
+
+from services.canvas_oplog import load_canvas_sync
+from services.storage_codec import load_dictionaries, storage_codec
+
+KIND_MESSAGE = 'message'
+KIND_CANVAS_NAME = 'canvas_name'
+KIND_CANVAS_TEXT = 'canvas_text'
+
+SNIPPET_TOKENS = 12
+# snippet() wraps matches in these; they become <mark> tags once the text is HTML escaped
+MATCH_START = '\ue000'
+MATCH_END = '\ue001'
+
+SELECT_DOC_SQL = "SELECT id FROM search_docs WHERE kind = ? AND ref_id = ?"
+DELETE_DOC_SQL = "DELETE FROM search_docs WHERE id = ?"
+DELETE_INDEX_SQL = "DELETE FROM search_index WHERE rowid = ?"
+INSERT_DOC_SQL = """
+    INSERT INTO search_docs (kind, ref_id, canvas_id, session_id)
+    VALUES (?, ?, ?, ?)
+"""
+INSERT_INDEX_SQL = "INSERT INTO search_index (rowid, content) VALUES (?, ?)"
+
+SEARCH_SQL = """
+    SELECT d.kind, d.ref_id,
+        COALESCE(d.canvas_id, s.canvas_id) AS canvas_id,
+        d.session_id,
+        c.name AS canvas_name,
+        snippet(search_index, 0, ?, ?, '…', ?) AS snippet,
+        bm25(search_index) AS rank
+    FROM search_index
+    JOIN search_docs d ON d.id = search_index.rowid
+    LEFT JOIN chat_sessions s ON s.id = d.session_id
+    LEFT JOIN canvases c ON c.id = COALESCE(d.canvas_id, s.canvas_id)
+    WHERE search_index MATCH ? {kind_filter}
+    ORDER BY rank
+    LIMIT ? OFFSET ?
+"""
+
+
+def extract_message_text(message: str) -> str:
+    """Text content and image prompts of a stored chat message"""
+    try:
+        msg = json.loads(message)
+    except Exception:
+        return ''
+    if not isinstance(msg, dict):
+        return ''
+
+    parts = []
+    content = msg.get('content')
+    if isinstance(content, str):
+        parts.append(content)
+    elif isinstance(content, list):
+        for item in content:
+            if isinstance(item, dict) and item.get('type') == 'text':
+                parts.append(item.get('text', ''))
+
+    for tool_call in msg.get('tool_calls') or []:
+        arguments = (tool_call.get('function') or {}).get('arguments')
+        try:
+            arguments = json.loads(arguments) if isinstance(arguments, str) else arguments
+        except Exception:
+            continue
+        if isinstance(arguments, dict) and isinstance(arguments.get('prompt'), str):
+            parts.append(arguments['prompt'])
+
+    return '\n'.join(p for p in parts if p)
+
+
+def extract_canvas_text(data: Any) -> str:
+    """Excalidraw text elements and generated image prompts of a canvas"""
+    if not isinstance(data, dict):
+        return ''
+    parts = []
+    for element in data.get('elements') or []:
+        if not isinstance(element, dict) or element.get('isDeleted'):
+            continue
+        if element.get('type') == 'text':
+            parts.append(element.get('originalText') or element.get('text') or '')
+        prompt = (element.get('customData') or {}).get('prompt')
+        if isinstance(prompt, str):
+            parts.append(prompt)
+    return '\n'.join(p for p in parts if p)
+
+
+def build_match_query(query: str) -> str:
+    """
+    Turn free user input into a safe FTS5 query: every term must match and
+    the last term matches as a prefix, so results update while typing.
+    """
+    terms = [t.replace('"', '""') for t in query.split()]
+    if not terms:
+        return ''
+    quoted = [f'"{t}"' for t in terms]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def highlight_snippet(snippet: Optional[str]) -> str:
+    """HTML escape an indexed text snippet, then wrap its matches in <mark>"""
+    text = html.escape(snippet or '')
+    return text.replace(MATCH_START, '<mark>').replace(MATCH_END, '</mark>')
+
+
+def _strip_markers(content: str) -> str:
+    """Drop match marker characters from text to index, so only snippet() emits them"""
+    return content.replace(MATCH_START, '').replace(MATCH_END, '')
+
+
+# ========== index maintenance (aiosqlite, inside DatabaseService write jobs) ==========
+
+async def remove_document(conn, kind: str, ref_id: Any):
+    async with conn.execute(SELECT_DOC_SQL, (kind, str(ref_id))) as cursor:
+        row = await cursor.fetchone()
+    if row:
+        await conn.execute(DELETE_INDEX_SQL, (row[0],))
+        await conn.execute(DELETE_DOC_SQL, (row[0],))
+
+
+async def index_document(conn, kind: str, ref_id: Any, content: str,
+                         canvas_id: Optional[str] = None, session_id: Optional[str] = None):
+    """Insert or replace the indexed content of a document"""
+    await remove_document(conn, kind, ref_id)
+    if not content:
+        return
+    async with conn.execute(INSERT_DOC_SQL, (kind, str(ref_id), canvas_id, session_id)) as cursor:
+        doc_id = cursor.lastrowid
+    await conn.execute(INSERT_INDEX_SQL, (doc_id, _strip_markers(content)))
+
+
+async def append_to_document(conn, kind: str, ref_id: Any, content: str,
+                             canvas_id: Optional[str] = None, session_id: Optional[str] = None):
+    """Append text to a document without re-extracting its source"""
+    async with conn.execute("""
+        SELECT search_index.content FROM search_docs
+        JOIN search_index ON search_index.rowid = search_docs.id
+        WHERE search_docs.kind = ? AND search_docs.ref_id = ?
+    """, (kind, str(ref_id))) as cursor:
+        row = await cursor.fetchone()
+    existing = row[0] if row else ''
+    await index_document(conn, kind, ref_id, f'{existing}\n{content}' if existing else content,
+                         canvas_id=canvas_id, session_id=session_id)
+
+
+async def search(conn, query: str, kind: Optional[str] = None,
+                 limit: int = 20, offset: int = 0) -> List[Dict[str, Any]]:
+    match_query = build_match_query(query)
+    if not match_query:
+        return []
+    params: list = [MATCH_START, MATCH_END, SNIPPET_TOKENS, match_query]
+    kind_filter = ''
+    if kind:
+        kind_filter = 'AND d.kind = ?'
+        params.append(kind)
+    params += [limit, offset]
+    rows = await conn.execute_fetchall(SEARCH_SQL.format(kind_filter=kind_filter), params)
+    results = [dict(row) for row in rows]
+    for result in results:
+        result['snippet'] = highlight_snippet(result['snippet'])
+    return results
+
+
+# ========== rebuild (sqlite3, used by migrations and the CLI) ==========
+
+def _index_document_sync(conn: sqlite3.Connection, kind: str, ref_id: Any, content: str,
+                         canvas_id: Optional[str] = None, session_id: Optional[str] = None):
+    if not content:
+        return
+    cursor = conn.execute(INSERT_DOC_SQL, (kind, str(ref_id), canvas_id, session_id))
+    conn.execute(INSERT_INDEX_SQL, (cursor.lastrowid, _strip_markers(content)))
+
+
+def rebuild_search_index(conn: sqlite3.Connection) -> int:
+    """Re-index every message and canvas. Returns the number of documents"""
+    conn.execute("DELETE FROM search_index")
+    conn.execute("DELETE FROM search_docs")
+
+    for message_id, session_id, message in conn.execute(
+            "SELECT id, session_id, message FROM chat_messages"):
+        _index_document_sync(conn, KIND_MESSAGE, message_id,
+                             extract_message_text(storage_codec.decode(message) or ''), session_id=session_id)
+
+    # The operation log is only there from migration v7 on
+    has_ops = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'canvas_ops'").fetchone()
+    for canvas_id, name, data in conn.execute("SELECT id, name, data FROM canvases").fetchall():
+        _index_document_sync(conn, KIND_CANVAS_NAME, canvas_id, name or '', canvas_id=canvas_id)
+        try:
+            if has_ops:
+                canvas_data = load_canvas_sync(conn, canvas_id)
+            else:
+                canvas_data = json.loads(data) if data else {}
+        except Exception:
+            canvas_data = {}
+        _index_document_sync(conn, KIND_CANVAS_TEXT, canvas_id,
+                             extract_canvas_text(canvas_data), canvas_id=canvas_id)
+
+    return conn.execute("SELECT COUNT(*) FROM search_docs").fetchone()[0]
+
+
+if __name__ == '__main__':
+    import argparse
+    from services.db_service import DB_PATH
+
+    parser = argparse.ArgumentParser(description='Manage the full-text search index')
+    parser.add_argument('--rebuild', action='store_true', help='Rebuild the index from scratch')
+    parser.add_argument('--db', default=DB_PATH, help='Path of the database file')
+    args = parser.parse_args()
+
+    if args.rebuild:
+        with sqlite3.connect(args.db) as conn:
+            storage_codec.configure(None, load_dictionaries(conn))
+            count = rebuild_search_index(conn)
+        print(f'🔍 Rebuilt search index with {count} documents')
+    else:
+        parser.print_help()
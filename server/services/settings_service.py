@@ -34,7 +34,14 @@ app_settings = {}
 # 默认设置配置模板
 # 定义了应用程序的基础配置结构和默认值
 DEFAULT_SETTINGS = {
-    "proxy": "system"  # 代理设置：'' (不使用代理), 'system' (使用系统代理), 或具体的代理URL地址
+    "proxy": "system",  # 代理设置：'' (不使用代理), 'system' (使用系统代理), 或具体的代理URL地址
+    "storage_compression": "",  # 数据库存储压缩：'' (不压缩), 'zlib', 或 'zstd'，重启后生效
+    # 图片生成并发上限：global 为总数，default 为未单独配置的服务商，其余键为服务商名称
+    "generation_concurrency": {"global": 8, "default": 2, "comfyui": 1},
+    # 图片生成结果缓存：相同的服务商、模型、提示词、比例和参考图直接复用上次结果，默认关闭
+    "generation_cache": {"enabled": False, "ttl_hours": 24, "max_entries": 1000},
+    # 媒体处理（编解码、缩放、序列化）的线程池和进程池大小，0 表示按 CPU 核数自动选择，重启后生效
+    "compute_pool": {"threads": 0, "processes": 0}
 }
 
 
@@ -0,0 +1,251 @@
+# services/storage_codec.py
+"""
+Opt-in compression of JSON payloads stored in SQLite.
+
+Chat messages, canvas snapshots and canvas op payloads are written as plain
+TEXT unless the `storage_compression` setting is 'zlib' or 'zstd'. When it is,
+payloads of at least MIN_COMPRESS_SIZE bytes are stored as a BLOB:
+
+    MAGIC (3 bytes) | format version (1) | codec id (1) | dictionary id (2, big endian) | body
+
+TEXT rows are returned as they are, so rows written before compression was
+enabled (or after it was disabled) stay readable. Dictionaries live in the
+storage_dictionaries table created by migration v8; dictionary 1 is the
+built-in sample of excalidraw element and chat message JSON, and
+`python -m services.storage_codec --train` adds one trained on the database's
+own payloads. A dictionary is never changed or deleted once rows use it.
+"""
+import json
+import sqlite3
+import struct
+import threading
+import zlib
+from typing import Dict, List, Optional, Tuple, Union
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MAGIC = b'\x1bLZ'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('>3sBBH')
+
+CODEC_RAW = 0  # dictionary rows only: raw content, usable by every codec
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+CODEC_IDS = {'zlib': CODEC_ZLIB, 'zstd': CODEC_ZSTD}
+
+BUILTIN_DICTIONARY_ID = 1
+MIN_COMPRESS_SIZE = 256
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 3
+# zlib only looks back 32 KB, so a larger preset dictionary is wasted
+ZLIB_MAX_DICTIONARY_SIZE = 32 * 1024
+TRAINED_DICTIONARY_SIZE = 32 * 1024
+
+_SAMPLE_ELEMENTS = [
+    {
+        'id': 'sample-rectangle', 'type': 'rectangle', 'x': 120.5, 'y': 80.25, 'width': 240, 'height': 160,
+        'angle': 0, 'strokeColor': '#1e1e1e', 'backgroundColor': 'transparent', 'fillStyle': 'solid',
+        'strokeWidth': 2, 'strokeStyle': 'solid', 'roughness': 1, 'opacity': 100, 'groupIds': [],
+        'frameId': None, 'roundness': {'type': 3}, 'seed': 1968410350, 'version': 12, 'versionNonce': 361174001,
+        'isDeleted': False, 'boundElements': None, 'updated': 1719830400000, 'link': None, 'locked': False,
+    },
+    {
+        'id': 'sample-text', 'type': 'text', 'x': 140, 'y': 100, 'width': 200, 'height': 25, 'angle': 0,
+        'strokeColor': '#1e1e1e', 'backgroundColor': 'transparent', 'fillStyle': 'solid', 'strokeWidth': 2,
+        'strokeStyle': 'solid', 'roughness': 1, 'opacity': 100, 'groupIds': [], 'frameId': None,
+        'roundness': None, 'seed': 1, 'version': 3, 'versionNonce': 1, 'isDeleted': False,
+        'boundElements': None, 'updated': 1719830400000, 'link': None, 'locked': False, 'text': '',
+        'fontSize': 20, 'fontFamily': 1, 'textAlign': 'left', 'verticalAlign': 'top', 'containerId': None,
+        'originalText': '', 'lineHeight': 1.25, 'baseline': 18,
+    },
+    {
+        'id': 'sample-image', 'type': 'image', 'x': 0, 'y': 0, 'width': 1024, 'height': 1024, 'angle': 0,
+        'fileId': 'im_sample.png', 'strokeColor': '#000000', 'backgroundColor': 'transparent',
+        'fillStyle': 'solid', 'strokeWidth': 1, 'strokeStyle': 'solid', 'roughness': 1, 'opacity': 100,
+        'groupIds': [], 'frameId': None, 'roundness': None, 'seed': 1, 'version': 1, 'versionNonce': 1,
+        'isDeleted': False, 'boundElements': None, 'updated': 1719830400000, 'link': None, 'locked': False,
+        'status': 'saved', 'scale': [1, 1], 'customData': {'prompt': ''},
+    },
+]
+_SAMPLE_FILE = {'mimeType': 'image/png', 'id': 'im_sample.png', 'dataURL': '/api/file/im_sample.png',
+                'created': 1719830400000}
+_SAMPLE_MESSAGES = [
+    {'role': 'user', 'content': [{'type': 'text', 'text': ''}, {'type': 'image_url', 'image_url': {'url': 'data:image/png;base64,'}}]},
+    {'role': 'assistant', 'content': '', 'tool_calls': [{'id': 'call_', 'type': 'function', 'function': {
+        'name': 'generate_image', 'arguments': '{"prompt": "", "aspect_ratio": "1:1"}'}}]},
+    {'role': 'tool', 'tool_call_id': 'call_', 'content': 'image generated successfully ![image_id: im_sample.png](http://localhost:57988/api/file/im_sample.png)'},
+]
+# zlib favours matches near the end of the dictionary, so elements go last
+BUILTIN_DICTIONARY = '\n'.join(
+    [json.dumps(m) for m in _SAMPLE_MESSAGES] + [json.dumps(_SAMPLE_FILE)]
+    + [json.dumps(e) for e in _SAMPLE_ELEMENTS]).encode('utf-8')
+
+StoredValue = Union[str, bytes, None]
+
+
+class StorageCodecError(Exception):
+    pass
+
+
+class StorageCodec:
+    """Encodes payloads for storage with the configured codec and decodes any stored row"""
+
+    def __init__(self):
+        self.codec_id: Optional[int] = None
+        self.dictionary_id = 0
+        self._dictionaries: Dict[int, Tuple[int, bytes]] = {}
+        # zstd (de)compression contexts are not thread-safe
+        self._local = threading.local()
+
+    def configure(self, codec: Optional[str], dictionaries: Dict[int, Tuple[int, bytes]]):
+        """
+        Select the write codec ('zlib', 'zstd' or falsy for plain TEXT) and the
+        known {id: (codec, data)} dictionaries. Writes use the newest
+        dictionary the codec can read.
+        """
+        self._dictionaries = dict(dictionaries)
+        self._local = threading.local()
+        codec_id = CODEC_IDS.get(codec) if codec else None
+        if codec and codec_id is None:
+            print(f"⚠️ Unknown storage_compression '{codec}', storing payloads uncompressed")
+        if codec_id == CODEC_ZSTD and zstandard is None:
+            print("⚠️ storage_compression is 'zstd' but zstandard is not installed, using zlib")
+            codec_id = CODEC_ZLIB
+        self.codec_id = codec_id
+        usable = [i for i, (c, _) in self._dictionaries.items() if c in (CODEC_RAW, codec_id)]
+        self.dictionary_id = max(usable) if codec_id and usable else 0
+
+    def encode(self, text: Optional[str]) -> StoredValue:
+        """Value to store for `text`: a compressed BLOB, or the text itself"""
+        if text is None or self.codec_id is None:
+            return text
+        raw = text.encode('utf-8')
+        if len(raw) < MIN_COMPRESS_SIZE:
+            return text
+        body = self._compress(self.codec_id, self.dictionary_id, raw)
+        if HEADER.size + len(body) >= len(raw):
+            return text
+        return HEADER.pack(MAGIC, FORMAT_VERSION, self.codec_id, self.dictionary_id) + body
+
+    def decode(self, value: StoredValue) -> Optional[str]:
+        """Text of a stored value, whatever codec wrote it"""
+        if value is None or isinstance(value, str):
+            return value
+        value = bytes(value)
+        if not value.startswith(MAGIC):
+            return value.decode('utf-8')
+        _, version, codec_id, dictionary_id = HEADER.unpack_from(value)
+        if version != FORMAT_VERSION:
+            raise StorageCodecError(f'Unsupported storage format version {version}')
+        return self._decompress(codec_id, dictionary_id, value[HEADER.size:]).decode('utf-8')
+
+    def _dictionary(self, dictionary_id: int) -> Optional[bytes]:
+        if not dictionary_id:
+            return None
+        if dictionary_id not in self._dictionaries:
+            raise StorageCodecError(f'Unknown storage dictionary {dictionary_id}')
+        return self._dictionaries[dictionary_id][1]
+
+    def _compress(self, codec_id: int, dictionary_id: int, raw: bytes) -> bytes:
+        dictionary = self._dictionary(dictionary_id)
+        if codec_id == CODEC_ZLIB:
+            if dictionary is None:
+                return zlib.compress(raw, ZLIB_LEVEL)
+            compressor = zlib.compressobj(ZLIB_LEVEL, zdict=dictionary[-ZLIB_MAX_DICTIONARY_SIZE:])
+            return compressor.compress(raw) + compressor.flush()
+        return self._zstd(dictionary_id, compress=True).compress(raw)
+
+    def _decompress(self, codec_id: int, dictionary_id: int, body: bytes) -> bytes:
+        dictionary = self._dictionary(dictionary_id)
+        if codec_id == CODEC_ZLIB:
+            if dictionary is None:
+                return zlib.decompress(body)
+            decompressor = zlib.decompressobj(zdict=dictionary[-ZLIB_MAX_DICTIONARY_SIZE:])
+            return decompressor.decompress(body) + decompressor.flush()
+        if codec_id == CODEC_ZSTD:
+            if zstandard is None:
+                raise StorageCodecError('Row is zstd compressed but zstandard is not installed')
+            return self._zstd(dictionary_id, compress=False).decompress(body)
+        raise StorageCodecError(f'Unknown storage codec {codec_id}')
+
+    def _zstd(self, dictionary_id: int, compress: bool):
+        key = (dictionary_id, compress)
+        contexts = self._local.__dict__.setdefault('zstd', {})
+        if key not in contexts:
+            dictionary = self._dictionary(dictionary_id)
+            dict_data = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+            if compress:
+                contexts[key] = zstandard.ZstdCompressor(level=ZSTD_LEVEL, dict_data=dict_data)
+            else:
+                contexts[key] = zstandard.ZstdDecompressor(dict_data=dict_data)
+        return contexts[key]
+
+
+def load_dictionaries(conn: sqlite3.Connection) -> Dict[int, Tuple[int, bytes]]:
+    return {row[0]: (row[1], bytes(row[2]))
+            for row in conn.execute("SELECT id, codec, data FROM storage_dictionaries")}
+
+
+def train_dictionary(samples: List[bytes], codec_id: int, size: int = TRAINED_DICTIONARY_SIZE) -> Tuple[int, bytes]:
+    """
+    Build a dictionary from sample payloads: a real trained zstd dictionary
+    when zstandard is available and the codec is zstd, otherwise a raw
+    content dictionary of the most frequent samples.
+    """
+    if codec_id == CODEC_ZSTD and zstandard is not None:
+        return CODEC_ZSTD, zstandard.train_dictionary(size, samples).as_bytes()
+
+    counts: Dict[bytes, int] = {}
+    for sample in samples:
+        counts[sample] = counts.get(sample, 0) + 1
+    # Most frequent last, where zlib finds them at the shortest distance
+    ranked = sorted(counts, key=lambda s: (counts[s], -len(s)))
+    content = b''
+    for sample in reversed(ranked):
+        if len(content) + len(sample) + 1 > size:
+            continue
+        content = sample + b'\n' + content
+    return CODEC_RAW, content
+
+
+def _sample_payloads(conn: sqlite3.Connection, limit: int) -> List[bytes]:
+    samples = []
+    for (payload,) in conn.execute("""
+        SELECT payload FROM canvas_ops WHERE payload IS NOT NULL ORDER BY id DESC LIMIT ?
+    """, (limit,)):
+        text = storage_codec.decode(payload)
+        samples.append(text.encode('utf-8'))
+    for (message,) in conn.execute("SELECT message FROM chat_messages ORDER BY id DESC LIMIT ?", (limit,)):
+        text = storage_codec.decode(message)
+        if text:
+            samples.append(text.encode('utf-8'))
+    return samples
+
+
+storage_codec = StorageCodec()
+
+
+if __name__ == '__main__':
+    import argparse
+    from services.db_service import DB_PATH
+
+    parser = argparse.ArgumentParser(description='Manage storage compression dictionaries')
+    parser.add_argument('--train', choices=sorted(CODEC_IDS), help='Train a new dictionary for this codec')
+    parser.add_argument('--samples', type=int, default=2000, help='Recent payloads of each kind to sample')
+    parser.add_argument('--db', default=DB_PATH, help='Path of the database file')
+    args = parser.parse_args()
+
+    if args.train:
+        with sqlite3.connect(args.db) as conn:
+            storage_codec.configure(None, load_dictionaries(conn))
+            samples = _sample_payloads(conn, args.samples)
+            if not samples:
+                parser.exit(1, 'No payloads to train on\n')
+            codec_id, data = train_dictionary(samples, CODEC_IDS[args.train])
+            cursor = conn.execute("INSERT INTO storage_dictionaries (codec, data) VALUES (?, ?)", (codec_id, data))
+        print(f'🗜️ Trained dictionary {cursor.lastrowid} ({len(data)} bytes) from {len(samples)} payloads')
+    else:
+        parser.print_help()
@@ -0,0 +1,128 @@
+# services/test_loop_monitor.py
+"""
+Run from the server directory with `python -m pytest services/test_loop_monitor.py`.
+
+The generation test streams tokens on the event loop while an OpenAI image
+generation runs against a mocked transport that takes a while to answer, the
+way a chat keeps streaming while an image is being generated. The stream must
+never stall and the monitor must see no block. The other tests check that
+the monitor does report a call that blocks the loop.
+"""
+import asyncio
+import base64
+import os
+import tempfile
+import time
+from io import BytesIO
+
+import pytest
+
+# Keep config, database and files of the generation test out of the real user data
+os.environ.setdefault('USER_DATA_DIR', tempfile.mkdtemp(prefix='loop_monitor_test_'))
+
+from services.loop_monitor import BLOCK_THRESHOLD_SECONDS, LoopMonitor  # noqa: E402
+
+TOKEN_INTERVAL_SECONDS = 0.01
+# How long the mocked provider takes to answer
+PROVIDER_LATENCY_SECONDS = 0.5
+
+
+async def stream_tokens(done: asyncio.Event) -> float:
+    """Emit tokens until done is set, returning the longest gap between two tokens"""
+    last = time.monotonic()
+    max_gap = 0.0
+    while not done.is_set():
+        await asyncio.sleep(TOKEN_INTERVAL_SECONDS)
+        now = time.monotonic()
+        max_gap = max(max_gap, now - last)
+        last = now
+    return max_gap
+
+
+def test_generation_does_not_block_streaming(monkeypatch):
+    pytest.importorskip('openai')
+    import httpx
+    from PIL import Image
+
+    from services.config_service import FILES_DIR, config_service
+    from services.db_service import db_service
+    from tools.img_generators.openai import OpenAIGenerator
+    from utils.http_client import HttpClient
+
+    buffer = BytesIO()
+    Image.new('RGB', (512, 512), 'red').save(buffer, 'PNG')
+    image_b64 = base64.b64encode(buffer.getvalue()).decode()
+
+    async def handle(request: httpx.Request) -> httpx.Response:
+        assert request.url.path.endswith('/images/generations')
+        await asyncio.sleep(PROVIDER_LATENCY_SECONDS)
+        return httpx.Response(200, json={'created': 0, 'data': [{'b64_json': image_b64}] * 2})
+
+    os.makedirs(FILES_DIR, exist_ok=True)
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handle))
+    monkeypatch.setattr(HttpClient, 'get_async_client', classmethod(lambda cls, url=None, **kwargs: client))
+    monkeypatch.setitem(config_service.app_config, 'openai', {'api_key': 'test', 'url': ''})
+
+    async def run():
+        await db_service.start()
+        monitor = LoopMonitor()
+        monitor.start()
+        try:
+            done = asyncio.Event()
+            stream = asyncio.create_task(stream_tokens(done))
+            images = await OpenAIGenerator().generate_many('a red square', 'openai/gpt-image-1', count=2)
+            done.set()
+            max_gap = await stream
+        finally:
+            await monitor.stop()
+            await client.aclose()
+            await db_service.close()
+        return images, max_gap, monitor.get_stats()
+
+    images, max_gap, stats = asyncio.run(run())
+
+    assert [image[1:3] for image in images] == [(512, 512), (512, 512)]
+    assert max_gap < BLOCK_THRESHOLD_SECONDS
+    assert stats['blocks'] == 0
+
+
+def test_blocking_call_is_reported():
+    async def run():
+        monitor = LoopMonitor()
+        monitor.start()
+        await asyncio.sleep(0.2)
+        time.sleep(0.6)
+        # Let the watchdog see the loop running again
+        await asyncio.sleep(0.2)
+        await monitor.stop()
+        return monitor.get_stats()
+
+    stats = asyncio.run(run())
+
+    assert stats['blocks'] == 1
+    assert stats['max_block_seconds'] >= 0.6 - 2 * 0.1 - BLOCK_THRESHOLD_SECONDS
+    assert 'test_loop_monitor.py' in stats['recent'][0]['origin']
+    assert ' in run' in stats['recent'][0]['origin']
+
+
+def test_stop_and_restart():
+    async def run():
+        monitor = LoopMonitor(threshold=0.1, interval=0.05)
+        monitor.start()
+        monitor.start()
+        running = monitor.get_stats()['running']
+        await monitor.stop()
+        await monitor.stop()
+        stopped = monitor.get_stats()['running']
+        monitor.start()
+        time.sleep(0.3)
+        await asyncio.sleep(0.1)
+        await monitor.stop()
+        return running, stopped, monitor.get_stats()
+
+    running, stopped, stats = asyncio.run(run())
+
+    assert running is True
+    assert stopped is False
+    assert stats['running'] is False
+    assert stats['blocks'] == 1
@@ -0,0 +1,66 @@
+# services/thumbnail_store.py
+"""
+Content-addressed store for canvas thumbnails.
+
+Inline data URL thumbnails posted by the client are decoded and written once
+to THUMBNAILS_DIR/<sha256>; the canvases row only keeps the hash. Because the
+file name is the content hash, a thumbnail file never changes and can be
+served as immutable. Thumbnails no canvas uses any more, after a new save or
+a deletion, are removed by the media garbage collector.
+"""
+import base64
+import binascii
+import hashlib
+import os
+import re
+from typing import Optional
+
+from services.config_service import USER_DATA_DIR
+
+THUMBNAILS_DIR = os.path.join(USER_DATA_DIR, "thumbnails")
+THUMBNAIL_URL_PREFIX = "/api/canvas/thumbnail/"
+
+_HASH_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+def is_data_url(value: Optional[str]) -> bool:
+    return bool(value) and value.startswith("data:")
+
+
+def decode_data_url(data_url: str) -> bytes:
+    return base64.b64decode(data_url.split(",", 1)[1])
+
+
+def thumbnail_url(thumbnail_hash: str) -> str:
+    return f"{THUMBNAIL_URL_PREFIX}{thumbnail_hash}"
+
+
+def get_thumbnail_path(thumbnail_hash: str) -> Optional[str]:
+    """Path of a stored thumbnail, or None for a malformed hash"""
+    if not _HASH_RE.match(thumbnail_hash):
+        return None
+    return os.path.join(THUMBNAILS_DIR, thumbnail_hash)
+
+
+def store_thumbnail(data_url: str) -> str:
+    """
+    Store a data URL thumbnail and return its hash. The file is only written
+    when no thumbnail with the same content exists yet; an existing one is
+    touched so the garbage collector's grace period starts over. Raises
+    ValueError for a malformed data URL.
+    """
+    try:
+        content = decode_data_url(data_url)
+    except (IndexError, binascii.Error) as e:
+        raise ValueError(f"Malformed thumbnail data URL: {e}") from e
+    thumbnail_hash = hashlib.sha256(content).hexdigest()
+    path = get_thumbnail_path(thumbnail_hash)
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        os.makedirs(THUMBNAILS_DIR, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    return thumbnail_hash
@@ -1,3 +1,7 @@
+import base64
+from email.utils import parsedate_to_datetime
+
+
 def detect_image_type_from_base64(b64_data: str) -> str:
     # Only take the base64 part, not the "data:image/...," prefix
     if b64_data.startswith("data:"):
@@ -6,6 +10,10 @@ def detect_image_type_from_base64(b64_data: str) -> str:
     # Decode just the first few bytes
     prefix_bytes = base64.b64decode(b64_data[:24])  # ~18 bytes is enough
 
+    return detect_image_type_from_bytes(prefix_bytes)
+
+
+def detect_image_type_from_bytes(prefix_bytes: bytes) -> str:
     if prefix_bytes.startswith(b"\xff\xd8\xff"):
         return "image/jpeg"
     elif prefix_bytes.startswith(b"\x89PNG\r\n\x1a\n"):
@@ -16,3 +24,24 @@ def detect_image_type_from_base64(b64_data: str) -> str:
         return "image/webp"
     else:
         return "application/octet-stream"
+
+
+def if_none_match_matches(if_none_match: str, etag: str) -> bool:
+    """Whether an If-None-Match header value matches the given strong ETag"""
+    if not if_none_match or not etag:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    return etag in [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+
+
+def if_modified_since_matches(if_modified_since: str, mtime: float) -> bool:
+    """Whether a resource last modified at mtime is unchanged since an If-Modified-Since date"""
+    if not if_modified_since:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since).timestamp()
+    except (TypeError, ValueError):
+        return False
+    # HTTP dates have whole-second precision
+    return int(mtime) <= since
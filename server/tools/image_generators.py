@@ -1,21 +1,23 @@
 import random
-import base64
 import json
 import time
 import traceback
 import os
-from mimetypes import guess_type
 from typing import Optional, Annotated
 from pydantic import BaseModel, Field
 from langchain_core.tools import tool, InjectedToolCallId
 from langchain_core.runnables import RunnableConfig
-import aiofiles
 from nanoid import generate
 
 from common import DEFAULT_PORT
 from services.config_service import FILES_DIR
 from services.db_service import db_service
+from services.generation_cache import generation_cache
+from services.generation_queue import GenerationJob, generation_queue
+from services.media_store import media_store
+from services.reference_cache import reference_cache
 from services.websocket_service import send_to_websocket, broadcast_session_update
+from utils.single_flight import SingleFlight
 
 # Import all generators
 from .img_generators import (
@@ -27,6 +29,10 @@ from .img_generators import (
     VolcesImageGenerator,
 )
 
+# Most variations one generate_image call produces
+MAX_IMAGE_COUNT = 4
+
+
 # 生成唯一文件 ID
 def generate_file_id():
     return 'im_' + generate(size=8)
@@ -38,9 +44,15 @@ class GenerateImageInputSchema(BaseModel):
     aspect_ratio: str = Field(
         description="Required. Aspect ratio of the image, only these values are allowed: 1:1, 16:9, 4:3, 3:4, 9:16 Choose the best fitting aspect ratio according to the prompt. Best ratio for posters is 3:4")
     input_image: Optional[str] = Field(default=None, description="Optional; Image to use as reference. Pass image_id here, e.g. 'im_jurheut7.png'. Best for image editing cases like: Editing specific parts of the image, Removing specific objects, Maintaining visual elements across scenes (character/object consistency), Generating new content in the style of the reference (style transfer), etc.")
+    count: int = Field(default=1, ge=1, le=MAX_IMAGE_COUNT, description=f"Optional; Number of variations to generate for the prompt, 1 to {MAX_IMAGE_COUNT}. Use more than 1 only when the user asks for several options or variations.")
+    fresh: bool = Field(default=False, description="Optional; Set to true to get a new result for a request that was already generated, e.g. when the user asks to try again or for a different version.")
     tool_call_id: Annotated[str, InjectedToolCallId]
 
 
+# Identical generations running at the same time, keyed by their cache key
+_generations: SingleFlight = SingleFlight()
+
+
 # Initialize provider instances
 PROVIDERS = {
     'replicate': ReplicateGenerator(),
@@ -61,6 +73,8 @@ async def generate_image(
     config: RunnableConfig,
     tool_call_id: Annotated[str, InjectedToolCallId],
     input_image: Optional[str] = None,
+    count: int = 1,
+    fresh: bool = False,
 ) -> str:
     """
     Generate an image using the specified provider.
@@ -71,9 +85,11 @@ async def generate_image(
         config (RunnableConfig): The configuration for the runnable.
         tool_call_id (Annotated[str, InjectedToolCallId]): The ID of the tool call.
         input_image (Optional[str], optional): The input image for reference. Defaults to None.
+        count (int, optional): Number of variations to generate. Defaults to 1.
+        fresh (bool, optional): Skip the generation result cache. Defaults to False.
 
     Returns:
-        str: The ID of the generated image.
+        str: The IDs of the generated images.
     """
     print('🛠️ tool_call_id', tool_call_id)
     ctx = config.get('configurable', {})
@@ -89,125 +105,183 @@ async def generate_image(
     model = image_model.get('model', '')
     provider = image_model.get('provider', 'replicate')
 
+    if provider not in PROVIDERS:
+        raise ValueError(f"Unsupported provider: {provider}")
+
+    try:
+        # Queued with the other generations; runs in run_image_job
+        return await generation_queue.run('image', provider, model, {
+            'prompt': prompt,
+            'aspect_ratio': aspect_ratio,
+            'input_image': input_image,
+            'tool_call_id': tool_call_id,
+            'count': max(1, min(MAX_IMAGE_COUNT, count)),
+            'fresh': fresh,
+        }, canvas_id=canvas_id, session_id=session_id)
+
+    except Exception as e:
+        print(f"Error generating image: {str(e)}")
+        traceback.print_exc()
+        await send_to_websocket(session_id, {
+            'type': 'error',
+            'error': str(e)
+        })
+        return f"image generation failed: {str(e)}"
+
+
+async def run_image_job(job: GenerationJob) -> str:
+    """Generate the images of a queued job and place them on the canvas"""
+    provider = job.provider
+    params = job.params
+    prompt = params['prompt']
+    aspect_ratio = params['aspect_ratio']
+    input_image = params.get('input_image')
+    canvas_id = job.canvas_id
+    session_id = job.session_id
+    ctx = {
+        'canvas_id': canvas_id,
+        'session_id': session_id,
+        'tool_call_id': params.get('tool_call_id'),
+        'job_id': job.id,
+    }
+
     # Get provider instance
     generator = PROVIDERS.get(provider)
     if not generator:
         raise ValueError(f"Unsupported provider: {provider}")
 
-    try:
-        # Prepare input image if provided
-        input_image_data = None
-        if input_image:
-            image_path = os.path.join(FILES_DIR, f'{input_image}')
-
-            if provider == 'openai':
-                # OpenAI needs file path
-                input_image_data = image_path
-            else:
-                # Other providers need base64
-                async with aiofiles.open(image_path, 'rb') as f:
-                    image_data = await f.read()
-                b64 = base64.b64encode(image_data).decode('utf-8')
-                mime_type, _ = guess_type(image_path)
-                if not mime_type:
-                    mime_type = "image/png"
-                input_image_data = f"data:{mime_type};base64,{b64}"
-
-        # Generate image using the appropriate provider
-        extra_kwargs = {}
-        if provider == 'comfyui':
-            extra_kwargs['ctx'] = ctx
-        elif provider == 'wavespeed':
-            extra_kwargs['aspect_ratio'] = aspect_ratio
-
-        mime_type, width, height, filename = await generator.generate(
-            prompt=prompt,
-            model=model,
-            aspect_ratio=aspect_ratio,
-            input_image=input_image_data,
-            **extra_kwargs
-        )
-
+    # Prepare input image if provided
+    input_image_data = None
+    if input_image:
+        image_path = os.path.join(FILES_DIR, f'{input_image}')
+
+        if provider == 'openai':
+            # OpenAI needs file path
+            input_image_data = image_path
+        else:
+            # Other providers take an uploaded file handle, or a base64 data URL
+            input_image_data = await reference_cache.get(provider, generator, input_image)
+
+    # Generate image using the appropriate provider
+    extra_kwargs = {}
+    if provider == 'comfyui':
+        extra_kwargs['ctx'] = ctx
+    elif provider == 'wavespeed':
+        extra_kwargs['aspect_ratio'] = aspect_ratio
+
+    # Everything passed to the generator that changes its output is part of
+    # the cache key; ctx only routes progress updates
+    options = {name: value for name, value in extra_kwargs.items() if name != 'ctx'}
+
+    count = params.get('count', 1)
+    fresh = params.get('fresh', False)
+    key = await generation_cache.make_key(provider, job.model, prompt, aspect_ratio, input_image, count, options=options)
+    images = None
+    if generation_cache.enabled:
+        if fresh:
+            generation_cache.bypass(provider)
+        else:
+            images = await generation_cache.get(key, provider)
+
+    if images is None:
+        async def generate_images():
+            if count > 1:
+                return await generator.generate_many(
+                    prompt=prompt,
+                    model=job.model,
+                    aspect_ratio=aspect_ratio,
+                    input_image=input_image_data,
+                    count=count,
+                    # Stay within the provider slots the queue gave this job
+                    concurrency=generation_queue.job_slots(job),
+                    **extra_kwargs
+                )
+            return [await generator.generate(
+                prompt=prompt,
+                model=job.model,
+                aspect_ratio=aspect_ratio,
+                input_image=input_image_data,
+                **extra_kwargs
+            )]
+
+        shared = False
+        if fresh:
+            images = await generate_images()
+        else:
+            # Identical generations in flight share one provider call
+            images, shared = await _generations.do(key, generate_images)
+        if shared:
+            print('🔗 joined an identical generation in flight for job', job.id)
+            images = await alias_images(images)
+        elif generation_cache.enabled:
+            await generation_cache.put(key, provider, job.model, images)
+
+    items = []
+    for mime_type, width, height, filename in images:
         file_id = generate_file_id()
-        url = f'/api/file/{filename}'
-
         file_data = {
             'mimeType': mime_type,
             'id': file_id,
-            'dataURL': url,
+            'dataURL': f'/api/file/{filename}',
             'created': int(time.time() * 1000),
         }
-
-        new_image_element = await generate_new_image_element(canvas_id, file_id, {
+        new_image_element = generate_new_image_element(file_id, {
             'width': width,
             'height': height,
+            'prompt': prompt,
         })
+        items.append((new_image_element, file_data))
 
-        # update the canvas data, add the new image element
-        canvas_data = await db_service.get_canvas_data(canvas_id)
-        if 'data' not in canvas_data:
-            canvas_data['data'] = {}
-        if 'elements' not in canvas_data['data']:
-            canvas_data['data']['elements'] = []
-        if 'files' not in canvas_data['data']:
-            canvas_data['data']['files'] = {}
-
-        canvas_data['data']['elements'].append(new_image_element)
-        canvas_data['data']['files'][file_id] = file_data
+    # append the new image elements to the canvas in one write, as a grid next to the last image
+    await db_service.append_canvas_elements(canvas_id, items)
 
+    results = []
+    for (new_image_element, file_data), (_, _, _, filename) in zip(items, images):
         image_url = f"http://localhost:{DEFAULT_PORT}/api/file/{filename}"
-
-        # print('🛠️canvas_data', canvas_data)
-
-        await db_service.save_canvas_data(canvas_id, json.dumps(canvas_data['data']))
-
         await broadcast_session_update(session_id, canvas_id, {
             'type': 'image_generated',
             'element': new_image_element,
             'file': file_data,
             'image_url': image_url,
         })
+        results.append(f"![image_id: {filename}]({image_url})")
 
-        return f"image generated successfully ![image_id: {filename}]({image_url})"
+    if len(results) == 1:
+        return f"image generated successfully {results[0]}"
+    missing = f" ({count - len(results)} of {count} failed)" if len(results) < count else ""
+    return f"{len(results)} images generated successfully{missing} " + " ".join(results)
 
-    except Exception as e:
-        print(f"Error generating image: {str(e)}")
-        traceback.print_exc()
-        await send_to_websocket(session_id, {
-            'type': 'error',
-            'error': str(e)
-        })
-        return f"image generation failed: {str(e)}"
 
-print('🛠️', generate_image.args_schema.model_json_schema())
+async def alias_images(images):
+    """The images of another job under new file names, so each job owns its files"""
+    aliased = []
+    for mime_type, width, height, filename in images:
+        new_filename = f"{generate_file_id()}.{filename.rsplit('.', 1)[-1]}"
+        if not await media_store.alias_file(filename, os.path.join(FILES_DIR, new_filename)):
+            raise FileNotFoundError(f"Generated image {filename} is gone")
+        aliased.append((mime_type, width, height, new_filename))
+    return aliased
 
-async def generate_new_image_element(canvas_id: str, fileid: str, image_data: dict):
-    canvas = await db_service.get_canvas_data(canvas_id)
-    canvas_data = canvas.get('data', {})
-    elements = canvas_data.get('elements', [])
-
-    # find the last image element
-    last_x = 0
-    last_y = 0
-    last_width = 0
-    last_height = 0
-    image_elements = [
-        element for element in elements if element.get('type') == 'image']
-    last_image_element = image_elements[-1] if len(
-        image_elements) > 0 else None
-    if last_image_element is not None:
-        last_x = last_image_element.get('x', 0)
-        last_y = last_image_element.get('y', 0)
-        last_width = last_image_element.get('width', 0)
-        last_height = last_image_element.get('height', 0)
-
-    new_x = last_x + last_width + 20
 
+def image_job_slots(job: GenerationJob) -> int:
+    """Providers without a batch parameter get one call per image"""
+    generator = PROVIDERS.get(job.provider)
+    if generator is None or generator.batches_natively:
+        return 1
+    return job.params.get('count', 1)
+
+
+generation_queue.register('image', run_image_job, slots=image_job_slots)
+
+print('🛠️', generate_image.args_schema.model_json_schema())
+
+def generate_new_image_element(fileid: str, image_data: dict):
+    # x/y are filled in by db_service.append_canvas_element
     return {
         'type': 'image',
         'id': fileid,
-        'x': new_x,
-        'y': last_y,
+        'x': 0,
+        'y': 0,
         'width': image_data.get('width', 0),
         'height': image_data.get('height', 0),
         'angle': 0,
@@ -234,4 +308,6 @@ async def generate_new_image_element(canvas_id: str, fileid: str, image_data: di
         'status': 'saved',
         'scale': [1, 1],
         'crop': None,
+        # keeps the prompt searchable from the canvas
+        'customData': {'prompt': image_data.get('prompt', '')},
     }
@@ -1,16 +1,38 @@
 from abc import ABC, abstractmethod
-from typing import Optional, Tuple
-import base64
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlsplit
+import ipaddress
+from typing import List, Optional, Tuple
+import asyncio
+import hashlib
+import os
 from PIL import Image
-from io import BytesIO
 import aiofiles
 from nanoid import generate
 from utils.http_client import HttpClient
+from services.compute_pool import compute_pool
+from services.db_service import db_service
+from services.media_store import media_store
+from utils.single_flight import SingleFlight
+
+# Bytes written per chunk while streaming a download to disk
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+# Leading bytes kept in memory to read the format and dimensions from
+HEADER_PROBE_SIZE = 64 * 1024
+
+# Downloads of a provider URL are reused for this long
+MEDIA_SOURCE_TTL_HOURS = 24
+
+# Concurrent downloads of the same URL share one request
+_downloads: SingleFlight = SingleFlight()
 
 
 class ImageGenerator(ABC):
     """Abstract base class for image generators"""
 
+    # Whether generate_many makes one provider call for all images
+    batches_natively = False
+
     @abstractmethod
     async def generate(
         self,
@@ -35,36 +57,145 @@ class ImageGenerator(ABC):
         """
         pass
 
+    async def upload_reference(self, path: str, mime_type: str) -> Optional[Tuple[str, Optional[datetime]]]:
+        """
+        Upload a reference image through the provider's file API.
+
+        Returns a handle the provider accepts in place of the image data and
+        when it expires, or None for providers without an upload API, which
+        are sent the image as a data URL.
+        """
+        return None
+
+    async def generate_many(
+        self,
+        prompt: str,
+        model: str,
+        aspect_ratio: str = "1:1",
+        input_image: Optional[str] = None,
+        count: int = 1,
+        concurrency: Optional[int] = None,
+        **kwargs
+    ) -> List[Tuple[str, int, int, str]]:
+        """
+        Generate `count` images for the same prompt.
+
+        Providers with a native batch parameter override this (and set
+        batches_natively). By default single image calls run, at most
+        `concurrency` at a time; the images that succeeded are returned, and
+        an error listing every failure is raised only if every call failed.
+        """
+        semaphore = asyncio.Semaphore(concurrency or count)
+
+        async def generate_one():
+            async with semaphore:
+                return await self.generate(prompt, model, aspect_ratio, input_image, **kwargs)
+
+        results = await asyncio.gather(*[generate_one() for _ in range(count)], return_exceptions=True)
+        images = [r for r in results if not isinstance(r, BaseException)]
+        if not images:
+            errors = list(dict.fromkeys(str(r) or type(r).__name__ for r in results))
+            raise Exception(f"All {count} image generations failed: {'; '.join(errors)}") from results[0]
+        return images
+
 
 async def get_image_info_and_save(url, file_path_without_extension, is_b64=False):
     """Shared utility function to download/decode and save image"""
-    if is_b64:
-        image_content = base64.b64decode(url)
-    else:
-        # Fetch the image asynchronously
-        async with HttpClient.create() as client:
-            response = await client.get(url)
-            # Read the image content as bytes
-            image_content = response.content
-    # Open the image
-    image = Image.open(BytesIO(image_content))
-
-    # Get MIME type
-    mime_type = Image.MIME.get(image.format if image.format else 'PNG')
-
-    # Get dimensions
-    width, height = image.size
-
-    # Determine the file extension
-    extension = image.format.lower() if image.format else 'png'
-    file_path = f"{file_path_without_extension}.{extension}"
-
-    # Save the image to a local file with the correct extension asynchronously
-    async with aiofiles.open(file_path, 'wb') as out_file:
-        await out_file.write(image_content)
+    mime_type, width, height, extension, _ = await save_image(url, file_path_without_extension, is_b64)
+    return mime_type, width, height, extension
+
+
+async def save_image(url, file_path_without_extension, is_b64=False) -> Tuple[str, int, int, str, str]:
+    """
+    Download (or decode) an image to `file_path_without_extension` + its extension.
+
+    The body is streamed to a temporary file chunk by chunk, so memory use does
+    not grow with the image size, while its sha256 is computed along the way.
+    Format and dimensions come from the image header only. The file is then
+    handed to the media store, which keeps one blob per distinct content; a
+    URL that is being downloaded by another caller, or a provider URL that was
+    downloaded in the last MEDIA_SOURCE_TTL_HOURS, is linked without fetching
+    it again.
+
+    Returns (mime_type, width, height, extension, sha256)
+    """
+    if not is_b64:
+        remember = is_stable_source(url)
+        since = (datetime.now(timezone.utc) - timedelta(hours=MEDIA_SOURCE_TTL_HOURS)).strftime('%Y-%m-%dT%H:%M:%S')
+        source = await db_service.get_media_source(url, since) if remember else None
+        if source and await media_store.link_blob(
+                source['sha256'], f"{file_path_without_extension}.{source['extension']}"):
+            print('🦄image linked from an earlier download of', url)
+            return source['mime_type'], source['width'], source['height'], source['extension'], source['sha256']
+
+        result, shared = await _downloads.do(url, lambda: _download_image(url, file_path_without_extension,
+                                                                          remember=remember))
+        if shared:
+            mime_type, width, height, extension, sha256 = result
+            if not await media_store.link_blob(sha256, f"{file_path_without_extension}.{extension}"):
+                raise FileNotFoundError(f"Downloaded image of {url} is gone")
+            print('🦄image linked from a concurrent download of', url)
+        return result
+
+    return await _download_image(url, file_path_without_extension, is_b64=True)
+
+
+def is_stable_source(url: str) -> bool:
+    """
+    Whether a URL keeps pointing at the same image, so its download can be
+    reused. Local servers are not: ComfyUI's /view?filename=ComfyUI_00001_.png
+    names are handed out again once its output folder is cleared.
+    """
+    parts = urlsplit(url)
+    host = parts.hostname
+    if parts.scheme not in ('http', 'https') or not host or parts.path.rstrip('/').endswith('/view'):
+        return False
+    if host == 'localhost' or host.endswith('.local'):
+        return False
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return True
+    return address.is_global
+
+
+async def _download_image(url, file_path_without_extension, is_b64=False,
+                          remember=False) -> Tuple[str, int, int, str, str]:
+    temp_path = f"{file_path_without_extension}.{generate(size=6)}.part"
+    digest = hashlib.sha256()
+    head = bytearray()
+    try:
+        async with aiofiles.open(temp_path, 'wb') as out_file:
+            async def write(chunk: bytes):
+                if len(head) < HEADER_PROBE_SIZE:
+                    head.extend(chunk[:HEADER_PROBE_SIZE - len(head)])
+                digest.update(chunk)
+                await out_file.write(chunk)
+
+            if is_b64:
+                await write(await compute_pool.b64decode(url))
+            else:
+                async with HttpClient.create(url) as client:
+                    async with client.stream('GET', url) as response:
+                        response.raise_for_status()
+                        async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                            await write(chunk)
+
+        image_format, width, height = await compute_pool.probe(bytes(head), temp_path)
+        mime_type = Image.MIME.get(image_format or 'PNG')
+        extension = image_format.lower() if image_format else 'png'
+        file_path = f"{file_path_without_extension}.{extension}"
+        sha256 = digest.hexdigest()
+        await media_store.store_file(temp_path, sha256, file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    if remember:
+        await db_service.add_media_source(url, sha256, mime_type, width, height, extension)
     print('🦄image saved to file_path', file_path)
 
-    return mime_type, width, height, extension
+    return mime_type, width, height, extension, sha256
 
 
 def generate_image_id():
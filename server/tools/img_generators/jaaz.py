@@ -2,6 +2,7 @@ from typing import Optional
 import os
 import traceback
 import base64
+import aiofiles
 from .base import ImageGenerator, get_image_info_and_save, generate_image_id
 from services.config_service import config_service, FILES_DIR
 from utils.http_client import HttpClient
@@ -67,7 +68,7 @@ class JaazGenerator(ImageGenerator):
             print(
                 f'🦄 Jaaz image generation request: {url} {prompt[:50]}... with model: {model}')
 
-            async with HttpClient.create() as client:
+            async with HttpClient.create(url) as client:
                 response = await client.post(url, headers=headers, json=data)
                 print('🦄 Jaaz image generation response', response)
                 # Check HTTP status first
@@ -162,8 +163,8 @@ class JaazGenerator(ImageGenerator):
                 else:
                     print('🦄 Jaaz OpenAI image generation input_path is file path')
                     # 如果是文件路径，将图像转换为 base64
-                    with open(input_path, 'rb') as image_file:
-                        image_data = image_file.read()
+                    async with aiofiles.open(input_path, 'rb') as image_file:
+                        image_data = await image_file.read()
                         image_b64 = base64.b64encode(
                             image_data).decode('utf-8')
                         data['input_image'] = image_b64
@@ -172,7 +173,7 @@ class JaazGenerator(ImageGenerator):
             print(
                 f'🦄 Jaaz OpenAI image generation request: {prompt[:50]}... with model: {model}')
 
-            async with HttpClient.create() as client:
+            async with HttpClient.create(url) as client:
                 response = await client.post(url, headers=headers, json=data)
                 if response.status_code != 200:
                     error_msg = f"HTTP {response.status_code}: {response.text}"
@@ -1,14 +1,24 @@
-from typing import Optional
+from typing import List, Optional
+from mimetypes import guess_type
+import asyncio
 import os
 import traceback
+import aiofiles
 from .base import ImageGenerator, get_image_info_and_save, generate_image_id
 from services.config_service import config_service, FILES_DIR
-from openai import OpenAI
+from openai import AsyncOpenAI
+from utils.http_client import HttpClient
+
+DEFAULT_BASE_URL = 'https://api.openai.com/v1'
+# Seconds an image request may take
+IMAGE_REQUEST_TIMEOUT = 300
 
 
 class OpenAIGenerator(ImageGenerator):
     """OpenAI image generator implementation"""
 
+    batches_natively = True
+
     async def generate(
         self,
         prompt: str,
@@ -17,40 +27,59 @@ class OpenAIGenerator(ImageGenerator):
         input_image: Optional[str] = None,
         **kwargs
     ) -> tuple[str, int, int, str]:
+        images = await self.generate_many(prompt, model, aspect_ratio, input_image, **kwargs)
+        return images[0]
+
+    async def generate_many(
+        self,
+        prompt: str,
+        model: str,
+        aspect_ratio: str = "1:1",
+        input_image: Optional[str] = None,
+        count: int = 1,
+        **kwargs
+    ) -> List[tuple[str, int, int, str]]:
+        """All `count` images come from one request (`n`) and are saved in parallel"""
         try:
             api_key = config_service.app_config.get(
                 'openai', {}).get('api_key', '')
             url = config_service.app_config.get('openai', {}).get('url', '')
             model = model.replace('openai/', '')
 
-            client = OpenAI(api_key=api_key, base_url=url)
+            client = AsyncOpenAI(api_key=api_key, base_url=url or None, timeout=IMAGE_REQUEST_TIMEOUT,
+                                 http_client=HttpClient.get_async_client(url or DEFAULT_BASE_URL))
 
             if input_image:
                 # input_image should be the file path for OpenAI
-                with open(input_image, 'rb') as image_file:
-                    result = client.images.edit(
-                        model=model,
-                        image=[image_file],
-                        prompt=prompt,
-                        n=kwargs.get("num_images", 1)
-                    )
+                async with aiofiles.open(input_image, 'rb') as image_file:
+                    image_data = await image_file.read()
+                mime_type = guess_type(input_image)[0] or 'image/png'
+                result = await client.images.edit(
+                    model=model,
+                    image=[(os.path.basename(input_image), image_data, mime_type)],
+                    prompt=prompt,
+                    n=count
+                )
             else:
-                result = client.images.generate(
+                result = await client.images.generate(
                     model=model,
                     prompt=prompt,
-                    n=kwargs.get("num_images", 1),
+                    n=count,
                     size=kwargs.get("size", "auto"),
                 )
 
-            image_b64 = result.data[0].b64_json
-            image_id = generate_image_id()
-            mime_type, width, height, extension = await get_image_info_and_save(
-                image_b64, os.path.join(FILES_DIR, f'{image_id}'), is_b64=True
-            )
-            filename = f'{image_id}.{extension}'
-            return mime_type, width, height, filename
+            return await asyncio.gather(*[save_b64_image(item.b64_json) for item in result.data])
 
         except Exception as e:
             print('Error generating image with OpenAI:', e)
             traceback.print_exc()
             raise e
+
+
+async def save_b64_image(image_b64: str) -> tuple[str, int, int, str]:
+    image_id = generate_image_id()
+    mime_type, width, height, extension = await get_image_info_and_save(
+        image_b64, os.path.join(FILES_DIR, f'{image_id}'), is_b64=True
+    )
+    filename = f'{image_id}.{extension}'
+    return mime_type, width, height, filename
@@ -1,6 +1,8 @@
-from typing import Optional
+from datetime import datetime
+from typing import Optional, Tuple
 import os
 import traceback
+import aiofiles
 from .base import ImageGenerator, get_image_info_and_save, generate_image_id
 from services.config_service import config_service, FILES_DIR
 from utils.http_client import HttpClient
@@ -9,6 +11,27 @@ from utils.http_client import HttpClient
 class ReplicateGenerator(ImageGenerator):
     """Replicate image generator implementation"""
 
+    async def upload_reference(self, path: str, mime_type: str) -> Optional[Tuple[str, Optional[datetime]]]:
+        """Upload through the Replicate files API; predictions accept the file URL as input"""
+        api_key = config_service.app_config.get(
+            'replicate', {}).get('api_key', '')
+        if not api_key:
+            return None
+
+        url = "https://api.replicate.com/v1/files"
+        async with aiofiles.open(path, 'rb') as f:
+            content = await f.read()
+        async with HttpClient.create(url) as client:
+            response = await client.post(url, headers={"Authorization": f"Bearer {api_key}"},
+                                         files={"content": (os.path.basename(path), content, mime_type)})
+        response.raise_for_status()
+        res = response.json()
+        try:
+            expires_at = datetime.fromisoformat(res['expires_at'])
+        except (KeyError, TypeError, ValueError):
+            expires_at = None
+        return res['urls']['get'], expires_at
+
     async def generate(
         self,
         prompt: str,
@@ -41,7 +64,7 @@ class ReplicateGenerator(ImageGenerator):
                 data['input']['input_image'] = input_image
                 model = 'black-forest-labs/flux-kontext-pro'
 
-            async with HttpClient.create() as client:
+            async with HttpClient.create(url) as client:
                 response = await client.post(url, headers=headers, json=data)
                 res = response.json()
 
@@ -3,7 +3,11 @@ import os
 import traceback
 from .base import ImageGenerator, get_image_info_and_save, generate_image_id
 from services.config_service import config_service, FILES_DIR
-from openai import OpenAI, OpenAIError
+from openai import AsyncOpenAI, OpenAIError
+from utils.http_client import HttpClient
+
+# Seconds an image request may take
+IMAGE_REQUEST_TIMEOUT = 300
 
 class VolcesImageGenerator(ImageGenerator):
     """Volceengine image generator implementation"""
@@ -22,7 +26,8 @@ class VolcesImageGenerator(ImageGenerator):
             url = config_service.app_config.get('volces', {}).get('url', '')
             model = model.replace('volces/', '')
 
-            client = OpenAI(api_key=api_key, base_url=url)
+            client = AsyncOpenAI(api_key=api_key, base_url=url, timeout=IMAGE_REQUEST_TIMEOUT,
+                                 http_client=HttpClient.get_async_client(url))
 
             # Process ratio
             w_ratio, h_ratio = map(int, aspect_ratio.split(':'))
@@ -36,7 +41,7 @@ class VolcesImageGenerator(ImageGenerator):
                 # input_image should be the file path for OpenAI
                 raise NotImplementedError("Doubao Image Edit are still in progress.")
             else:
-                result = client.images.generate(
+                result = await client.images.generate(
                     model=model,
                     prompt=prompt,
                     size=kwargs.get("size", f"{width}x{height}"),
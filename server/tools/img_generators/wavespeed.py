@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import List, Optional
 import os
 import asyncio
 import traceback
@@ -10,6 +10,8 @@ from utils.http_client import HttpClient
 class WavespeedGenerator(ImageGenerator):
     """WaveSpeed image generator implementation"""
 
+    batches_natively = True
+
     async def generate(
         self,
         prompt: str,
@@ -18,11 +20,24 @@ class WavespeedGenerator(ImageGenerator):
         input_image: Optional[str] = None,
         **kwargs
     ) -> tuple[str, int, int, str]:
+        images = await self.generate_many(prompt, model, aspect_ratio, input_image, **kwargs)
+        return images[0]
+
+    async def generate_many(
+        self,
+        prompt: str,
+        model: str,
+        aspect_ratio: str = "1:1",
+        input_image: Optional[str] = None,
+        count: int = 1,
+        **kwargs
+    ) -> List[tuple[str, int, int, str]]:
+        """All `count` images come from one task (`num_images`) and are saved in parallel"""
         api_key = config_service.app_config.get(
             'wavespeed', {}).get('api_key', '')
         url = config_service.app_config.get('wavespeed', {}).get('url', '')
 
-        async with HttpClient.create() as client:
+        async with HttpClient.create(url) as client:
             headers = {
                 'Authorization': f'Bearer {api_key}',
                 'Content-Type': 'application/json',
@@ -35,7 +50,7 @@ class WavespeedGenerator(ImageGenerator):
                     "prompt": prompt,
                     "images": [input_image],
                     "guidance_scale": kwargs.get("guidance_scale", 3.5),
-                    "num_images": kwargs.get("num_images", 1),
+                    "num_images": count,
                     "safety_tolerance": str(kwargs.get("safety_tolerance", "2"))
                 }
             else:
@@ -43,7 +58,7 @@ class WavespeedGenerator(ImageGenerator):
                     "enable_base64_output": False,
                     "enable_safety_checker": False,
                     "guidance_scale": kwargs.get("guidance_scale", 3.5),
-                    "num_images": kwargs.get("num_images", 1),
+                    "num_images": count,
                     "num_inference_steps": kwargs.get("num_inference_steps", 28),
                     "prompt": prompt,
                     "seed": -1,
@@ -72,16 +87,19 @@ class WavespeedGenerator(ImageGenerator):
                 status = data.get("status")
 
                 if status in ("succeeded", "completed") and outputs:
-                    image_url = outputs[0]
-                    image_id = generate_image_id()
-                    mime_type, width, height, extension = await get_image_info_and_save(
-                        image_url, os.path.join(FILES_DIR, f'{image_id}')
-                    )
-                    filename = f'{image_id}.{extension}'
-                    return mime_type, width, height, filename
+                    return await asyncio.gather(*[save_output(image_url) for image_url in outputs[:count]])
 
                 if status == "failed":
                     raise Exception(
                         f"WaveSpeed generation failed: {result_data}")
 
             raise Exception("WaveSpeed image generation timeout")
+
+
+async def save_output(image_url: str) -> tuple[str, int, int, str]:
+    image_id = generate_image_id()
+    mime_type, width, height, extension = await get_image_info_and_save(
+        image_url, os.path.join(FILES_DIR, f'{image_id}')
+    )
+    filename = f'{image_id}.{extension}'
+    return mime_type, width, height, filename
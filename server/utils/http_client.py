@@ -3,34 +3,60 @@ HTTP 客户端工厂和管理器
 
 本模块提供了统一的 HTTP 客户端创建和管理功能，基于 httpx 库封装，支持：
 - 自动 SSL 证书验证
-- 连接池管理和超时控制
+- 进程级共享连接池（按目标地址和代理设置复用，避免每次请求重新 DNS/TCP/TLS 握手）
+- 代理设置（settings.json 中的 proxy）变更后自动切换到新的连接池
 - 同步和异步客户端支持
 
 使用指南：
-1. 单次/少量请求：使用 HttpClient.create() 自动管理资源
-   async with HttpClient.create() as client:
-       response = await client.get("https://api.example.com/data")
+1. 普通请求：使用 HttpClient.create() 获取共享的连接池客户端（退出时不会关闭）
+   async with HttpClient.create(url) as client:
+       response = await client.get(url)
+
+2. 长期持有客户端：使用 HttpClient.get_async_client() / get_sync_client()
+   获取共享客户端，不要手动关闭，应用退出时由 HttpClient.close_all() 统一关闭
 
-2. 长期持有客户端：使用 HttpClient.create_async_client() 手动管理
+3. 独立客户端：使用 HttpClient.create_async_client() 手动管理
    client = HttpClient.create_async_client()
    try:
        response = await client.get("https://api.example.com/data")
    finally:
        await client.aclose()
 
-3. 同步请求：使用 HttpClient.create_sync()
+4. 同步请求：使用 HttpClient.create_sync()
    with HttpClient.create_sync() as client:
        response = client.get("https://api.example.com/data")
 """
+import asyncio
 import ssl
+import time
 import certifi
 import httpx
-from typing import Optional, Dict, Any
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List, Tuple, Union
 from contextlib import asynccontextmanager, contextmanager
 import logging
 
 logger = logging.getLogger(__name__)
 
+# 共享连接池的最大数量，超出时淘汰最久未使用的
+MAX_SHARED_CLIENTS = 32
+# 代理变更或被淘汰的客户端延迟关闭，让进行中的请求（最长读取超时 120 秒）完成
+RETIRE_GRACE_SECONDS = 180
+
+PooledClient = Union[httpx.AsyncClient, httpx.Client]
+
+
+class _PoolStats:
+    """共享客户端的使用统计"""
+
+    def __init__(self, origin: str, proxy: str, kind: str):
+        self.origin = origin
+        self.proxy = proxy
+        self.kind = kind
+        self.created_at = time.time()
+        self.last_used_at = self.created_at
+        self.requests = 0
+
 
 class HttpClient:
     """HTTP 客户端工厂和管理器"""
@@ -75,18 +101,172 @@ class HttpClient:
 
         return config
 
+    # ========== 共享连接池 ==========
+
+    _clients: "OrderedDict[Tuple, PooledClient]" = OrderedDict()
+    _stats: Dict[int, _PoolStats] = {}
+    _retired: List[PooledClient] = []
+    _proxy: Optional[str] = None
+
+    @classmethod
+    def _current_proxy(cls) -> str:
+        """当前代理设置，读取 settings_service 的全局缓存，不读文件"""
+        from services import settings_service
+        return settings_service.app_settings.get('proxy', settings_service.DEFAULT_SETTINGS['proxy'])
+
+    @classmethod
+    def _proxy_config(cls, proxy: str) -> Dict[str, Any]:
+        """将代理设置转换为 httpx 参数"""
+        if proxy == '':
+            # 不使用代理，忽略 HTTP(S)_PROXY 环境变量
+            return {'trust_env': False}
+        if proxy == 'system':
+            return {'trust_env': True}
+        return {'proxy': proxy, 'trust_env': False}
+
+    @classmethod
+    def _proxy_label(cls, proxy: Optional[str]) -> Optional[str]:
+        """统计中不暴露代理 URL（可能包含账号密码）"""
+        return proxy if proxy in (None, '', 'system') else 'custom'
+
+    @classmethod
+    def _origin(cls, url: Optional[str]) -> str:
+        if not url:
+            return ''
+        try:
+            u = httpx.URL(url)
+            if not u.host:
+                return ''
+            return f"{u.scheme}://{u.host}:{u.port}" if u.port else f"{u.scheme}://{u.host}"
+        except Exception:
+            return ''
+
+    @classmethod
+    def _get_shared(cls, kind: str, url: Optional[str], kwargs: Dict[str, Any]) -> PooledClient:
+        proxy = cls._current_proxy()
+        if proxy != cls._proxy:
+            if cls._proxy is not None:
+                logger.info(f"Proxy setting changed, refreshing {len(cls._clients)} HTTP connection pools")
+                for key in list(cls._clients):
+                    cls._retire(cls._clients.pop(key))
+            cls._proxy = proxy
+
+        origin = cls._origin(url)
+        key = (kind, origin, proxy, repr(sorted(kwargs.items())))
+        client = cls._clients.get(key)
+        if client is not None and not client.is_closed:
+            cls._clients.move_to_end(key)
+            return client
+
+        stats = _PoolStats(origin, cls._proxy_label(proxy), kind)
+        config = cls._get_client_config(**{**cls._proxy_config(proxy), **kwargs})
+        if kind == 'async':
+            async def on_request(request):
+                stats.requests += 1
+                stats.last_used_at = time.time()
+            client = httpx.AsyncClient(event_hooks={'request': [on_request]}, **config)
+        else:
+            def on_request(request):
+                stats.requests += 1
+                stats.last_used_at = time.time()
+            client = httpx.Client(event_hooks={'request': [on_request]}, **config)
+
+        cls._clients[key] = client
+        cls._stats[id(client)] = stats
+        while len(cls._clients) > MAX_SHARED_CLIENTS:
+            _, oldest = cls._clients.popitem(last=False)
+            cls._retire(oldest)
+        return client
+
+    @classmethod
+    def _retire(cls, client: PooledClient):
+        """不再分配该客户端，等进行中的请求完成后再关闭"""
+        cls._stats.pop(id(client), None)
+        cls._retired.append(client)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # 没有事件循环时留给 close_all() 关闭
+            return
+        loop.call_later(RETIRE_GRACE_SECONDS, lambda: loop.create_task(cls._close(client)))
+
+    @classmethod
+    async def _close(cls, client: PooledClient):
+        if client in cls._retired:
+            cls._retired.remove(client)
+        try:
+            if isinstance(client, httpx.AsyncClient):
+                await client.aclose()
+            else:
+                client.close()
+        except Exception as e:
+            logger.warning(f"Failed to close HTTP client: {e}")
+
+    @classmethod
+    def get_async_client(cls, url: Optional[str] = None, **kwargs) -> httpx.AsyncClient:
+        """
+        获取共享的异步客户端，按 url 的 scheme/host/port、代理设置和 kwargs 复用。
+        不要手动关闭，应用退出时由 close_all() 关闭。
+        """
+        return cls._get_shared('async', url, kwargs)
+
+    @classmethod
+    def get_sync_client(cls, url: Optional[str] = None, **kwargs) -> httpx.Client:
+        """获取共享的同步客户端，规则同 get_async_client()"""
+        return cls._get_shared('sync', url, kwargs)
+
+    @classmethod
+    async def close_all(cls):
+        """关闭所有共享客户端（在应用 lifespan 退出时调用）"""
+        clients = list(cls._clients.values()) + list(cls._retired)
+        cls._clients.clear()
+        cls._stats.clear()
+        for client in clients:
+            await cls._close(client)
+        cls._proxy = None
+
+    @classmethod
+    def get_pool_stats(cls) -> Dict[str, Any]:
+        """共享连接池的使用统计"""
+        pools = []
+        for key, client in cls._clients.items():
+            stats = cls._stats.get(id(client))
+            if stats is None:
+                continue
+            connections = []
+            transports = [client._transport] + [t for t in client._mounts.values() if t is not None]
+            for transport in transports:
+                pool = getattr(transport, '_pool', None)
+                connections += list(getattr(pool, 'connections', []))
+            pools.append({
+                'kind': stats.kind,
+                'origin': stats.origin or '*',
+                'proxy': stats.proxy,
+                'requests': stats.requests,
+                'connections': len(connections),
+                'idle_connections': sum(1 for c in connections if c.is_idle()),
+                'active_connections': sum(1 for c in connections if not c.is_idle() and not c.is_closed()),
+                'created_at': stats.created_at,
+                'last_used_at': stats.last_used_at,
+            })
+        return {
+            'proxy': cls._proxy_label(cls._proxy),
+            'clients': len(cls._clients),
+            'retired_clients': len(cls._retired),
+            'max_clients': MAX_SHARED_CLIENTS,
+            'pools': pools,
+        }
+
     # ========== 工厂方法 ==========
 
     @classmethod
     @asynccontextmanager
     async def create(cls, url: Optional[str] = None, **kwargs):
-        """创建异步客户端上下文管理器"""
-        config = cls._get_client_config(**kwargs)
-        client = httpx.AsyncClient(**config)
-        try:
-            yield client
-        finally:
-            await client.aclose()
+        """
+        获取共享异步客户端的上下文管理器。
+        url 为本次请求的目标地址（用于选择连接池），退出时不关闭客户端。
+        """
+        yield cls.get_async_client(url, **kwargs)
 
     @classmethod
     @contextmanager
@@ -0,0 +1,65 @@
+"""
+单飞（single-flight）请求合并
+
+同一个 key 的调用在进行中时，后到的调用不会重复执行，而是等待同一个任务并共享其结果
+（包括异常）。用于合并并发的相同图片/视频生成和相同 URL 的下载，避免重复的服务商费用和带宽。
+
+使用示例：
+    downloads = SingleFlight()
+    result, shared = await downloads.do(url, lambda: download(url))
+
+shared 为 True 表示结果来自其他调用者发起的任务，调用方需要自行为结果创建独立的文件别名。
+只有当所有等待者都被取消后，共享的任务才会被取消。
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Generic, Hashable, Tuple, TypeVar
+
+T = TypeVar('T')
+
+
+class _Call:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight(Generic[T]):
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        # 发起的任务数和合并到进行中任务的调用数
+        self.started = 0
+        self.shared = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> Tuple[T, bool]:
+        """
+        执行 fn()，或等待相同 key 正在进行的任务
+
+        Returns:
+            (结果, 是否共享了其他调用者的任务)
+        """
+        call = self._calls.get(key)
+        shared = call is not None
+        if call is None:
+            call = _Call(asyncio.ensure_future(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+            self.started += 1
+        else:
+            self.shared += 1
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task), shared
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                call.task.cancel()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {'in_flight': len(self._calls), 'started': self.started, 'shared': self.shared}
+
+    def _forget(self, key: Hashable, call: _Call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        # 所有等待者都已离开时，避免 "exception was never retrieved" 警告
+        if not call.task.cancelled():
+            call.task.exception()